@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Translates many C files to functional code, across a pool of processes.
+
+    python batch.py 'final_inputs/*' --mode both --workers 8
+    python batch.py --manifest files.txt --output translated.txt
+    python batch.py 'final_inputs/*' --fused
+    python batch.py 'final_inputs/*' --render-cache
+
+The files are given as glob patterns and/or a manifest (one path per line),
+their output is written in the order of the patterns and manifest, whatever
+the number of workers.
+"""
+from __future__ import print_function
+import argparse
+import glob
+import multiprocessing
+import os
+import stat
+import sys
+import traceback
+
+import lowering
+from convertc2f import BlockVisitor, RenderCache, default_render_cache, parse_minic, render_store
+from func_ast import ChunkBuffer
+
+
+MODES = ('opt', 'unopt', 'both')
+
+
+def write_file(out, filename, blocks, mode):
+    """
+    Writes the output of one file, rendering its FunctionBlocks straight to
+    out: the filename, then the functional code of each block of the mode.
+    """
+    out.write(filename)
+    for block in blocks:
+        if mode in ('unopt', 'both'):
+            out.write("\nunoptimized function: \n")
+            block.render(False, out)
+        if mode in ('opt', 'both'):
+            out.write("\noptimized function: \n")
+            block.render(True, out)
+        out.write("\n\n")
+    out.write("\n\n")
+
+
+_stored_render_cache = None
+
+
+def stored_render_cache():
+    """
+    The RenderCache of the process keeping the renderings on disk, shared
+    by the processes translating with --render-cache.
+    """
+    global _stored_render_cache
+    if _stored_render_cache is None:
+        _stored_render_cache = RenderCache(store=render_store())
+    return _stored_render_cache
+
+
+def file_blocks(filename, fused, stored=False):
+    """
+    The FunctionBlocks of a file, translated through minic or, with fused,
+    with the fused lowering. With stored, the blocks translated through
+    minic come from the on-disk render cache.
+    """
+    if fused:
+        return lowering.fused_blocks(filename)
+    vs = BlockVisitor(stored_render_cache() if stored else default_render_cache())
+    vs.visit(parse_minic(filename))
+    return vs.blocks
+
+
+def translate_file(job, out=None):
+    """
+    Worker: translates one file. Returns (filename, output, error).
+
+    With out, the output is written to out as it is rendered and output is
+    None. out must be a regular file: on error, it is truncated back to
+    where the output of the file started.
+    """
+    filename, mode, fused, stored = job
+    # the translator prints diagnostics, keep them out of the output
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    start = out.tell() if out is not None else None
+    try:
+        blocks = file_blocks(filename, fused, stored)
+        if out is not None:
+            write_file(out, filename, blocks, mode)
+            return filename, None, None
+
+        buffer = ChunkBuffer()
+        write_file(buffer, filename, blocks, mode)
+        return filename, buffer.getvalue(), None
+    except Exception:
+        if out is not None:
+            out.seek(start)
+            out.truncate()
+        return filename, None, traceback.format_exc()
+    finally:
+        sys.stdout = stdout
+
+
+def is_regular_file(out):
+    try:
+        return stat.S_ISREG(os.fstat(out.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def collect_files(patterns, manifest=None):
+    """
+    The files matched by the glob patterns, each sorted, followed by the
+    files listed in the manifest. Patterns matching nothing are kept as is.
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        files.extend(matches or [pattern])
+
+    if manifest:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    files.append(line)
+    return files
+
+
+def translate_files(files, mode='opt', workers=1, fused=False, out=None, stored=False):
+    """
+    Yields translate_file results in the order of files. With fused, files
+    are translated with the fused lowering instead of through minic. With
+    stored, the renderings are kept in the on-disk render cache.
+
+    With out, a regular file, and a single worker, the outputs are written
+    to out as they are rendered, followed by a newline, instead of being
+    yielded.
+    """
+    jobs = [(filename, mode, fused, stored) for filename in files]
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            result = translate_file(job, out)
+            if out is not None and result[2] is None:
+                out.write("\n")
+            yield result
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        chunksize = max(1, len(jobs) // (workers * 8))
+        for result in pool.imap(translate_file, jobs, chunksize):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def main(argv=None, default_patterns=(), headers=None):
+    """
+    The command line. headers maps files to a line written before their
+    output, for the scripts presenting their tests.
+    """
+    parser = argparse.ArgumentParser(description="Translate C files to functional code.")
+    parser.add_argument('patterns', nargs='*', help="glob patterns of the C files")
+    parser.add_argument('-m', '--manifest', help="file listing the C files, one per line")
+    parser.add_argument('--mode', choices=MODES, default='opt', help="which functional code to write")
+    parser.add_argument('-j', '--workers', type=int, default=multiprocessing.cpu_count(), help="number of processes")
+    parser.add_argument('-o', '--output', help="file to write to, standard output by default")
+    parser.add_argument('--fused', action='store_true', help="lower the C trees to functional code in a single pass")
+    parser.add_argument('--render-cache', action='store_true', help="keep the functional code of the functions on disk, for the next runs")
+    args = parser.parse_args(argv)
+
+    patterns = args.patterns
+    if not patterns and not args.manifest:
+        patterns = list(default_patterns)
+    files = collect_files(patterns, args.manifest)
+    if not files:
+        parser.error("no input files")
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    headers = headers or {}
+    # a single worker renders straight to an output file, without headers
+    stream = out if is_regular_file(out) and not headers else None
+    failed = 0
+    try:
+        for filename, output, error in translate_files(files, args.mode, args.workers, args.fused, stream, args.render_cache):
+            if error is not None:
+                failed += 1
+                sys.stderr.write("%s: translation failed\n%s" % (filename, error))
+                continue
+            if output is not None:
+                if filename in headers:
+                    out.write(headers[filename] + "\n")
+                out.write(output)
+                out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
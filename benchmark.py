@@ -0,0 +1,250 @@
+from __future__ import print_function
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pycparser import parse_file, c_parser
+import minic.c_ast_to_minic as ctoc
+from minic.parse_cache import parse_minic, parse_minic_batch
+import functions
+import convertc2f
+import lowering
+import evaluator
+import python_backend
+
+
+def synthetic_source(statements):
+    """
+    Generates a C function with the given number of statements, mixing the
+    constructs found in the final_inputs corpus (arithmetic, arrays, ifs, loops).
+    """
+    lines = ["int dummy(){", "sum = 0;"]
+    for i in range(statements):
+        kind = i % 4
+        if kind == 0:
+            lines.append("a%d = b%d + c[%d] * 2;" % (i, i, i))
+        elif kind == 1:
+            lines.append("sum += a%d;" % (i - 1))
+        elif kind == 2:
+            lines.append("if (sum < a%d) { mts = sum; } else { mts = mts - 1; }" % (i - 2))
+        else:
+            lines.append("for (i = 0; i < n; i++) { sum = sum + a[i]; }")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def count_nodes(node):
+    """
+    Number of PyCparser nodes in the tree, ie. the number of calls to transform.
+    """
+    count = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        count += 1
+        for _, child in current.children():
+            stack.append(child)
+    return count
+
+
+def time_transform(ast, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        ctoc.transform(ast)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_transform(repeat=5):
+    """
+    Nodes per second of the c_ast to minic_ast conversion, on the final_inputs
+    corpus and on large synthetic files.
+    """
+    print("c_ast -> minic_ast transform")
+
+    files = sorted(glob.glob('./final_inputs/p3_input*'))
+    asts = [parse_file(f) for f in files]
+    nodes = sum(count_nodes(ast) for ast in asts)
+    elapsed = 0.0
+    for _ in range(100):
+        for ast in asts:
+            elapsed += time_transform(ast, 1)
+    print("  final_inputs (%d files x 100): %d nodes/s" % (len(files), nodes * 100 / elapsed))
+
+    parser = c_parser.CParser()
+    for statements in (1000, 10000):
+        ast = parser.parse(synthetic_source(statements))
+        nodes = count_nodes(ast)
+        elapsed = time_transform(ast, repeat)
+        print("  synthetic %d statements (%d nodes): %d nodes/s" % (statements, nodes, nodes / elapsed))
+
+
+def bench_visitor(repeat=5):
+    """
+    Nodes per second of the functions.NodeVisitor analysis on minic trees.
+    """
+    print("functions.NodeVisitor on minic_ast")
+
+    parser = c_parser.CParser()
+    for statements in (1000, 10000):
+        ast = parser.parse(synthetic_source(statements))
+        nodes = count_nodes(ast)
+        minic_ast = ctoc.transform(ast)
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            functions.NodeVisitor().visit(minic_ast)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        print("  synthetic %d statements (%d nodes): %d nodes/s" % (statements, nodes, nodes / best))
+
+
+def bench_batch(repeat=20):
+    """
+    Files per second of the preprocessing and parsing of the final_inputs corpus,
+    one cpp process and parser per file against the batch front end.
+    """
+    print("preprocess + parse + convert, final_inputs")
+
+    files = sorted(glob.glob('./final_inputs/p3_input*')) * repeat
+
+    start = time.time()
+    for f in files:
+        ctoc.transform(parse_file(f, use_cpp=True))
+    print("  parse_file with cpp: %d files/s" % (len(files) / (time.time() - start)))
+
+    start = time.time()
+    parse_minic_batch(files, use_cpp=True, cache=False)
+    print("  parse_minic_batch: %d files/s" % (len(files) / (time.time() - start)))
+
+
+def bench_fused(repeat=5):
+    """
+    Nodes per second of the translation of function bodies to func_ast, through
+    minic (transform, NodeVisitor and transform_ctf) against the fused lowering.
+    The analysis and rendering of the blocks are the same for both and left out.
+    """
+    print("c_ast -> func_ast")
+
+    def through_minic(body):
+        block = ctoc.transform(body)
+        functions.NodeVisitor().visit(block)
+        return [convertc2f.transform_ctf(item) for item in block.block_items]
+
+    def fused(body):
+        nvss = (functions.NodeVisitor(),)
+        return [lowering.lower(item, nvss) for item in body.block_items]
+
+    parser = c_parser.CParser()
+    for statements in (1000, 10000):
+        ast = parser.parse(synthetic_source(statements))
+        body = ast.ext[0].body
+        nodes = count_nodes(body)
+        for name, translate in (("through minic", through_minic), ("fused", fused)):
+            best = None
+            for _ in range(repeat):
+                start = time.time()
+                translate(body)
+                elapsed = time.time() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            print("  %s, synthetic %d statements (%d nodes): %d nodes/s" % (name, statements, nodes, nodes / best))
+
+
+def bench_render_cache(repeat=20):
+    """
+    Files per second of the translation of the final_inputs corpus through
+    minic, every block converted and rendered against the RenderCache.
+    The files are parsed once beforehand.
+    """
+    print("minic -> functional code, final_inputs")
+
+    asts = [parse_minic(f, cache=False) for f in sorted(glob.glob('./final_inputs/p3_input*'))] * repeat
+
+    for name, cache in (("no cache", False), ("RenderCache", convertc2f.RenderCache())):
+        start = time.time()
+        for ast in asts:
+            vs = convertc2f.BlockVisitor(cache)
+            vs.visit(ast)
+            vs.opt_functional_code
+        print("  %s: %d files/s" % (name, len(asts) / (time.time() - start)))
+
+
+def bench_execution(repeat=20):
+    """
+    Calls per second of the function of final_inputs/p3_input4, the
+    mss/mts/mps reductions, run over an array one element per call,
+    through the Evaluator and through the Python backend.
+    """
+    print("running func_ast, final_inputs/p3_input4")
+
+    vs = convertc2f.BlockVisitor(False)
+    vs.visit(parse_minic('./final_inputs/p3_input4', cache=False))
+    function = vs.blocks[0].function
+    a = [3, -5, 4, -1, 2] * 1000
+
+    for name, kernel in (("Evaluator", evaluator.evaluator(function)),
+                         ("python_backend", python_backend.python_function(function))):
+        start = time.time()
+        for _ in range(repeat):
+            total, mps, mts, mss = 0, 0, 0, 0
+            for i in range(len(a)):
+                total, mps, mts, mss = kernel(total, i, a, mps, mts, mss)
+        print("  %s: %d calls/s" % (name, repeat * len(a) / (time.time() - start)))
+
+
+STARTUP_SCRIPTS = {
+    'parse_file': "from convertc2f import *; BlockVisitor().visit(ctoc.transform(parse_file(%r)))",
+    'parse_minic': "from convertc2f import *; BlockVisitor().visit(parse_minic(%r))",
+}
+
+
+def time_process(code, env):
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', code], env=env, stdout=open(os.devnull, 'w'))
+    return time.time() - start
+
+
+def bench_startup(repeat=5):
+    """
+    Wall time of a whole process translating one file: a fresh parser every
+    time, against the shared parser with a cold and then a warm parse cache.
+    """
+    print("single file translation, whole process")
+
+    filename = './final_inputs/p3_input4'
+    env = dict(os.environ)
+    env['MINIC_CACHE_DIR'] = tempfile.mkdtemp()
+    try:
+        # the interpreter alone, to subtract
+        python = min(time_process("pass", env) for _ in range(repeat))
+        print("  python startup: %d ms" % (python * 1000))
+
+        fresh = min(time_process(STARTUP_SCRIPTS['parse_file'] % filename, env) for _ in range(repeat))
+        print("  parse_file: %d ms" % ((fresh - python) * 1000))
+
+        cold = time_process(STARTUP_SCRIPTS['parse_minic'] % filename, env)
+        print("  parse_minic, cold cache: %d ms" % ((cold - python) * 1000))
+
+        warm = min(time_process(STARTUP_SCRIPTS['parse_minic'] % filename, env) for _ in range(repeat))
+        print("  parse_minic, warm cache: %d ms" % ((warm - python) * 1000))
+    finally:
+        shutil.rmtree(env['MINIC_CACHE_DIR'])
+
+
+if __name__ == "__main__":
+    bench_transform()
+    bench_visitor()
+    bench_batch()
+    bench_fused()
+    bench_render_cache()
+    bench_execution()
+    bench_startup()
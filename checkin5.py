@@ -2,8 +2,7 @@ from convertc2f import *
 
 
 def test_file(filename):
-	ast = parse_file(filename)
-	minic_ast = ctoc.transform(ast)
+	minic_ast = parse_minic(filename)
 	vs = BlockVisitor()
 	vs.visit(minic_ast)
 
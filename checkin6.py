@@ -1,34 +1,17 @@
-from convertc2f import *
+import sys
+import batch
 
 
-def test_file(filename, opt=True):
-	ast = parse_file(filename)
-	minic_ast = ctoc.transform(ast)
-	vs = BlockVisitor()
-	vs.visit(minic_ast)
-
-	for i in range(len(vs.functional_code)):
-
-		if opt:
-			print("optimized function: ")
-			print(vs.opt_functional_code[i])
-		else:
-			print("unoptimized function: ")
-			print(vs.functional_code[i])
-		print("\n")
+# the loop tests, each printed under its header
+TESTS = [
+	("Simple Forloop Test", './project3inputs/forloop_tests/test1'),
+	("Simple Whileloop Test", './project3inputs/forloop_tests/test2'),
+	("Double Loop Test", './project3inputs/forloop_tests/test3'),
+]
 
 
 if __name__ == "__main__":
-	opt = True
-	a = raw_input("type y for optimized code, n for unoptimized\n")
-	if a == "n":
-		opt = False
-
-	print("Simple Forloop Test")
-	test_file('./project3inputs/forloop_tests/test1', opt)
-
-	print("Simple Whileloop Test")
-	test_file('./project3inputs/forloop_tests/test2', opt)
-
-	print("Double Loop Test")
-	test_file('./project3inputs/forloop_tests/test3', opt)
+	# python checkin6.py [--mode opt|unopt|both] [-j WORKERS] [FILES...]
+	sys.exit(batch.main(
+		default_patterns=[filename for _, filename in TESTS],
+		headers=dict((filename, header) for header, filename in TESTS)))
@@ -1,10 +1,16 @@
+from collections import OrderedDict
+import hashlib
+import os
 from pycparser import parse_file, c_ast
 import functions
 from functions import *
 import minic.c_ast_to_minic as ctoc
+from minic.parse_cache import DEFAULT_CACHE_DIR, ParseCache, parse_minic, read_source, shared_parser
 import minic.minic_ast as mc
 import func_ast as fast
 from minic.mutils import lmap
+import ssa
+from ssa import SSAFunction
 #TODO: CLEAN UP IMPORTS
 
 
@@ -35,165 +41,511 @@ def v(orig):
         print("Unexpected type for value %r" % orig)
         raise TypeError
 
-def tmap(x):
+def tmap(x, ctx=None):
     if isinstance(x, list):
-        return lmap(transform_ctf, x)
+        return [transform_ctf(i, ctx) for i in x]
     elif not x:
         return None
     else:
-        return transform_ctf(x)
+        return transform_ctf(x, ctx)
 # HELPER FUNCTIONS COPIED FROM c_ast_to_minic.py
 
-def handle_if_statements(orig, optimize_vars=None):
+
+class TranslationContext(object):
+    """
+    State of the translation of one block, carried explicitly through transform_ctf
+    instead of closures so that different blocks can be translated at the same time.
+    """
+    __slots__ = ('var_order', 'never_used', 'var_constants', 'facts', 'ssa')
+
+    def __init__(self, var_order=None, never_used=None, var_constants=None, facts=None, ssa=None):
+        self.var_order = var_order
+        self.never_used = never_used
+        self.var_constants = var_constants
+        # statement -> NodeVisitor, see functions.collect_facts
+        self.facts = facts
+        # the ssa.SSAFunction of the block
+        self.ssa = ssa
+
+
+def visit_facts(node, ctx=None, symbols=None):
+    """
+    The NodeVisitor that visited node, from the facts of the context when
+    it has them, else node is visited now with the given symbols.
+    """
+    if ctx is not None and ctx.facts is not None:
+        nvs = ctx.facts.get(node)
+        if nvs is not None:
+            return nvs
+    nvs = NodeVisitor(symbols)
+    nvs.visit(node)
+    return nvs
+
+
+def ssa_of(node, ctx=None, symbols=None):
+    """
+    The SSAFunction node is in: the one of the context when it has one,
+    else the SSA form of node alone with the given symbols.
+    """
+    if ctx is not None and ctx.ssa is not None:
+        return ctx.ssa
+    return SSAFunction(node, symbols)
+
+
+class Nothing(object):
+    """
+    Stands for a child that tmap skips, it translates to None
+    without being reported as unsupported.
+    """
+    __slots__ = ()
+
+NOTHING = Nothing()
+
+def tm(x):
+    """
+    The child to translate in place of tmap(x)
+    """
+    if isinstance(x, list) or x:
+        return x
+    return NOTHING
+
+
+def composite(children, build):
+    """
+    Handler of a node with children: children(orig) are translated first, then
+    build(orig, ctx, *translated_children) makes the functional node.
+    transform_ctf evaluates these handlers with an explicit stack, the handler can
+    also be called directly and then translates the children recursively.
+    """
+    def handler(orig, ctx=None):
+        return build(orig, ctx, *[transform_ctf(child, ctx) for child in children(orig)])
+    handler.children = children
+    handler.build = build
+    return handler
+
+
+def if_arguments(if_nvs, else_nvs=None):
+    """
+    The input and output variables of an if statement, from the NodeVisitors
+    of its blocks.
+    """
+    symbols = if_nvs.symbols
+    in_bits, out_bits = if_nvs.variable_bits, if_nvs.written_bits
+
+    if else_nvs is not None:
+        # add else block variable to combined if else block variables
+        else_in_bits, else_out_bits = else_nvs.bits(symbols)
+        in_bits |= else_in_bits
+        out_bits |= else_out_bits
+
+    return symbols.names(in_bits), symbols.names(out_bits)
+
+
+def handle_if_statements(orig, ctx, cond, iftrue, iffalse=None):
 
     # get original if blocks
     if_block = orig.iftrue
     else_block = orig.iffalse
 
     # go through the blocks getting all variables used
-    nvs = NodeVisitor()
-    nvs.visit(if_block)
-    input_args1, output_args1 = get_vars_and_written(nvs)
+    nvs = visit_facts(if_block, ctx)
 
     # create the else block
     if else_block:
-        nvs = NodeVisitor()
-        nvs.visit(else_block)
-        input_args2, output_args2 = get_vars_and_written(nvs)
-
-        # add else block variable to combined if else block variables
-        in_args = list(set(input_args1 + input_args2))
-        out_args = list(set(output_args1 + output_args2))
-        else_obj = transform_ctf(orig.iffalse, optimize_vars)
+        else_nvs = visit_facts(else_block, ctx, nvs.symbols)
+        else_obj = iffalse
 
     else:
         # no else block, set it to none
-        in_args = input_args1
-        out_args = output_args1
+        else_nvs = None
         else_obj = None
 
+    in_args, _ = if_arguments(nvs, else_nvs)
+
+    # the if returns the variables with a phi where its branches join
+    out_args = ssa_of(orig, ctx, nvs.symbols).join_variables(orig)
+
     return fast.If(
-        transform_ctf(orig.cond),
-        transform_ctf(orig.iftrue, optimize_vars),
+        cond,
+        iftrue,
         else_obj,
         in_args,
         out_args,
     )
 
-def handle_tern_statements(orig, optimize_vars=None):
+def handle_tern_statements(orig, ctx, cond, iftrue, iffalse):
 
     return fast.If(
-        transform_ctf(orig.cond),
-        transform_ctf(orig.iftrue, optimize_vars),
-        transform_ctf(orig.iffalse, optimize_vars),
+        cond,
+        iftrue,
+        iffalse,
         None,
         None,
         tern=True,
     )
 
 
-def handle_loop_statements(orig):
+def loop_arguments(counter, variables):
+    """
+    The arguments of the recursive function of a loop: its counter if it
+    has one, then the other variables the loop carries.
+    """
+    input_args = []
+    if counter is not None:
+        input_args.append(str(counter))
+
+    for key in variables:
+        if key != counter:
+            input_args.append(str(key))
+    return input_args
+
+
+def handle_loop_statements(orig, ctx, init_obj, cond, next, stmt):
 
     # transverse through the loop block
     block = orig.stmt
-    nvs = NodeVisitor()
-    nvs.visit(block)
-    input_args = []
+    nvs = visit_facts(block, ctx)
 
     init = orig.init
-    i = "i"
+    i = None
 
     # get initilizer variable
     if isinstance(init, mc.Assignment):
         i = init.lvalue.name
-        input_args.append(str(i))
     elif isinstance(init, mc.DeclList):
         i = init.decls[0].name
-        input_args.append(str(i))
 
-    for key in nvs.assignment:
-        input_args.append(str(key))
+    # the loop carries the variables with a phi at its header
+    variables = ssa_of(orig, ctx, nvs.symbols).loop_variables(orig)
 
     return fast.LetRec(
-        transform_ctf(orig.init),
-        input_args,
-        transform_ctf(orig.cond),
-        transform_ctf(orig.next),
-        transform_ctf(orig.stmt),
+        init_obj,
+        loop_arguments(i, variables),
+        cond,
+        next,
+        stmt,
         coord=orig.coord
     )
 
-def handle_while_statements(orig):
+def handle_while_statements(orig, ctx, cond, stmt):
 
     block = orig.stmt
-    nvs = NodeVisitor()
-    nvs.visit(block)
-
-    # get relevent loop vars
-    input_args = []
-    for key in nvs.assignment:
-        input_args.append(str(key))
+    nvs = visit_facts(block, ctx)
+    variables = ssa_of(orig, ctx, nvs.symbols).loop_variables(orig)
 
     return fast.LetRec(
         None,
-        input_args,
-        transform_ctf(orig.cond),
+        loop_arguments(None, variables),
+        cond,
         None,
-        transform_ctf(orig.stmt),
+        stmt,
         coord=orig.coord,
     )
 
-def transform_ctf(x, optimize_vars=None):
+
+# Handlers from minic to our function representation, one per minic node class.
+# Every handler receives the node and the TranslationContext of the block.
+# The table is built once, use register to add or replace the handler of a node class.
+ctf_transformers = {
+    # constant ... = 5;
+    mc.Constant: (lambda orig, ctx: fast.Constant(v(orig.value), coord=orig.coord)),
+    # ... = x;
+    mc.ID: (lambda orig, ctx: fast.ID(v(orig.name))),
+    # ... = (left) op (right)
+    mc.BinaryOp: composite(
+        lambda orig: (orig.left, orig.right),
+        lambda orig, ctx, left, right: fast.BinaryOp(v(orig.op), left, right, coord=orig.coord)),
+    # ... = array[...];
+    mc.ArrayRef: composite(
+        lambda orig: (orig.name, orig.subscript),
+        lambda orig, ctx, name, subscript: fast.ArrayRef(name, subscript)),
+    # ... = foo(...);
+    mc.FuncCall: composite(
+        lambda orig: (orig.name, tm(orig.args)),
+        lambda orig, ctx, name, args: fast.FuncCall(name, args)),
+    mc.UnaryOp: composite(
+        lambda orig: (orig.op, tm(orig.expr)),
+        lambda orig, ctx, op, expr: fast.UnaryOp(op, expr)),
+
+    mc.If: composite(
+        lambda orig: (orig.cond, orig.iftrue, orig.iffalse) if orig.iffalse else (orig.cond, orig.iftrue),
+        handle_if_statements),
+    mc.TernaryOp: composite(
+        lambda orig: (orig.cond, orig.iftrue, orig.iffalse),
+        handle_tern_statements),
+
+    mc.Block: composite(
+        lambda orig: (tm(orig.block_items),),
+        lambda orig, ctx, block_items: fast.Block(block_items, coord=orig.coord)),
+
+    # int x = ...
+    mc.Decl: composite(
+        lambda orig: (orig.name, orig.init),
+        lambda orig, ctx, name, init: fast.Let(name, init, coord=orig.coord)),
+    # x = ...
+    mc.Assignment: composite(
+        lambda orig: (orig.lvalue, orig.rvalue),
+        lambda orig, ctx, lvalue, rvalue: fast.Let(lvalue, rvalue, coord=orig.coord)),
+    # int a[] = {1,2,3,...}
+    mc.InitList: composite(
+        lambda orig: (tm(orig.exprs),),
+        lambda orig, ctx, exprs: fast.ExprList(exprs)),
+
+    # (...)
+    mc.ExprList: composite(
+        lambda orig: (tm(orig.exprs),),
+        lambda orig, ctx, exprs: fast.ExprList(exprs)),
+
+    mc.For: composite(
+        lambda orig: (orig.init, orig.cond, orig.next, orig.stmt),
+        handle_loop_statements),
+    mc.While: composite(
+        lambda orig: (orig.cond, orig.stmt),
+        handle_while_statements),
+
+    Nothing: (lambda orig, ctx: None),
+    str: (lambda orig, ctx: orig),
+    int: (lambda orig, ctx: orig),
+    float: (lambda orig, ctx: orig),
+    list: composite(
+        lambda orig: orig,
+        lambda orig, ctx, *items: list(items)),
+}
+
+
+def register(cls, handler):
+    """
+    Registers handler(node, ctx) as the translation of the minic nodes of class cls.
+    Use composite for nodes with children so that they are translated without recursion.
+    """
+    ctf_transformers[cls] = handler
+
+
+def transform_ctf(x, ctx=None):
     """
     Transform function from minic to our function representation
+
+    The tree is translated bottom-up with an explicit stack: translated children
+    are pushed on results in order, and a (node, handler, number of children)
+    tuple on the stack marks a node whose children are translated.
+    """
+    results = []
+    stack = [x]
+    while stack:
+        orig = stack.pop()
+        if orig.__class__ is tuple:
+            orig, handler, count = orig
+            if count:
+                children = results[-count:]
+                del results[-count:]
+                results.append(handler.build(orig, ctx, *children))
+            else:
+                results.append(handler.build(orig, ctx))
+            continue
+
+        handler = ctf_transformers.get(orig.__class__)
+        if handler is None:
+            results.append(unsupported(orig))
+            continue
+        try:
+            children_of = handler.children
+        except AttributeError:
+            results.append(handler(orig, ctx))
+            continue
+
+        children = children_of(orig)
+        stack.append((orig, handler, len(children)))
+        stack.extend(children[::-1])
+    return results[0]
+
+
+class FunctionBlock(object):
+    """
+    A block converted to func_ast: its functionDef and the TranslationContext
+    to render it with.
+    """
+    __slots__ = ('function', 'ctx', 'renderings')
+
+    def __init__(self, function, ctx):
+        self.function = function
+        self.ctx = ctx
+        # opt_on -> functional code
+        self.renderings = {}
+
+    def render(self, opt_on, out=None):
+        """
+        The functional code of the block, or with out, writes it to out, a
+        file-like object, as it is rendered. Each call renders with its own
+        EmitContext, blocks can be rendered by several threads at once.
+        """
+        ctx = fast.EmitContext(opt_on, self.ctx.never_used, self.ctx.var_constants)
+        if out is None:
+            return self.function.render(ctx)
+        self.function.emit(out, ctx)
+
+    def code(self, opt_on):
+        """
+        The functional code of the block, rendered the first time it is
+        asked for
+        """
+        try:
+            return self.renderings[opt_on]
+        except KeyError:
+            code = self.renderings[opt_on] = self.render(opt_on)
+            return code
+
+
+class StoredBlock(object):
+    """
+    A block whose functional code is kept in the on-disk store of a
+    RenderCache. It is only converted, and its code rendered, when the
+    store does not have the rendering asked for.
     """
-    return {
-        # constant ... = 5;
-        mc.Constant: (lambda orig: fast.Constant(v(orig.value), coord=orig.coord)),
-        # ... = x;
-        mc.ID: (lambda orig: fast.ID(v(orig.name))),
-        # ... = (left) op (right)
-        mc.BinaryOp: (lambda orig: fast.BinaryOp(v(orig.op), transform_ctf(orig.left), transform_ctf(orig.right), coord=orig.coord)),
-        # ... = array[...];
-        mc.ArrayRef: (lambda orig: fast.ArrayRef(transform_ctf(orig.name), transform_ctf(orig.subscript))),
-        # ... = foo(...);
-        mc.FuncCall: (lambda orig: fast.FuncCall(transform_ctf(orig.name), tmap(orig.args))),
-        mc.UnaryOp: (lambda orig: fast.UnaryOp(transform_ctf(orig.op), tmap(orig.expr))),
-        #mc.If: (lambda orig: fast.If(transform_ctf(orig.cond), transform_ctf(orig.iftrue), transform_ctf(orig.iffalse))),
+    __slots__ = ('node', 'key', 'store', 'converted', 'renderings')
 
-        mc.If: (lambda orig: handle_if_statements(orig, optimize_vars)),
-        mc.TernaryOp: (lambda orig: handle_tern_statements(orig, optimize_vars)),
+    def __init__(self, node, key, store):
+        self.node = node
+        self.key = key
+        self.store = store
+        self.converted = None
+        self.renderings = store.get(key) or {}
 
+    @property
+    def function(self):
+        return self.block().function
 
-        mc.Block: (lambda orig: fast.Block(lmap(transform_ctf, orig.block_items), optimize_vars)),
+    @property
+    def ctx(self):
+        return self.block().ctx
 
-        # int x = ...
-        mc.Decl: (lambda orig: fast.Let(transform_ctf(orig.name), transform_ctf(orig.init), coord=orig.coord)),
-        # x = ...
-        mc.Assignment: (lambda orig: fast.Let(transform_ctf(orig.lvalue), transform_ctf(orig.rvalue), coord=orig.coord)),
-        # int a[] = {1,2,3,...}
-        mc.InitList: (lambda orig: fast.ExprList(tmap(orig.exprs))),
+    def block(self):
+        """
+        The FunctionBlock of the block, converted on first use
+        """
+        if self.converted is None:
+            self.converted = convert_block(self.node)
+        return self.converted
+
+    def render(self, opt_on, out=None):
+        code = self.code(opt_on)
+        if out is None:
+            return code
+        out.write(code)
+
+    def code(self, opt_on):
+        try:
+            return self.renderings[opt_on]
+        except KeyError:
+            code = self.renderings[opt_on] = self.block().code(opt_on)
+            self.store.put(self.key, dict(self.renderings))
+            return code
 
-        # (...)
-        mc.ExprList: (lambda orig: fast.ExprList(tmap(orig.exprs))),
 
-        mc.For: (lambda orig: handle_loop_statements(orig)),
-        mc.While: (lambda orig: handle_while_statements(orig)),
+# Bump to invalidate every stored rendering when the translation changes
+# in a way the hash of the translator sources cannot see.
+RENDER_FORMAT = 1
 
+DEFAULT_MAX_BLOCKS = 1024
 
-        str: (lambda orig: orig),
-        int: (lambda orig: orig),
-        float: (lambda orig: orig),
-        list: (lambda orig: tmap(orig)),
-        None: None,
-    }.get(x.__class__, lambda y: unsupported(y))(x)
+_render_version = None
+
+
+def render_version():
+    """
+    Identifies the translation from minic to functional code: the format of
+    the stored renderings and the sources of the translation.
+    """
+    global _render_version
+    if _render_version is None:
+        digest = hashlib.sha1(('%d' % RENDER_FORMAT).encode('utf-8'))
+        # this module, and the ones the translation goes through
+        for filename in (__file__, functions.__file__, fast.__file__, mc.__file__, ssa.__file__):
+            source = os.path.splitext(filename)[0] + '.py'
+            with open(source, 'rb') as f:
+                digest.update(f.read())
+        _render_version = digest.hexdigest()
+    return _render_version
+
+
+class RenderCache(object):
+    """
+    The blocks translated so far, by structural hash of their minic Block:
+    copies of a block are analyzed, converted and rendered once. Bounded to
+    max_blocks, the least recently used blocks are dropped first.
+
+    store:
+        A ParseCache keeping the functional code of the blocks on disk, for
+        the copies translated by other processes. None keeps them in memory
+        only.
+    """
+
+    def __init__(self, max_blocks=DEFAULT_MAX_BLOCKS, store=None):
+        self.max_blocks = max_blocks
+        self.store = store
+        self.blocks = OrderedDict()
+
+    def block(self, node):
+        """
+        The FunctionBlock, or StoredBlock, of the minic Block node
+        """
+        key = mc.structural_hash(node)
+        try:
+            block = self.blocks.pop(key)
+        except KeyError:
+            if self.store:
+                digest = hashlib.sha1(render_version().encode('utf-8'))
+                digest.update(key.encode('utf-8'))
+                block = StoredBlock(node, digest.hexdigest(), self.store)
+            else:
+                block = convert_block(node)
+
+        # the most recently used block is last
+        self.blocks[key] = block
+        if len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return block
+
+
+def render_store(directory=None):
+    """
+    The ParseCache of the stored renderings, by default next to the parse
+    cache in DEFAULT_CACHE_DIR
+    """
+    if directory is None:
+        directory = os.path.join(DEFAULT_CACHE_DIR, 'render')
+    return ParseCache(directory)
+
+
+_default_render_cache = None
+
+
+def default_render_cache():
+    """
+    The RenderCache shared by the BlockVisitors of the process that ask for
+    it, like batch.py does. It keeps up to DEFAULT_MAX_BLOCKS FunctionBlocks
+    alive, with their trees and renderings, for as long as the process runs.
+    """
+    global _default_render_cache
+    if _default_render_cache is None:
+        _default_render_cache = RenderCache()
+    return _default_render_cache
 
 
 class BlockVisitor(mast.NodeVisitor):
+    """
+    Converts each block to a FunctionBlock, kept in blocks. Each block is
+    analyzed and converted once, its unoptimized and optimized code are
+    only rendered when functional_code and opt_functional_code are read.
+
+    cache:
+        The RenderCache to take the blocks from, default_render_cache() to
+        share the one of the process. By default every block is converted,
+        and nothing is kept once the BlockVisitor is released.
+    """
 
-    def __init__(self):
-        self.opt_functional_code = []
-        self.functional_code = []
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.blocks = []
 
 
     def visit_Block(self, node):
@@ -201,54 +553,103 @@ class BlockVisitor(mast.NodeVisitor):
         For each block of code, convert to a functional representation
         ie: every block becomes a function
         """
-        new_function = block_converter(node, False)
-        self.functional_code.append(str(new_function))
+        if self.cache:
+            self.blocks.append(self.cache.block(node))
+        else:
+            self.blocks.append(convert_block(node))
+
+    @property
+    def functional_code(self):
+        return [block.code(False) for block in self.blocks]
 
-        new_opt_function = block_converter(node, True)
-        self.opt_functional_code.append(str(new_function))
+    @property
+    def opt_functional_code(self):
+        # the optimized code is the same function rendered with the
+        # optimizations on
+        return [block.code(True) for block in self.blocks]
 
 
-def block_converter(block, opt_on):
+def block_context(nvs, facts=None, ssa=None):
     """
-    Converts minic_ast.Block to func_fast.functionDef
+    The TranslationContext of a block, from the NodeVisitor of the block,
+    the facts of its statements and its SSA form
     """
-
-    # clear static vars
-    fast.Node.never_used = None
-    fast.Node.var_constants = None
-    fast.Node.var_constants_reference = {}
-    fast.Node.current_opt_index = None
-    fast.Node.current_tab_index = None
-    fast.loop_count = None
-
-    # Find all relevant vars for func input and output
-    nvs = NodeVisitor()
-    nvs.visit(block)
-    input_args, output_args = get_vars_and_written(nvs)
-
     # helpers to optimize code and remove not needed lines
     var_order = nvs.order
     never_used = get_variable_reductions(nvs)
     var_constants = get_variable_constants(nvs)
-    optimize_vars = [var_order, never_used, var_constants]
 
     # remove if statements variables
     never_used, var_constants = remove_if_statements(var_order, never_used, var_constants)
 
+    return TranslationContext(var_order, never_used, var_constants, facts, ssa)
+
+
+def convert_block(block):
+    """
+    Converts minic_ast.Block to the FunctionBlock of its func_fast.functionDef
+    """
+
+    # Find all relevant vars for func input and output, the variables of
+    # every statement are gathered once for the whole block
+    facts = collect_facts(block)
+    nvs = facts[block]
+    input_args, output_args = get_vars_and_written(nvs)
+    ctx = block_context(nvs, facts, SSAFunction(block, nvs.symbols))
+
     # get all declarations, assignments, etc in the block
     block_items = block.block_items
 
     # transform them to our functional representation
-    func_block_items = [transform_ctf(i, optimize_vars) for i in block_items if i]
-
-    # set staic variables
-    fast.Node.optimize_vars = opt_on
-    fast.Node.never_used = never_used
-    fast.Node.var_constants = var_constants
-    fast.Node.current_opt_index = 0
-    fast.Node.current_tab_index = 1
-    fast.loop_count = 0
+    func_block_items = [transform_ctf(i, ctx) for i in block_items if i]
 
     func_def = fast.functionDef(input_args, output_args, func_block_items)
 
-    return func_def
+    return FunctionBlock(func_def, ctx)
+
+
+def stream_functional_code(file_ast, opt_on=None):
+    """
+    Translates a FileAST one external declaration at a time, yielding the
+    functional code of each of its blocks in order: the optimized or the
+    unoptimized code with opt_on True or False, both as (unoptimized,
+    optimized) with None. Only the renderings yielded are computed.
+
+    file_ast can be a pycparser or a minic FileAST. Each declaration is
+    converted to minic, analyzed and rendered before the next one is looked
+    at, and its entry in file_ast.ext is released once done: memory is
+    bounded by the largest function instead of the whole translation unit.
+    file_ast.ext is empty when the generator is exhausted.
+    """
+    ext = file_ast.ext
+    for index in range(len(ext)):
+        decl = ext[index]
+        ext[index] = None
+
+        if not isinstance(decl, mc.Node):
+            decl = ctoc.transform(decl)
+
+        # not kept in the RenderCache, they are released once rendered
+        vs = BlockVisitor(cache=False)
+        vs.visit(decl)
+        del decl
+
+        for block in vs.blocks:
+            if opt_on is None:
+                yield block.code(False), block.code(True)
+            else:
+                yield block.code(opt_on)
+
+    del ext[:]
+
+
+def stream_file(filename, use_cpp=False, cpp_path='cpp', cpp_args='', opt_on=None):
+    """
+    Parses a C file and yields the functional code of its blocks with
+    stream_functional_code. The parse cache is not used, it would hold the
+    whole minic tree.
+    """
+    text = read_source(filename, use_cpp, cpp_path, cpp_args)
+    ast = shared_parser().parse(text, filename)
+    del text
+    return stream_functional_code(ast, opt_on)
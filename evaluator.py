@@ -0,0 +1,353 @@
+#-----------------------------------------------------------------
+#
+# Evaluator of func_ast functions, to run a translated function
+# many times in process.
+#
+# A functionDef is compiled once into nested Python closures, one
+# per node: a statement is a closure updating a frame, an expression
+# a closure computing its value from it. The frame is a list with a
+# slot per variable, the slots of the variables are resolved to
+# their indexes when the closures are built, so that running them
+# looks up neither the kinds of the nodes nor the names. The
+# closures of the simple operands, variables and constants, are
+# folded into the closure of their operator.
+#
+# The semantics are the ones of python_backend: the same parameters,
+# the C division and remainder, bools for the comparisons and the
+# logical operators, and the output_args returned as a tuple.
+#-----------------------------------------------------------------
+
+import operator
+import weakref
+
+import func_ast as fast
+from functions import SymbolTable
+import python_backend
+
+
+_operators = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': python_backend.c_divide,
+    '%': python_backend.c_remainder,
+    '<<': operator.lshift,
+    '>>': operator.rshift,
+    '&': operator.and_,
+    '|': operator.or_,
+    '^': operator.xor,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+_unary_operators = {
+    '-': operator.neg,
+    '+': operator.pos,
+    '~': operator.invert,
+    '!': operator.not_,
+}
+
+# kinds of the compiled operands
+SLOT, CONSTANT, CODE = range(3)
+
+
+def closure(operand):
+    """ The closure computing a compiled operand: (SLOT, index),
+        (CONSTANT, value) or (CODE, closure)
+    """
+    kind, value = operand
+    if kind == SLOT:
+        return operator.itemgetter(value)
+    if kind == CONSTANT:
+        return lambda frame: value
+    return value
+
+
+def binary(op, left, right):
+    """ The closure of left op right, on compiled operands
+    """
+    (left_kind, left_value), (right_kind, right_value) = left, right
+    if left_kind == SLOT and right_kind == SLOT:
+        return lambda frame: op(frame[left_value], frame[right_value])
+    if left_kind == SLOT and right_kind == CONSTANT:
+        return lambda frame: op(frame[left_value], right_value)
+    if left_kind == SLOT:
+        return lambda frame: op(frame[left_value], right_value(frame))
+    if right_kind == SLOT:
+        left_code = closure(left)
+        return lambda frame: op(left_code(frame), frame[right_value])
+    if right_kind == CONSTANT:
+        left_code = closure(left)
+        return lambda frame: op(left_code(frame), right_value)
+    left_code = closure(left)
+    return lambda frame: op(left_code(frame), right_value(frame))
+
+
+def sequence(statements):
+    """ The closure running a list of statement closures in order
+    """
+    statements = tuple(statements)
+    if not statements:
+        return lambda frame: None
+    if len(statements) == 1:
+        return statements[0]
+    if len(statements) == 2:
+        first, second = statements
+        def run(frame):
+            first(frame)
+            second(frame)
+        return run
+    def run(frame):
+        for statement in statements:
+            statement(frame)
+    return run
+
+
+class Evaluator(object):
+    """ The closures of a functionDef. An Evaluator is called with the
+        values of its parameters and returns the tuple of the
+        output_args; arrays are lists, updated in place.
+
+    parameters:
+        The names of the parameters, the ones of
+        python_backend.parameters
+    symbols:
+        The SymbolTable of the slots of the variables, the parameters
+        first
+    """
+
+    def __init__(self, function, functions=None):
+        self.parameters = python_backend.parameters(function)
+        self.symbols = SymbolTable()
+        for name in self.parameters:
+            self.symbols.intern(name)
+        self.namespace = python_backend.namespace(functions)
+
+        self.body = self.items(function.block_items)
+        outputs = [self.symbols.intern(fast.symbol_name(arg)) for arg in function.output_args]
+        if len(outputs) == 1:
+            output = outputs[0]
+            self.result = lambda frame: (frame[output],)
+        elif outputs:
+            self.result = operator.itemgetter(*outputs)
+        else:
+            self.result = lambda frame: ()
+
+        # the slots of the variables that are not parameters
+        self.locals = [None] * (len(self.symbols.symbols) - len(self.parameters))
+
+    def __call__(self, *args):
+        if len(args) != len(self.parameters):
+            raise TypeError("block_function takes %d arguments (%d given)" % (len(self.parameters), len(args)))
+        frame = list(args)
+        frame.extend(self.locals)
+        self.body(frame)
+        return self.result(frame)
+
+    # statements
+
+    def items(self, items):
+        return sequence(self.statement(item) for item in items or [] if item is not None)
+
+    def branch(self, node):
+        """ items for the branch of an If or the body of a LetRec: a
+            Block, a single statement or None
+        """
+        if isinstance(node, fast.Block):
+            return self.items(node.block_items)
+        return self.items([node])
+
+    def statement(self, node):
+        """ The closure of a statement node
+        """
+        if isinstance(node, fast.Let):
+            statements = []
+            # the declarations without an initializer have no rvalue
+            if node.rvalue is not None:
+                statements.append(self.assignment(node.lvalue, node.rvalue))
+            if node.in_statement is not None:
+                statements.append(self.statement(node.in_statement))
+            return sequence(statements)
+
+        if isinstance(node, fast.If) and not node.tern:
+            condition = closure(self.expression(node.cond))
+            iftrue = self.branch(node.iftrue)
+            if node.iffalse is None:
+                def run(frame):
+                    if condition(frame):
+                        iftrue(frame)
+                return run
+
+            iffalse = self.branch(node.iffalse)
+            def run(frame):
+                if condition(frame):
+                    iftrue(frame)
+                else:
+                    iffalse(frame)
+            return run
+
+        if isinstance(node, fast.LetRec):
+            body = self.branch(node.stmt)
+            if node.next is not None:
+                body = sequence([body, self.statement(node.next)])
+            if node.cond is None:
+                def loop(frame):
+                    while True:
+                        body(frame)
+            else:
+                condition = closure(self.expression(node.cond))
+                def loop(frame):
+                    while condition(frame):
+                        body(frame)
+            if node.init is None:
+                return loop
+            return sequence([self.statement(node.init), loop])
+
+        if isinstance(node, fast.Decl):
+            if node.init is None:
+                return sequence([])
+            return self.assignment(node.name, node.init)
+
+        if isinstance(node, fast.DeclList):
+            return sequence(self.statement(decl) for decl in node.decls)
+
+        if isinstance(node, fast.EmptyStatement):
+            return sequence([])
+
+        # an expression statement, its value is dropped
+        return closure(self.expression(node))
+
+    def assignment(self, lvalue, rvalue):
+        """ The closure of lvalue = rvalue: a variable or an element of
+            an array
+        """
+        kind, value = self.expression(rvalue)
+
+        if isinstance(lvalue, fast.ArrayRef):
+            array = closure(self.expression(lvalue.name))
+            subscript = closure(self.expression(lvalue.subscript))
+            code = closure((kind, value))
+            def store(frame):
+                array(frame)[subscript(frame)] = code(frame)
+            return store
+
+        if not isinstance(lvalue, (fast.ID, str)):
+            raise TypeError("cannot evaluate the assignment to %r" % (lvalue,))
+
+        slot = self.symbols.intern(fast.symbol_name(lvalue))
+        if kind == SLOT:
+            def store(frame):
+                frame[slot] = frame[value]
+        elif kind == CONSTANT:
+            def store(frame):
+                frame[slot] = value
+        else:
+            def store(frame):
+                frame[slot] = value(frame)
+        return store
+
+    # expressions
+
+    def expression(self, expr):
+        """ The compiled operand of an expression node. The nodes are
+            walked with an explicit stack, the operands of a node are
+            compiled first.
+        """
+        built = {}
+        # (node, whether its operands are built)
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                stack.append((node, True))
+                if isinstance(node, fast.FuncCall):
+                    children = python_backend.arguments(node)
+                elif isinstance(node, fast.Node):
+                    children = list(node)
+                else:
+                    children = []
+                for child in reversed(children):
+                    stack.append((child, False))
+                continue
+            built[node] = self.operation(node, built)
+        return built[expr]
+
+    def operation(self, node, built):
+        """ The compiled operand of node, from the ones of its operands
+        """
+        if isinstance(node, fast.ID):
+            return SLOT, self.symbols.intern(node.name)
+
+        if isinstance(node, fast.Constant):
+            return CONSTANT, python_backend.constant(node.value)
+
+        if isinstance(node, fast.BinaryOp):
+            left, right = built[node.left], built[node.right]
+            if node.op in _operators:
+                return CODE, binary(_operators[node.op], left, right)
+            if node.op in ('&&', '||'):
+                # C gives 0 or 1, not the value of an operand
+                left_code, right_code = closure(left), closure(right)
+                if node.op == '&&':
+                    return CODE, lambda frame: left_code(frame) != 0 and right_code(frame) != 0
+                return CODE, lambda frame: left_code(frame) != 0 or right_code(frame) != 0
+
+        elif isinstance(node, fast.UnaryOp):
+            if node.op in _unary_operators:
+                op, code = _unary_operators[node.op], closure(built[node.expr])
+                return CODE, lambda frame: op(code(frame))
+
+        elif isinstance(node, fast.ArrayRef):
+            (array_kind, array), (subscript_kind, subscript) = built[node.name], built[node.subscript]
+            if array_kind == SLOT and subscript_kind == SLOT:
+                return CODE, lambda frame: frame[array][frame[subscript]]
+            array_code, subscript_code = closure(built[node.name]), closure(built[node.subscript])
+            return CODE, lambda frame: array_code(frame)[subscript_code(frame)]
+
+        elif isinstance(node, fast.If) and node.tern:
+            condition = closure(built[node.cond])
+            iftrue, iffalse = closure(built[node.iftrue]), closure(built[node.iffalse])
+            return CODE, lambda frame: iftrue(frame) if condition(frame) else iffalse(frame)
+
+        elif isinstance(node, fast.FuncCall):
+            name = fast.symbol_name(node.name)
+            builtins = self.namespace['__builtins__']
+            if not isinstance(builtins, dict):
+                builtins = vars(builtins)
+            function = self.namespace.get(name, builtins.get(name))
+            if function is None:
+                raise TypeError("cannot evaluate the call to %s" % name)
+            args = tuple(closure(built[arg]) for arg in python_backend.arguments(node))
+            if len(args) == 1:
+                arg, = args
+                return CODE, lambda frame: function(arg(frame))
+            if len(args) == 2:
+                first, second = args
+                return CODE, lambda frame: function(first(frame), second(frame))
+            return CODE, lambda frame: function(*[arg(frame) for arg in args])
+
+        elif isinstance(node, fast.ExprList):
+            # the comma operator, the value of the last expression
+            if len(node.exprs) == 1:
+                return built[node.exprs[0]]
+            exprs = tuple(closure(built[expr]) for expr in node.exprs)
+            return CODE, lambda frame: [expr(frame) for expr in exprs][-1]
+
+        raise TypeError("cannot evaluate %r" % (node,))
+
+
+# functionDef -> its Evaluator, with the default namespace
+_evaluators = weakref.WeakKeyDictionary()
+
+
+def evaluator(function, functions=None):
+    """ The Evaluator of a functionDef, built once per functionDef when
+        no functions are given
+    """
+    if functions is not None:
+        return Evaluator(function, functions)
+    return fast.per_function(_evaluators, function, Evaluator)
@@ -23,6 +23,7 @@
 #-----------------------------------------------------------------
 
 import sys
+import weakref
 import functions
 
 
@@ -30,34 +31,26 @@ class Node(object):
     __slots__ = ()
     """ Abstract base class for AST nodes.
     """
-    # static vars for optimizations
-    optimize_vars = False
-
-    #var_order = None
-    never_used = None
-    var_constants = None
-    var_constants_reference = {}
-    current_opt_index = None
-
-    current_tab_index = None
-    loop_count = None
-
-    @staticmethod
-    def clear():
-        #var_order = None
-        never_used = None
-        var_constants = None
-        var_constants_reference = None
-        var_constants_reference = {}
-        current_opt_index = None
+    def __str__(self):
+        return self.render(EmitContext())
 
-        current_tab_index = None
+    def render(self, ctx):
+        """ The functional code of the node, rendered in the EmitContext ctx
+        """
+        return object.__str__(self)
 
     def children(self):
         """ A sequence of all children that are Nodes
         """
         pass
 
+    def __iter__(self):
+        """ Iterates over the children that are Nodes, without
+            building the (name, child) pairs of children().
+        """
+        for _, child in self.children() or ():
+            yield child
+
     def show(self, buf=sys.stdout, offset=0, attrnames=False, nodenames=False, showcoord=False, _my_node_name=None):
         """ Pretty print the Node and all its attributes and
             children (recursively) to a buffer.
@@ -109,6 +102,119 @@ class Node(object):
                 _my_node_name=child_name)
 
 
+def _child_list(node):
+    """ The children of a node. Some nodes keep pycparser nodes as
+        children (the dimension of an ArrayDecl), these have no
+        __iter__.
+    """
+    if isinstance(node, Node):
+        return list(node)
+    return [child for _, child in node.children()]
+
+
+class EmitContext(object):
+    """ The state of one rendering of a functionDef: the optimizations
+        done and where the rendering is in the code. Each rendering has
+        its own, functions can be rendered by several threads at once.
+        The loops are numbered from 0 in every rendering.
+
+        never_used and var_constants hold the indexes of the Lets that
+        the code inlines, in the order the Lets are rendered.
+    """
+    __slots__ = (
+        'optimize_vars', 'never_used', 'var_constants', 'current_opt_index',
+        'current_tab_index', 'loop_count', 'liveness', 'constants', 'cse',
+    )
+
+    def __init__(self, optimize_vars=False, never_used=None, var_constants=None):
+        self.optimize_vars = optimize_vars
+        self.never_used = never_used if never_used is not None else {}
+        self.var_constants = var_constants if var_constants is not None else {}
+        self.current_opt_index = 0
+        self.current_tab_index = 1
+        self.loop_count = 0
+
+        # Liveness, Constants and CommonSubexpressions of the functionDef
+        # being rendered optimized
+        self.liveness = None
+        self.constants = None
+        self.cse = None
+
+
+def inlined_constant(ctx):
+    """ Whether the Let being rendered is one of the var_constants,
+        whose constant is written instead of the variable. The
+        optimized code does not inline them: the constant may not be
+        the value the variable has where it is read, the Constants of
+        the functionDef fold the reads whose value they prove.
+    """
+    return ctx.current_opt_index in ctx.var_constants and ctx.constants is None
+
+
+def reduced_variable(ctx):
+    """ Whether the Let being rendered is one of the never_used, whose
+        value is written in the tuples instead of the variable. Not
+        with the Liveness of the functionDef: it drops the Lets nothing
+        reads, and keeps the ones a later statement or tuple reads.
+    """
+    return ctx.current_opt_index in ctx.never_used and ctx.liveness is None
+
+
+def rendered(node, ctx):
+    """ The functional code of node in ctx. The values the tree keeps
+        as they are, like names, are written as strings.
+    """
+    if isinstance(node, Node):
+        return node.render(ctx)
+    return "%s" % (node,)
+
+
+class ChunkBuffer(object):
+    """ A sink keeping the chunks written to it, joined once by getvalue.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.write = self.chunks.append
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+class NullSink(object):
+    """ A sink throwing away what is written to it: the statements that
+        are rendered for their side effects only.
+    """
+    def write(self, chunk):
+        pass
+
+
+NULL_SINK = NullSink()
+
+
+class HeldBackSink(object):
+    """ A sink passing what is written to it on to out, except for the
+        last size characters, which can still be dropped.
+    """
+    def __init__(self, out, size):
+        self.out = out
+        self.size = size
+        self.held = ""
+
+    def write(self, chunk):
+        held = self.held + chunk
+        if len(held) > self.size:
+            self.out.write(held[:-self.size])
+            held = held[-self.size:]
+        self.held = held
+
+    def drop(self):
+        self.held = ""
+
+    def release(self):
+        self.out.write(self.held)
+        self.held = ""
+
+
 class NodeVisitor(object):
     """ A base NodeVisitor class for visiting c_ast nodes.
         Subclass it and define your own visit_XXX methods, where
@@ -139,22 +245,55 @@ class NodeVisitor(object):
             generic_visit() on the node.
             You can use:
                 NodeVisitor.generic_visit(self, node)
+        *   The visit_XXX method of each node class is looked up
+            once per visitor class and then cached, methods added
+            to an instance or a class after its first visit are
+            not seen.
         *   Modeled after Python's own AST visiting facilities
             (the ast module of Python 3.0)
     """
+    # visitor class -> {node class -> visit function}, filled lazily
+    _dispatch_tables = {}
+
     def visit(self, node):
         """ Visit a node.
         """
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        return self._visitor(node.__class__)(self, node)
+
+    def _visitor(self, node_class):
+        """ The function visiting the nodes of node_class: the
+            visit_XXX method of the visitor class, or generic_visit.
+            Resolved once per pair of classes.
+        """
+        try:
+            table = NodeVisitor._dispatch_tables[self.__class__]
+        except KeyError:
+            table = NodeVisitor._dispatch_tables[self.__class__] = {}
+        try:
+            return table[node_class]
+        except KeyError:
+            method = getattr(self.__class__, 'visit_' + node_class.__name__, self.__class__.generic_visit)
+            visitor = table[node_class] = getattr(method, '__func__', method)
+            return visitor
 
     def generic_visit(self, node):
         """ Called if no explicit visitor function exists for a
             node. Implements preorder visiting of the node.
+            The descendants that are visited generically are walked
+            with an explicit stack instead of recursive calls.
         """
-        for c_name, c in node.children():
-            self.visit(c)
+        generic_visit = NodeVisitor.__dict__['generic_visit']
+        stack = _child_list(node)
+        stack.reverse()
+        while stack:
+            child = stack.pop()
+            visitor = self._visitor(child.__class__)
+            if visitor is generic_visit:
+                children = _child_list(child)
+                children.reverse()
+                stack.extend(children)
+            else:
+                visitor(self, child)
 
 class Let(Node):
     __slots__ = ('lvalue', 'rvalue', 'in_statement', 'coord', '__weakref__')
@@ -173,22 +312,30 @@ class Let(Node):
 		if self.in_statement is not None: nodelist.append(("in_statement", self.in_statement))
 		return tuple(nodelist)
 
-    def __str__(self):
+    def __iter__(self):
+        if self.lvalue is not None:
+            yield self.lvalue
+        if self.rvalue is not None:
+            yield self.rvalue
+        if self.in_statement is not None:
+            yield self.in_statement
+
+    def render(self, ctx):
 
         if isinstance(self.lvalue, ID):
-            left_val = self.lvalue.__str__(lval=True)
+            left_val = self.lvalue.render(ctx, lval=True)
         else:
-            left_val = self.lvalue
+            left_val = rendered(self.lvalue, ctx)
 
-        return "let %s = %s" % (left_val, self.rvalue.__str__())
+        return "let %s = %s" % (left_val, rendered(self.rvalue, ctx))
 
-    def optimized_str(self):
+    def optimized_str(self, ctx):
         if isinstance(self.lvalue, ID):
-            left_val = self.lvalue.__str__(lval=True)
+            left_val = self.lvalue.render(ctx, lval=True)
         else:
-            left_val = self.lvalue
+            left_val = rendered(self.lvalue, ctx)
 
-        return (left_val, self.rvalue.__str__())
+        return (left_val, rendered(self.rvalue, ctx))
 
 class Constant(Node):
     __slots__ = ('value', 'coord', '__weakref__')
@@ -201,7 +348,11 @@ class Constant(Node):
         nodelist = []
         return tuple(nodelist)
 
-    def __str__(self):
+    def __iter__(self):
+        return
+        yield
+
+    def render(self, ctx):
         return "%s" % self.value
 
     attr_names = ('value', )
@@ -213,15 +364,15 @@ class funcTuple(Node):
         self.values = values
         self.coord = coord
 
-    def __str__(self):
+    def render(self, ctx):
         string = "("
         first = True
         for val in value:
             if first:
                 first = False
-                string += "%s" % val.__str__()
+                string += "%s" % rendered(val, ctx)
             else:
-                string += ", %s" % val.__str__()
+                string += ", %s" % rendered(val, ctx)
 
         return string + ")"
 
@@ -245,80 +396,104 @@ class LetRec(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.init is not None:
+            yield self.init
+        if self.cond is not None:
+            yield self.cond
+        if self.next is not None:
+            yield self.next
+        if self.stmt is not None:
+            yield self.stmt
+
     attr_names = ()
 
-    def __str__(self):
-        string = ""
-        parent_tabs = self.current_tab_index
-        # if first encountered loop, set it to loop 0
-        if Node.loop_count == None:
-            Node.loop_count = 0
+    def render(self, ctx):
+        buffer = ChunkBuffer()
+        self.emit(buffer, ctx)
+        return buffer.getvalue()
 
-        current_loop = "loop" + str(self.loop_count)
-        Node.loop_count += 1
+    def emit(self, out, ctx):
+        """ Writes the functional code of the loop to out
+        """
+        # a loop whose condition does not hold the first time it is
+        # tested only runs its init
+        if ctx.constants is not None and ctx.constants.conditions.get(self) is False:
+            self.emit_rec(NULL_SINK, ctx)
+            if self.init:
+                out.write(ctx.current_tab_index * "  " + rendered(self.init, ctx))
+            return
+
+        self.emit_rec(out, ctx)
+
+    def emit_rec(self, out, ctx):
+        parent_tabs = ctx.current_tab_index
+        current_loop = "loop" + str(ctx.loop_count)
+        ctx.loop_count += 1
+
+        # the variables not live at the condition are not passed around
+        in_args = self.in_args
+        if ctx.optimize_vars and ctx.liveness is not None:
+            in_args = ctx.liveness.loop_args(self, in_args)
 
         if self.init:
-            string += self.current_tab_index * "  "
-            string += str(self.init) + " in\n"
+            out.write(ctx.current_tab_index * "  ")
+            out.write(rendered(self.init, ctx) + " in\n")
 
-        string += self.current_tab_index * "  "
-        string += "Let (%s) =\n" % functions.args_cleaner(self.in_args)#.replace(",", "")
-        Node.current_tab_index += 1
+        out.write(ctx.current_tab_index * "  ")
+        out.write("Let (%s) =\n" % functions.args_cleaner(in_args))#.replace(",", "")
+        ctx.current_tab_index += 1
 
         #define recursive function signature
-        string += self.current_tab_index * "  "
-        string += "let rec %s %s =\n" % (current_loop, functions.args_cleaner(self.in_args).replace(",", ""))
-        Node.current_tab_index += 1
+        out.write(ctx.current_tab_index * "  ")
+        out.write("let rec %s %s =\n" % (current_loop, functions.args_cleaner(in_args).replace(",", "")))
+        ctx.current_tab_index += 1
 
-        string += self.current_tab_index * "  "
-        string += "if %s\n" % str(self.cond)
-        string += self.current_tab_index * "  "
-        string += "then\n"
+        out.write(ctx.current_tab_index * "  ")
+        out.write("if %s\n" % rendered(self.cond, ctx))
+        out.write(ctx.current_tab_index * "  ")
+        out.write("then\n")
 
-        then_tab_index = self.current_tab_index
-        Node.current_tab_index += 1
+        then_tab_index = ctx.current_tab_index
+        ctx.current_tab_index += 1
 
 
-        #get the block execution code
-        block, block_tabs, opt, count = self.stmt.__str__()
+        #write the block execution code
+        block_tabs, opt, count = self.stmt.emit(out, ctx)
 
         optimizations = {}
         # Updated needed optimizations
         for key in opt:
             optimizations[str(key)] = opt[key]
 
-        # add the let rec block
-        string += block
-
         # increment the iterator if it exists
         if self.next:
-            string += (block_tabs + 1) * "  "
+            out.write((block_tabs + 1) * "  ")
             block_tabs += 1
-            string += "%s in\n" % str(self.next)
+            out.write("%s in\n" % rendered(self.next, ctx))
 
         # call the rec func again
-        string += (block_tabs + 1) * "  "
-        string += "%s " % current_loop
-        if self.optimize_vars:
-            string += ("%s\n") % functions.optimized_args_cleaner(self.in_args, optimizations).replace(",", "")
+        out.write((block_tabs + 1) * "  ")
+        out.write("%s " % current_loop)
+        if ctx.optimize_vars:
+            out.write(("%s\n") % functions.optimized_args_cleaner(in_args, optimizations).replace(",", ""))
         else:
-            string += ("%s\n") % functions.args_cleaner(self.in_args).replace(",", "")
+            out.write(("%s\n") % functions.args_cleaner(in_args).replace(",", ""))
 
         # add the in return statement for this case
 
 
         # reset the let rec then else tab index
-        Node.current_tab_index = then_tab_index
+        ctx.current_tab_index = then_tab_index
         #define end statement
-        string += self.current_tab_index * "  "
-        string += "else (%s)\n" % functions.args_cleaner(self.in_args)
+        out.write(ctx.current_tab_index * "  ")
+        out.write("else (%s)\n" % functions.args_cleaner(in_args))
 
 
-        string += (parent_tabs + 1) * "  "
-        string += "in %s %s" % (current_loop, functions.args_cleaner(self.in_args).replace(",", ""))
+        out.write((parent_tabs + 1) * "  ")
+        out.write("in %s %s" % (current_loop, functions.args_cleaner(in_args).replace(",", "")))
 
-        Node.current_tab_index = parent_tabs
-        return string
+        ctx.current_tab_index = parent_tabs
 
 class BinaryOp(Node):
     __slots__ = ('op', 'left', 'right', 'coord', '__weakref__')
@@ -335,8 +510,34 @@ class BinaryOp(Node):
         if self.right is not None: nodelist.append(("right", self.right))
         return tuple(nodelist)
 
-    def __str__(self):
-        return "%s %s %s" % (self.left, self.op, self.right)
+    def __iter__(self):
+        if self.left is not None:
+            yield self.left
+        if self.right is not None:
+            yield self.right
+
+    def render(self, ctx, expand=False):
+        # long chains of operators are rendered with an explicit stack
+        # instead of recursive calls, the operators are pushed as strings.
+        # With expand, the operator itself is rendered even when it is a
+        # common subexpression, to bind it.
+        parts = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, BinaryOp):
+                value = folded(item, ctx)
+                if value is None and not (expand and item is self):
+                    value = common(item, ctx)
+                if value is not None:
+                    parts.append(value)
+                    continue
+                stack.append(item.right)
+                stack.append(" %s " % item.op)
+                stack.append(item.left)
+            else:
+                parts.append(rendered(item, ctx))
+        return "".join(parts)
 
     attr_names = ('op', )
 
@@ -356,16 +557,39 @@ class functionDef(Node):
             nodelist.append(("block_items[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.block_items or []):
+            yield child
 
-    def __str__(self):
+
+    def render(self, ctx):
+        buffer = ChunkBuffer()
+        self.emit(buffer, ctx)
+        return buffer.getvalue()
+
+    def emit(self, out, ctx):
+        """ Writes the functional code of the function to out, a
+            file-like object, chunk by chunk
+        """
         # keep track of optimizations to be done on our code
         optimizations = {}
 
+        # the bindings nothing reads are dropped from the optimized code
+        ctx.liveness = liveness(self) if ctx.optimize_vars else None
+        # and the expressions known at translation time are folded
+        ctx.constants = constants(self) if ctx.optimize_vars else None
+        # and the repeated expressions are computed once
+        ctx.cse = common_subexpressions(self) if ctx.optimize_vars else None
+
+        # the " in \n" after a last if is cut, the end of the code is
+        # held back until it is known
+        out = HeldBackSink(out, 4)
+
         # function name, inputs, outputs
-        string = "fun block_function(%s) returns (%s) =\n" % (
+        out.write("fun block_function(%s) returns (%s) =\n" % (
             functions.args_cleaner(self.input_args),
             functions.args_cleaner(self.output_args)
-        )
+        ))
 
         last_is_if = False # last statement is a if
         complex_if = False # last statement is not a simple ternary_if
@@ -373,59 +597,72 @@ class functionDef(Node):
 
         # now go over all our body items
         for body in self.block_items:
+            bound, _ = bindings_str(body, ctx)
+            out.write(bound)
+
             # body can be a let or let rec
             if isinstance(body, If):
-                if_body, ternary_if, _, complex_if = body.__str__()
+                if dropped(body, ctx.liveness, ctx.constants):
+                    _, _, complex_if = body.emit(NULL_SINK, ctx)
+                    continue
 
-                if (
-                    self.optimize_vars and
-                    len(self.block_items) == 1 and
-                    not complex_if
-                ):
-                    string += "%s in \n" % ternary_if
+                if ctx.optimize_vars and len(self.block_items) == 1:
+                    # a simple if is written as a ternary if, which is
+                    # only known once the if is rendered
+                    buffer = ChunkBuffer()
+                    ternary_if, _, complex_if = body.emit(buffer, ctx)
+                    out.write(buffer.getvalue() if complex_if else ternary_if)
                 else:
-                    string += "%s in \n" % if_body
+                    ternary_if, _, complex_if = body.emit(out, ctx)
+                out.write(" in \n")
 
                 last_is_if = True
                 continue
 
             elif isinstance(body, Let):
 
-                lhand, rhand = body.optimized_str()
+                lhand, rhand = body.optimized_str(ctx)
 
                 # optimization can be done
                 if (
-                    self.optimize_vars and
-                    self.current_opt_index in self.never_used or
-                    self.current_opt_index in self.var_constants
+                    ctx.optimize_vars and
+                    reduced_variable(ctx) or
+                    inlined_constant(ctx)
                 ):
                     # if variable is never used later on in the code
-                    if (self.current_opt_index in self.never_used):
+                    if reduced_variable(ctx):
                         optimizations[str(lhand)] = rhand
 
                     # if the variable can be replaced with a constant
-                    if (self.current_opt_index in self.var_constants):
+                    if inlined_constant(ctx):
                         optimizations[str(lhand)] = rhand
-                        self.var_constants_reference[str(lhand)] = rhand
 
-                    Node.current_opt_index += 1
+                    ctx.current_opt_index += 1
                     continue
 
-                string += self.current_tab_index * "  "
-                string += "%s in \n" % body.__str__()
+                if dropped(body, ctx.liveness, ctx.constants):
+                    ctx.current_opt_index += 1
+                    continue
+
+                out.write(ctx.current_tab_index * "  ")
+                out.write("%s in \n" % body.render(ctx))
                 last_is_if = False
 
             elif isinstance(body, LetRec):
+                if dropped(body, ctx.liveness, ctx.constants):
+                    body.emit(NULL_SINK, ctx)
+                    continue
 
-                string += "%s\n" % body.__str__()
-                string += self.current_tab_index * "  " + "in\n"
+                body.emit(out, ctx)
+                out.write("\n")
+                out.write(ctx.current_tab_index * "  " + "in\n")
                 continue
             else:
                 print("Not supported ... CODE??!")
 
             #indent
-            Node.current_tab_index += 1
-            Node.current_opt_index += 1
+            ctx.current_tab_index += 1
+            ctx.current_opt_index += 1
 
 
         # add final return
@@ -434,22 +671,20 @@ class functionDef(Node):
             last_is_if and
             len(self.block_items) == 1
         ):
-            string = string[:-4]
-            return string
+            out.drop()
+            return
         elif last_is_if:
-            string = string[:-4]
-            string += "\nin "
+            out.drop()
+            out.write("\nin ")
         else:
-            string += self.current_tab_index * "  "
+            out.write(ctx.current_tab_index * "  ")
 
         # add the output
-        if self.optimize_vars:
-            string += "(%s)" % functions.optimized_args_cleaner(self.output_args, optimizations)
+        if ctx.optimize_vars:
+            out.write("(%s)" % functions.optimized_args_cleaner(self.output_args, optimizations))
         else:
-            string += "(%s)" % functions.args_cleaner(self.output_args)
-
-        # return the string
-        return string
+            out.write("(%s)" % functions.args_cleaner(self.output_args))
+        out.release()
 
     attr_names = ()
 
@@ -468,8 +703,12 @@ class Decl(Node):
         if self.init is not None: nodelist.append(("init", self.init))
         return tuple(nodelist)
 
-    def __str__(self):
-        return "%s = %s" % (self.name, self.init.__str__())
+    def __iter__(self):
+        if self.init is not None:
+            yield self.init
+
+    def render(self, ctx):
+        return "%s = %s" % (self.name, rendered(self.init, ctx))
 
     attr_names = ('name', 'funcspec', )
 
@@ -487,6 +726,10 @@ class DeclList(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.decls or []):
+            yield child
+
     attr_names = ()
 
 
@@ -499,6 +742,10 @@ class EmptyStatement(Node):
     def children(self):
         return ()
 
+    def __iter__(self):
+        return
+        yield
+
     attr_names = ()
 
 class ArrayRef(Node):
@@ -514,8 +761,18 @@ class ArrayRef(Node):
         if self.subscript is not None: nodelist.append(("subscript", self.subscript))
         return tuple(nodelist)
 
-    def __str__(self):
-        return "%s.(%s)" % (self.name, self.subscript.__str__())
+    def __iter__(self):
+        if self.name is not None:
+            yield self.name
+        if self.subscript is not None:
+            yield self.subscript
+
+    def render(self, ctx, expand=False):
+        if not expand:
+            name = common(self, ctx)
+            if name is not None:
+                return name
+        return "%s.(%s)" % (rendered(self.name, ctx), rendered(self.subscript, ctx))
 
 
     attr_names = ()
@@ -533,15 +790,19 @@ class ExprList(Node):
             nodelist.append(("exprs[%d]" % i, child))
         return tuple(nodelist)
 
-    def __str__(self):
+    def __iter__(self):
+        for child in (self.exprs or []):
+            yield child
+
+    def render(self, ctx):
         string = "("
         first = True
         for i in self.exprs:
             if first:
-                string += "%s" % i
+                string += rendered(i, ctx)
                 first = False
             else:
-                string += ", %s" % i
+                string += ", %s" % rendered(i, ctx)
         return string + ")"
 
 	attr_names = ()
@@ -560,6 +821,10 @@ class FileAST(Node):
             nodelist.append(("ext[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.ext or []):
+            yield child
+
     attr_names = ()
 
 
@@ -577,11 +842,17 @@ class FuncCall(Node):
         if self.args is not None: nodelist.append(("args", self.args))
         return tuple(nodelist)
 
-    def __str__(self):
+    def __iter__(self):
+        if self.name is not None:
+            yield self.name
+        if self.args is not None:
+            yield self.args
+
+    def render(self, ctx):
         if not self.args:
-            return "%s()" % self.name.__str__()
+            return "%s()" % rendered(self.name, ctx)
         else:
-            return "%s%s" % (self.name.__str__(), self.args.__str__())
+            return "%s%s" % (rendered(self.name, ctx), rendered(self.args, ctx))
 
     attr_names = ()
 
@@ -600,6 +871,12 @@ class FuncDecl(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.args is not None:
+            yield self.args
+        if self.type is not None:
+            yield self.type
+
     attr_names = ()
 
 
@@ -614,14 +891,16 @@ class ID(Node):
         nodelist = []
         return tuple(nodelist)
 
-    def __str__(self, lval=False):
+    def __iter__(self):
+        return
+        yield
 
-        if (
-            self.optimize_vars and
-            not lval and
-            self.name in self.var_constants_reference
-        ):
-            return self.var_constants_reference[self.name]
+    def render(self, ctx, lval=False):
+
+        if not lval and ctx.constants is not None:
+            value = folded(self, ctx)
+            if value is not None:
+                return value
 
         return self.name
 
@@ -638,6 +917,10 @@ class IdentifierType(Node):
         nodelist = []
         return tuple(nodelist)
 
+    def __iter__(self):
+        return
+        yield
+
     attr_names = ('names', )
 
 
@@ -661,45 +944,75 @@ class If(Node):
         if self.iffalse is not None: nodelist.append(("iffalse", self.iffalse))
         return tuple(nodelist)
 
-    def __str__(self):
+    def __iter__(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.iftrue is not None:
+            yield self.iftrue
+        if self.iffalse is not None:
+            yield self.iffalse
+
+    def render(self, ctx):
 
         if self.tern:
+            value = folded(self, ctx)
+            if value is not None:
+                return value
             ternary_string = ""
-            #ternary_string += self.current_tab_index * "  "
+            #ternary_string += ctx.current_tab_index * "  "
             ternary_string += "if %s then (%s) else (%s)" % (
-                str(self.cond),
-                str(self.iftrue),
-                str(self.iffalse),
+                rendered(self.cond, ctx),
+                rendered(self.iftrue, ctx),
+                rendered(self.iffalse, ctx),
             )
             return ternary_string
 
+        buffer = ChunkBuffer()
+        self.emit(buffer, ctx)
+        return buffer.getvalue()
+
+    def emit(self, out, ctx):
+        """ Writes the if statement to out. Returns its ternary if form
+            when it is simple, the indentation of its branches and
+            whether it is not simple.
+        """
+
         # keep track of optimizations
         optimizations = {}
 
         # different if formats
-        string = ""
         ternary_string = ""
 
         # keep track of the current indentation to bring us back
         # here when the if is done
-        parent_tabs = self.current_tab_index
+        parent_tabs = ctx.current_tab_index
+
+        # only the variables written in the if and live after it are returned
+        in_args, out_args = self.in_args, self.out_args
+        if ctx.optimize_vars and ctx.liveness is not None:
+            in_args = ctx.liveness.live_args(self, in_args)
+            out_args = ctx.liveness.live_args(self, out_args)
+
+        # a condition known at translation time keeps the branch taken
+        if ctx.constants is not None and ctx.constants.conditions.get(self) is not None:
+            return self.emit_taken(out, ctx, ctx.constants.conditions[self], in_args, out_args)
 
         # add inital let with args
-        string += self.current_tab_index * "  "
-        string += "let (%s) =\n" % functions.args_cleaner(self.in_args)
+        out.write(ctx.current_tab_index * "  ")
+        out.write("let (%s) =\n" % functions.args_cleaner(in_args))
 
-        Node.current_tab_index += 1
+        ctx.current_tab_index += 1
 
         # add if and condition
-        string += self.current_tab_index * "  "
-        string += "if %s\n" % str(self.cond)
+        out.write(ctx.current_tab_index * "  ")
+        out.write("if %s\n" % rendered(self.cond, ctx))
 
 
-        string += self.current_tab_index * "  "
-        string += "then\n"
+        out.write(ctx.current_tab_index * "  ")
+        out.write("then\n")
 
-        # Convert the if block to a string
-        if_block, if_block_tabs, opt, count = self.iftrue.__str__()
+        # write the if block
+        if_block_tabs, opt, count = self.iftrue.emit(out, ctx)
 
         # Updated needed optimizations
         for key in opt:
@@ -712,53 +1025,50 @@ class If(Node):
                     a = None
 
         # Edge Case: simple ternary if
-        if self.optimize_vars and count == 0 and not self.iffalse:
-            ternary_string += self.current_tab_index * "  "
+        if ctx.optimize_vars and count == 0 and not self.iffalse:
+            ternary_string += ctx.current_tab_index * "  "
             ternary_string += "if %s then (%s) else (%s)" % (
-                str(self.cond),
-                functions.optimized_args_cleaner(self.in_args, optimizations),
-                functions.args_cleaner(self.in_args)
+                rendered(self.cond, ctx),
+                functions.optimized_args_cleaner(in_args, optimizations),
+                functions.args_cleaner(in_args)
             )
 
 
-        # we continue to build the regular string incase
+        # we continue to write the regular if incase
         # we dont want ternary statements
 
-        # add the ifblock to the string
-        string += if_block
-
         # complete the if block in statement
-        string += if_block_tabs * "  "
+        out.write(if_block_tabs * "  ")
 
-        if self.optimize_vars:
-            string += ("(%s)") % functions.optimized_args_cleaner(self.in_args, optimizations)
+        if ctx.optimize_vars:
+            out.write(("(%s)") % functions.optimized_args_cleaner(in_args, optimizations))
         else:
-            string += ("(%s)") % functions.args_cleaner(self.in_args)
+            out.write(("(%s)") % functions.args_cleaner(in_args))
 
 
         # start to work on the else statement
-        string += "\n" + self.current_tab_index * "  " + "else\n"
+        out.write("\n" + ctx.current_tab_index * "  " + "else\n")
 
 
         # if we have a else if or else clause
         if self.iffalse:
             # if we have a else if clause
             if isinstance(self.iffalse, If):
-                # get string format of the else if block
-                else_block, _, t, complex_if = self.iffalse.__str__()
-                string += else_block
+                # write the else if block
+                bound, _ = bindings_str(self.iffalse, ctx)
+                out.write(bound)
+                self.iffalse.emit(out, ctx)
                 # add return in statement
-                string += "\n" + parent_tabs * "  "
-                string += ("in (%s)") % functions.args_cleaner(self.in_args)
-                tabs = self.current_tab_index
-                Node.current_tab_index = parent_tabs
-                return string, ternary_string, tabs, True
+                out.write("\n" + parent_tabs * "  ")
+                out.write(("in (%s)") % functions.args_cleaner(in_args))
+                tabs = ctx.current_tab_index
+                ctx.current_tab_index = parent_tabs
+                return ternary_string, tabs, True
 
             # if we have a else clause
             else:
-                # get string format of else block
-                else_block, t, opt, count = self.iffalse.__str__()
-                string += else_block
+                # write the else block
+                t, opt, count = self.iffalse.emit(out, ctx)
 
                 # optimizations related to else block
                 opti = {}
@@ -766,29 +1076,70 @@ class If(Node):
                     opti[str(key)] = opt[key]
 
                 # do else in statement
-                string += t * "  "
-                if self.optimize_vars:
-                    string += ("(%s)") % functions.optimized_args_cleaner(self.in_args, opti)
+                out.write(t * "  ")
+                if ctx.optimize_vars:
+                    out.write(("(%s)") % functions.optimized_args_cleaner(in_args, opti))
                 else:
-                    string += ("(%s)") % functions.args_cleaner(self.in_args)
+                    out.write(("(%s)") % functions.args_cleaner(in_args))
 
         # No else if or else clause
         # functional programing requires a else clauss... add in some fluff
         else:
             # return the variables relating to the if statement
-            string += self.current_tab_index * "  "
-            string += ("(%s)") % functions.args_cleaner(self.in_args)
+            out.write(ctx.current_tab_index * "  ")
+            out.write(("(%s)") % functions.args_cleaner(in_args))
 
 
         # update the if statements returning in
-        string += "\n" + parent_tabs * "  "
-        string += "in (%s)" % functions.args_cleaner(self.out_args)
+        out.write("\n" + parent_tabs * "  ")
+        out.write("in (%s)" % functions.args_cleaner(out_args))
 
         # get data to return to parent
-        simple_if = (self.optimize_vars and count == 0 and not self.iffalse)
-        tabs = self.current_tab_index
-        Node.current_tab_index = parent_tabs
-        return string, ternary_string, tabs, not simple_if
+        simple_if = (ctx.optimize_vars and count == 0 and not self.iffalse)
+        tabs = ctx.current_tab_index
+        ctx.current_tab_index = parent_tabs
+        return ternary_string, tabs, not simple_if
+
+    def emit_taken(self, out, ctx, condition, in_args, out_args):
+        """ The if whose condition is known: only the branch taken is
+            written. Both branches are still rendered, in order, for the
+            optimization indexes of the Lets to stay in step.
+        """
+        parent_tabs = ctx.current_tab_index
+
+        out.write(ctx.current_tab_index * "  ")
+        out.write("let (%s) =\n" % functions.args_cleaner(in_args))
+        ctx.current_tab_index += 1
+        tabs = ctx.current_tab_index
+
+        if_block_tabs, opt, _ = self.iftrue.emit(out if condition else NULL_SINK, ctx)
+        if condition:
+            out.write(if_block_tabs * "  ")
+            out.write("(%s)" % functions.optimized_args_cleaner(
+                in_args, dict((str(key), opt[key]) for key in opt)))
+
+        if isinstance(self.iffalse, If):
+            bound, _ = bindings_str(self.iffalse, ctx)
+            if not condition:
+                # the else if returns its own tuple
+                out.write(bound)
+                out_args = in_args
+            self.iffalse.emit(NULL_SINK if condition else out, ctx)
+        elif self.iffalse:
+            t, opt, _ = self.iffalse.emit(NULL_SINK if condition else out, ctx)
+            if not condition:
+                out.write(t * "  ")
+                out.write("(%s)" % functions.optimized_args_cleaner(
+                    in_args, dict((str(key), opt[key]) for key in opt)))
+        elif not condition:
+            out.write(tabs * "  ")
+            out.write("(%s)" % functions.args_cleaner(in_args))
+
+        out.write("\n" + parent_tabs * "  ")
+        out.write("in (%s)" % functions.args_cleaner(out_args))
+
+        ctx.current_tab_index = parent_tabs
+        return "", tabs, True
 
 
     attr_names = ()
@@ -806,70 +1157,86 @@ class Block(Node):
             nodelist.append(("block_items[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.block_items or []):
+            yield child
+
     attr_names = ()
 
-    def __str__(self):
+    def render(self, ctx):
+        buffer = ChunkBuffer()
+        self.emit(buffer, ctx)
+        return buffer.getvalue()
+
+    def emit(self, out, ctx):
+        """ Writes the lets of the block to out. Returns the indentation
+            of what follows them, the optimizations for its tuple and
+            the number of statements written, -1 when not optimized.
+        """
 
         optimizations = {}
 
-        string = ""
         count = 0
-        parent_tabs = self.current_tab_index
+        parent_tabs = ctx.current_tab_index
 
         for index, child in self.children():
+            bound, bound_count = bindings_str(child, ctx)
+            out.write(bound)
+            count += bound_count
 
-            if not self.optimize_vars:
+            if not ctx.optimize_vars:
 
                 if isinstance(child, Let):
-                    string += self.current_tab_index * "  "
-                    string += "%s in \n" % str(child)
-                    Node.current_tab_index += 1
-                elif isinstance(child, LetRec):
-                    string += "%s in \n" % child.__str__()
+                    out.write(ctx.current_tab_index * "  ")
+                    out.write("%s in \n" % child.render(ctx))
+                    ctx.current_tab_index += 1
                 else:
-                    if_body, _, _t, complex_if = child.__str__()
-                    string += "%s in \n" % if_body
+                    child.emit(out, ctx)
+                    out.write(" in \n")
 
             elif isinstance(child, Let):
 
-                lhand, rhand = child.optimized_str()
+                lhand, rhand = child.optimized_str(ctx)
 
-                #TODO: This if can be removed maybe ... look into it
-                if (self.current_opt_index in self.never_used):
+                if reduced_variable(ctx):
                     optimizations[str(lhand)] = rhand
 
-                if (self.current_opt_index in self.var_constants):
+                if inlined_constant(ctx):
                     optimizations[str(lhand)] = rhand
-                    self.var_constants_reference[str(lhand)] = rhand
 
                 if (
-                    self.current_opt_index in self.never_used or
-                    self.current_opt_index in self.var_constants
+                    reduced_variable(ctx) or
+                    inlined_constant(ctx)
                 ):
-                    Node.current_opt_index += 1
+                    ctx.current_opt_index += 1
                     continue
 
-                string += self.current_tab_index * "  "
-                string += "%s in \n" % str(child)
-                count += 1
-                Node.current_tab_index += 1
-                Node.current_opt_index += 1
-            elif isinstance(child, LetRec):
+                if dropped(child, ctx.liveness, ctx.constants):
+                    ctx.current_opt_index += 1
+                    continue
+
+                out.write(ctx.current_tab_index * "  ")
+                out.write("%s in \n" % child.render(ctx))
                 count += 1
-                string += "%s in \n" % child.__str__()
+                ctx.current_tab_index += 1
+                ctx.current_opt_index += 1
 
             else:
+                # loops and ifs
+                if dropped(child, ctx.liveness, ctx.constants):
+                    child.emit(NULL_SINK, ctx)
+                    continue
                 count += 1
-                if_body, _, _t, complex_if = child.__str__()
-                string += "%s in \n" % if_body
+                child.emit(out, ctx)
+                out.write(" in \n")
 
-        tabs = self.current_tab_index
-        Node.current_tab_index = parent_tabs
+        tabs = ctx.current_tab_index
+        ctx.current_tab_index = parent_tabs
 
-        if not self.optimize_vars:
-            return string, tabs, optimizations, -1
+        if not ctx.optimize_vars:
+            return tabs, optimizations, -1
 
-        return string, tabs, optimizations, count
+        return tabs, optimizations, count
 
 
 class UnaryOp(Node):
@@ -885,12 +1252,963 @@ class UnaryOp(Node):
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
-    def __str__(self):
-        return str(self.op) + str(self.expr)
+    def __iter__(self):
+        if self.expr is not None:
+            yield self.expr
+
+    def render(self, ctx):
+        value = folded(self, ctx)
+        if value is not None:
+            return value
+        return str(self.op) + rendered(self.expr, ctx)
 
     attr_names = ('op', )
 
 
+#-----------------------------------------------------------------
+# Liveness of the variables of a functionDef. The optimized
+# rendering uses it to drop the bindings nothing reads: Lets,
+# the variables returned by ifs and passed around by loops.
+#-----------------------------------------------------------------
+
+def symbol_name(arg):
+    """ The variable of an item of an argument list: variables are
+        names, written arrays are kept as their ID.
+    """
+    return getattr(arg, 'name', arg)
+
+
+def read_names(expr):
+    """ The names of the variables an expression reads, ternary
+        ifs included.
+    """
+    names = []
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ID):
+            names.append(node.name)
+        elif isinstance(node, Node):
+            stack.extend(node)
+    return names
+
+
+def written_names(node):
+    """ The names of the variables the Lets in a statement write,
+        the arrays updated through a subscript included
+    """
+    names = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Let):
+            lvalue = item.lvalue
+            if isinstance(lvalue, ArrayRef):
+                lvalue = lvalue.name
+            if isinstance(lvalue, (ID, str)):
+                names.append(symbol_name(lvalue))
+        elif isinstance(item, Node):
+            stack.extend(item)
+    return names
+
+
+class Liveness(object):
+    """ Backward liveness analysis of the variables of a functionDef.
+
+        The statements are flattened to a control flow graph of
+        points: the Lets, and the conditions of the Ifs and LetRecs.
+        The outputs of the function are read by a last point. The
+        variables live at every point are computed with a worklist
+        until nothing changes, which covers the loops. The results
+        are then kept per statement node:
+
+        after:
+            statement -> the point following it
+        writes:
+            If or LetRec -> the variables written in it
+        heads:
+            LetRec -> the point of its condition
+
+        Sets of variables are bitsets of the SymbolTable symbols.
+    """
+
+    def __init__(self, function):
+        self.symbols = functions.SymbolTable()
+
+        # per point: variables read, variables overwritten, successors
+        self.uses = []
+        self.kills = []
+        self.successors = []
+
+        self.after = {}
+        self.writes = {}
+        self.heads = {}
+
+        outputs = self.symbols.bitset(symbol_name(arg) for arg in function.output_args)
+        exit = self.point(outputs, 0, [])
+        self.items(function.block_items, exit)
+
+        # point -> variables live on entry
+        self.live = self.solve()
+
+    def point(self, uses, kills, successors):
+        self.uses.append(uses)
+        self.kills.append(kills)
+        self.successors.append(successors)
+        return len(self.uses) - 1
+
+    def items(self, items, cont):
+        """ Adds the points of a list of statements followed by the
+            point cont. Returns the entry point of the list and the
+            variables its statements write.
+        """
+        writes = 0
+        for item in reversed(items or []):
+            if item is not None:
+                cont, item_writes = self.statement(item, cont)
+                writes |= item_writes
+        return cont, writes
+
+    def block(self, node, cont):
+        """ items for the branch of an If: a Block, an else if or None
+        """
+        if isinstance(node, Block):
+            return self.items(node.block_items, cont)
+        return self.items([node], cont)
+
+    def statement(self, node, cont):
+        """ Adds the points of a statement followed by the point cont.
+            Returns the entry point of the statement and the variables
+            it writes.
+        """
+        symbols = self.symbols
+        self.after[node] = cont
+
+        if isinstance(node, Let):
+            lvalue = node.lvalue
+            uses = symbols.bitset(read_names(node.rvalue))
+            if isinstance(lvalue, (ID, str)):
+                written = symbols.bit(symbol_name(lvalue))
+                return self.point(uses, written, [cont]), written
+
+            # array.(subscript) = ... updates the array, it reads it
+            uses |= symbols.bitset(read_names(lvalue))
+            written = 0
+            if isinstance(lvalue, ArrayRef):
+                written = symbols.bit(symbol_name(lvalue.name))
+            return self.point(uses, 0, [cont]), written
+
+        elif isinstance(node, If) and not node.tern:
+            entry = self.point(symbols.bitset(read_names(node.cond)), 0, None)
+            true_entry, writes = self.block(node.iftrue, cont)
+            false_entry, false_writes = self.block(node.iffalse, cont)
+            self.successors[entry] = [true_entry, false_entry]
+            writes |= false_writes
+
+        elif isinstance(node, LetRec):
+            # init, then the condition, the body and next until the
+            # condition is false
+            head = self.heads[node] = self.point(symbols.bitset(read_names(node.cond)), 0, None)
+            body_cont, writes = self.items([node.next], head)
+            body_entry, body_writes = self.block(node.stmt, body_cont)
+            self.successors[head] = [body_entry, cont]
+            entry, init_writes = self.items([node.init], head)
+            writes |= body_writes | init_writes
+
+        else:
+            # anything else only reads
+            return self.point(symbols.bitset(read_names(node)), 0, [cont]), 0
+
+        self.writes[node] = writes
+        return entry, writes
+
+    def solve(self):
+        """ The variables live on entry of every point
+        """
+        uses, kills, successors = self.uses, self.kills, self.successors
+        count = len(uses)
+
+        predecessors = [[] for _ in range(count)]
+        for point in range(count):
+            for successor in successors[point]:
+                predecessors[successor].append(point)
+
+        # the points are added from the end of the function, they are
+        # first visited in that order
+        live = [0] * count
+        worklist = list(range(count - 1, -1, -1))
+        queued = [True] * count
+        while worklist:
+            point = worklist.pop()
+            queued[point] = False
+
+            out = 0
+            for successor in successors[point]:
+                out |= live[successor]
+            live_in = uses[point] | (out & ~kills[point])
+
+            if live_in != live[point]:
+                live[point] = live_in
+                for predecessor in predecessors[point]:
+                    if not queued[predecessor]:
+                        queued[predecessor] = True
+                        worklist.append(predecessor)
+        return live
+
+    def live_after(self, node):
+        """ The variables live after a statement, None if the statement
+            is not in the function
+        """
+        point = self.after.get(node)
+        if point is None:
+            return None
+        return self.live[point]
+
+    def dead(self, node):
+        """ Whether a Let or an If only binds variables nothing reads
+        """
+        live = self.live_after(node)
+        if live is None:
+            return False
+        if isinstance(node, Let):
+            if not isinstance(node.lvalue, (ID, str)):
+                return False
+            return not self.symbols.bit(symbol_name(node.lvalue)) & live
+        if isinstance(node, If):
+            return not self.writes[node] & live
+        return False
+
+    def live_args(self, node, args):
+        """ The arguments returned by an If that are written in it and
+            still live after it
+        """
+        live = self.live_after(node)
+        if live is None:
+            return args
+        return self.keep(args, self.writes[node] & live)
+
+    def loop_args(self, node, args):
+        """ The arguments of the recursive function of a LetRec that
+            are live when its condition is tested
+        """
+        head = self.heads.get(node)
+        if head is None:
+            return args
+        return self.keep(args, self.live[head])
+
+    def keep(self, args, bits):
+        symbols = self.symbols
+        return [arg for arg in args if not isinstance(arg, str) or symbols.bit(arg) & bits]
+
+
+def per_function(cache, function, build):
+    """ cache[function], set to build(function) the first time. The
+        caches of the analyses of the functionDefs are
+        WeakKeyDictionaries: a result goes with its functionDef.
+    """
+    try:
+        return cache[function]
+    except KeyError:
+        result = cache[function] = build(function)
+        return result
+
+
+# functionDef -> Liveness, computed once per function
+_liveness = weakref.WeakKeyDictionary()
+
+
+def liveness(function):
+    """ The Liveness of a functionDef
+    """
+    return per_function(_liveness, function, Liveness)
+
+
+#-----------------------------------------------------------------
+# Constant propagation and folding over a functionDef. The
+# optimized rendering writes the expressions whose value is known
+# at translation time as literals, keeps only the branch taken by
+# the ifs with a known condition and leaves out the loops that
+# never run.
+#-----------------------------------------------------------------
+
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+def constant_value(literal):
+    """ The value of a C integer or floating literal, None for the
+        other constants (characters, strings)
+    """
+    text = str(literal).lower()
+    try:
+        if text.startswith('0x'):
+            return int(text.rstrip('ul'), 16)
+        if text.rstrip('ul').isdigit():
+            digits = text.rstrip('ul')
+            if len(digits) > 1 and digits.startswith('0'):
+                return int(digits, 8)
+            return int(digits)
+        # single precision floats are not folded in double precision
+        if (text[:1].isdigit() or text[:1] == '.') and not text.endswith('f'):
+            return float(text.rstrip('l'))
+    except ValueError:
+        pass
+    return None
+
+
+def unsigned_literal(literal):
+    """ Whether a C integer literal has the u suffix
+    """
+    return str(literal).lower().rstrip('l').endswith('u')
+
+
+def declared_names(function):
+    """ The names of the variables a functionDef declares: the Lets
+        of the declarations write a name, not an ID
+    """
+    names = set()
+    stack = [function]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Let) and isinstance(item.lvalue, str):
+            names.add(item.lvalue)
+        if isinstance(item, (Node, list)):
+            stack.extend(item)
+    return names
+
+
+def c_division(left, right):
+    """ Integer division truncating towards zero, as in C
+    """
+    quotient = abs(left) // abs(right)
+    if (left < 0) != (right < 0):
+        return -quotient
+    return quotient
+
+
+def fold_binary(op, left, right):
+    """ The value of left op right with the C semantics, None when it
+        is not known: unknown operands, division by zero, overflow
+    """
+    # the result of && and || is known from one side
+    if op == '&&':
+        if left == 0 or right == 0:
+            return 0
+        if left is None or right is None:
+            return None
+        return 1
+    if op == '||':
+        if (left is not None and left != 0) or (right is not None and right != 0):
+            return 1
+        if left is None or right is None:
+            return None
+        return 0
+
+    if left is None or right is None:
+        return None
+    integers = not isinstance(left, float) and not isinstance(right, float)
+
+    if op == '+':
+        value = left + right
+    elif op == '-':
+        value = left - right
+    elif op == '*':
+        value = left * right
+    elif op == '/':
+        if right == 0:
+            return None
+        value = c_division(left, right) if integers else left / right
+    elif op == '%':
+        if not integers or right == 0:
+            return None
+        value = left - c_division(left, right) * right
+    elif op in ('<', '>', '<=', '>=', '==', '!='):
+        value = int({
+            '<': left < right,
+            '>': left > right,
+            '<=': left <= right,
+            '>=': left >= right,
+            '==': left == right,
+            '!=': left != right,
+        }[op])
+    elif not integers:
+        return None
+    elif op in ('<<', '>>'):
+        if not 0 <= right < 32 or left < 0:
+            return None
+        value = left << right if op == '<<' else left >> right
+    elif op == '&':
+        value = left & right
+    elif op == '|':
+        value = left | right
+    elif op == '^':
+        value = left ^ right
+    else:
+        return None
+
+    if not isinstance(value, float) and not INT_MIN <= value <= INT_MAX:
+        return None
+    return value
+
+
+def fold_unary(op, value):
+    """ The value of op value, None when it is not known
+    """
+    if value is None:
+        return None
+    if op == '-':
+        value = -value
+    elif op == '+':
+        pass
+    elif op == '!':
+        value = int(value == 0)
+    elif op == '~' and not isinstance(value, float):
+        value = ~value
+    else:
+        return None
+    if not isinstance(value, float) and not INT_MIN <= value <= INT_MAX:
+        return None
+    return value
+
+
+def literal(value):
+    """ The functional code of a folded value
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Constants(object):
+    """ Forward constant propagation over the statements of a
+        functionDef, in the order they run.
+
+        The known values of the variables are kept in an environment,
+        name -> value, the variables missing from it are not known.
+        The branches of an if with an unknown condition start from
+        the same environment and are merged where they join. A loop
+        whose condition stays known is run at translation time, up to
+        a budget of statements; otherwise the variables it writes are
+        not known in it or after it.
+
+        func_ast does not keep the types of the declarations, so the
+        conversion of a value to the type of its variable, truncating
+        a float or wrapping an unsigned, is not known: the values of
+        the variables the function declares are not kept, nor the
+        floats, and the unsigned literals are not folded. The other
+        variables are the ints of the code blocks. The results:
+
+        values:
+            ID, BinaryOp, UnaryOp or ternary If -> its value, when it
+            is known where the expression is evaluated
+        conditions:
+            If -> whether its condition holds, when it is known
+            LetRec -> False when its condition does not hold the first
+            time it is tested
+    """
+
+    # statements run at translation time for a loop
+    budget = 10000
+
+    def __init__(self, function):
+        self.values = {}
+        self.conditions = {}
+        self.steps = 0
+        self.declared = declared_names(function)
+        self.items(function.block_items, {}, True)
+
+    def items(self, items, env, record):
+        for item in items or []:
+            if item is not None:
+                env = self.statement(item, env, record)
+                if env is None:
+                    return None
+        return env
+
+    def block(self, node, env, record):
+        """ items for the branch of an If: a Block, an else if or None
+        """
+        if isinstance(node, Block):
+            return self.items(node.block_items, env, record)
+        return self.items([node], env, record)
+
+    def statement(self, node, env, record):
+        """ The environment after the statement node. When record is
+            False the loops are being run, nothing is kept, and None is
+            returned as soon as a value the run depends on is unknown.
+        """
+        if not record:
+            self.steps += 1
+            if self.steps > self.budget:
+                return None
+
+        if isinstance(node, Let):
+            lvalue = node.lvalue
+            value = self.evaluate(node.rvalue, env, record)
+            if isinstance(lvalue, ArrayRef):
+                self.evaluate(lvalue.subscript, env, record)
+            elif isinstance(lvalue, (ID, str)):
+                name = symbol_name(lvalue)
+                if value is None or isinstance(value, float) or name in self.declared:
+                    env.pop(name, None)
+                else:
+                    env[name] = value
+            return env
+
+        if isinstance(node, If) and not node.tern:
+            condition = self.evaluate(node.cond, env, record)
+            if condition is not None:
+                condition = condition != 0
+            if record:
+                self.conditions[node] = condition
+
+            if condition is not None:
+                return self.block(node.iftrue if condition else node.iffalse, env, record)
+
+            true_env = self.block(node.iftrue, dict(env), record)
+            false_env = self.block(node.iffalse, dict(env), record)
+            if true_env is None or false_env is None:
+                return None
+            return dict(
+                (name, value) for name, value in true_env.items()
+                if name in false_env and false_env[name] == value and
+                type(false_env[name]) is type(value)
+            )
+
+        if isinstance(node, LetRec):
+            return self.loop(node, env, record)
+
+        self.evaluate(node, env, record)
+        return env
+
+    def loop(self, node, env, record):
+        if node.init is not None:
+            env = self.statement(node.init, env, record)
+            if env is None:
+                return None
+
+        first = None
+        if node.cond is not None:
+            first = self.evaluate(node.cond, env, False)
+        if first == 0:
+            if record:
+                self.conditions[node] = False
+            return env
+
+        # run the loop as long as its condition is known, the loops in
+        # it are run with the budget of the outermost one
+        if record:
+            self.steps = 0
+        run = dict(env)
+        while run is not None:
+            condition = None
+            if node.cond is not None:
+                condition = self.evaluate(node.cond, run, False)
+            if condition is None:
+                run = None
+            elif condition == 0:
+                break
+            else:
+                run = self.block(node.stmt, run, False)
+                if run is not None and node.next is not None:
+                    run = self.statement(node.next, run, False)
+        if not record:
+            return run
+
+        # in the loop, the variables it writes are not known
+        loop_env = dict(env)
+        for name in written_names(node):
+            loop_env.pop(name, None)
+        self.evaluate(node.cond, loop_env, True)
+        body_env = self.block(node.stmt, dict(loop_env), True)
+        if node.next is not None and body_env is not None:
+            self.statement(node.next, body_env, True)
+
+        if run is not None:
+            return run
+        return loop_env
+
+    def evaluate(self, expr, env, record):
+        """ The value of an expression in env, None when it is not
+            known. The expressions are walked with an explicit stack,
+            the values of the subexpressions are kept when record is
+            True.
+        """
+        if expr is None:
+            return None
+
+        values = {}
+        # (node, whether its operands are evaluated)
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                stack.append((node, True))
+                if isinstance(node, FuncCall):
+                    children = [node.args]
+                elif isinstance(node, ArrayRef):
+                    children = [node.subscript]
+                elif isinstance(node, Node):
+                    children = list(node)
+                else:
+                    children = []
+                for child in reversed(children):
+                    if child is not None:
+                        stack.append((child, False))
+                continue
+
+            value = None
+            if isinstance(node, Constant):
+                if not unsigned_literal(node.value):
+                    value = constant_value(node.value)
+            elif isinstance(node, ID):
+                value = env.get(node.name)
+            elif isinstance(node, BinaryOp):
+                value = fold_binary(node.op, values.get(node.left), values.get(node.right))
+            elif isinstance(node, UnaryOp):
+                value = fold_unary(node.op, values.get(node.expr))
+            elif isinstance(node, If) and node.tern:
+                condition = values.get(node.cond)
+                if condition is not None:
+                    value = values.get(node.iftrue if condition != 0 else node.iffalse)
+            values[node] = value
+
+            if record and value is not None and not isinstance(node, Constant):
+                self.values[node] = value
+        return values[expr]
+
+
+# functionDef -> Constants, computed once per function
+_constants = weakref.WeakKeyDictionary()
+
+
+def constants(function):
+    """ The Constants of a functionDef
+    """
+    return per_function(_constants, function, Constants)
+
+
+def folded(node, ctx):
+    """ The literal the optimized rendering writes for an expression
+        whose value is known, None for the others
+    """
+    if ctx.constants is None:
+        return None
+    value = ctx.constants.values.get(node)
+    if value is None:
+        return None
+    return literal(value)
+
+
+def dropped(node, live, known):
+    """ Whether the optimized rendering leaves out a statement: a
+        binding nothing reads, an if without else whose condition does
+        not hold, a loop without init that never runs, given the
+        Liveness and Constants of its functionDef (None when not
+        optimized).
+    """
+    if live is not None and live.dead(node):
+        return True
+    if known is None or known.conditions.get(node) is not False:
+        return False
+    if isinstance(node, If):
+        return node.iffalse is None
+    if isinstance(node, LetRec):
+        return node.init is None
+    return False
+
+
+#-----------------------------------------------------------------
+# Common subexpressions of a functionDef. The expressions are
+# hash-consed to value numbers: two occurrences get the same number
+# when they have the same structure and the variables they read
+# have not been written between them. The optimized rendering binds
+# the repeated ones once with a let.
+#-----------------------------------------------------------------
+
+class CommonSubexpressions(object):
+    """ Value numbering of the expressions of a functionDef, in the
+        order the statements run.
+
+        numbers:
+            the hash-consing table, (class, operator or value, numbers
+            of the operands) -> value number. The variables are numbered
+            with their version, bumped at every write.
+        scopes:
+            the statement lists being walked, innermost last, each
+            value number -> the Group of its occurrences in that list.
+            The occurrences of a number already seen in an enclosing
+            list join its group, as long as its variables are not
+            written in between.
+
+        Only BinaryOps and ArrayRefs reading at least a variable and
+        evaluated whenever their statement runs start a group: the
+        ones under the branches of a ternary if or the right operand
+        of && and || can only join one. The statements the optimized
+        rendering leaves out, the conditions and bodies of the loops
+        are not walked. The results:
+
+        names:
+            expression -> the variable holding its value
+        bindings:
+            statement -> [(variable, expression)] to bind before it
+    """
+
+    class Group(object):
+        __slots__ = ('index', 'anchor', 'size', 'occurrences')
+
+        def __init__(self, index, anchor, size):
+            self.index = index
+            self.anchor = anchor
+            self.size = size
+            self.occurrences = []
+
+    def __init__(self, function, live=None, known=None):
+        self.live = live
+        self.known = known
+
+        self.numbers = {}
+        self.versions = {}
+        self.clock = 0
+        # (name, version) before the writes, to undo them at the end
+        # of a branch
+        self.log = []
+
+        self.groups = []
+        self.scopes = []
+        self.items(function.block_items)
+
+        self.names = {}
+        self.bindings = {}
+        self.select(self.free_names(function))
+
+    # walk
+
+    def number(self, key):
+        try:
+            return self.numbers[key]
+        except KeyError:
+            result = self.numbers[key] = len(self.numbers)
+            return result
+
+    def write(self, name):
+        self.log.append((name, self.versions.get(name)))
+        self.clock += 1
+        self.versions[name] = self.clock
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            name, version = self.log.pop()
+            if version is None:
+                del self.versions[name]
+            else:
+                self.versions[name] = version
+
+    def items(self, items):
+        self.scopes.append({})
+        for item in items or []:
+            if item is not None:
+                self.statement(item)
+        self.scopes.pop()
+
+    def branch(self, node):
+        """ Walks the branch of an If, the writes in it are undone
+        """
+        mark = len(self.log)
+        if isinstance(node, Block):
+            self.items(node.block_items)
+        elif node is not None:
+            self.items([node])
+        self.undo(mark)
+
+    def statement(self, node):
+        if isinstance(node, Let):
+            if not dropped(node, self.live, self.known):
+                self.expression(node.rvalue, node)
+                if isinstance(node.lvalue, ArrayRef):
+                    self.expression(node.lvalue.subscript, node)
+            for name in written_names(node):
+                self.write(name)
+            return
+
+        if isinstance(node, If) and not node.tern:
+            if not dropped(node, self.live, self.known):
+                condition = None
+                if self.known is not None:
+                    condition = self.known.conditions.get(node)
+                if condition is None:
+                    self.expression(node.cond, node)
+                    self.branch(node.iftrue)
+                    self.branch(node.iffalse)
+                else:
+                    self.branch(node.iftrue if condition else node.iffalse)
+
+        elif isinstance(node, LetRec):
+            if node.init is not None:
+                self.statement(node.init)
+                # bound before the loop, with its init
+                for group in self.scopes[-1].values():
+                    if group.anchor is node.init:
+                        group.anchor = node
+            never = self.known is not None and self.known.conditions.get(node) is False
+            if not dropped(node, self.live, self.known) and not never:
+                # in the body, only what the loop does not write is
+                # known from before it
+                mark = len(self.log)
+                for name in written_names(node):
+                    self.write(name)
+                self.branch(node.stmt)
+                self.undo(mark)
+
+        for name in written_names(node):
+            self.write(name)
+
+    def expression(self, expr, anchor):
+        """ Numbers the expression expr of the statement anchor, walked
+            with an explicit stack, and adds its occurrences to groups
+        """
+        if expr is None:
+            return
+
+        # node -> (value number, size, whether it reads a variable),
+        # number None for the expressions that cannot be shared
+        numbered = {}
+        # (node, whether its operands are numbered, guarded)
+        stack = [(expr, False, False)]
+        while stack:
+            node, ready, guarded = stack.pop()
+            if not ready:
+                stack.append((node, True, guarded))
+                if isinstance(node, BinaryOp):
+                    # the right operand of && and || is not always evaluated
+                    short = node.op in ('&&', '||')
+                    stack.append((node.right, False, guarded or short))
+                    stack.append((node.left, False, guarded))
+                elif isinstance(node, If):
+                    stack.append((node.iffalse, False, True))
+                    stack.append((node.iftrue, False, True))
+                    stack.append((node.cond, False, guarded))
+                elif isinstance(node, Node):
+                    for child in reversed(list(node)):
+                        stack.append((child, False, guarded))
+                continue
+
+            number, size, reads = None, 1, False
+            if node is None:
+                pass
+            elif self.known is not None and node in self.known.values:
+                number = self.number(('value', self.known.values[node]))
+            elif isinstance(node, Constant):
+                number = self.number(('Constant', node.value))
+            elif isinstance(node, ID):
+                number = self.number(('ID', node.name, self.versions.get(node.name, 0)))
+                reads = True
+            elif isinstance(node, (BinaryOp, ArrayRef, UnaryOp)):
+                operands = [numbered[child] for child in node]
+                if all(operand[0] is not None for operand in operands):
+                    number = self.number(
+                        (node.__class__.__name__, getattr(node, 'op', None)) +
+                        tuple(operand[0] for operand in operands))
+                    size += sum(operand[1] for operand in operands)
+                    reads = any(operand[2] for operand in operands)
+            numbered[node] = (number, size, reads)
+
+            if number is None or not reads or not isinstance(node, (BinaryOp, ArrayRef)):
+                continue
+            group = None
+            for scope in reversed(self.scopes):
+                group = scope.get(number)
+                if group is not None:
+                    break
+            if group is None:
+                if guarded:
+                    continue
+                group = self.scopes[-1][number] = self.Group(len(self.groups), anchor, size)
+                self.groups.append(group)
+            group.occurrences.append(node)
+
+    # results
+
+    def free_names(self, function):
+        """ Yields the names cse0, cse1, ... not used by the function
+        """
+        used = set(read_names(function.block_items))
+        used.update(written_names(function))
+        used.update(symbol_name(arg) for arg in function.input_args)
+        index = 0
+        while True:
+            name = "cse%d" % index
+            index += 1
+            if name not in used:
+                yield name
+
+    def select(self, names):
+        """ Binds the groups with at least two occurrences, the largest
+            expressions first: the expressions in an occurrence replaced
+            by a variable are not counted, except in the one computing it.
+        """
+        covered = set()
+        selected = []
+        for group in sorted(self.groups, key=lambda group: -group.size):
+            occurrences = [node for node in group.occurrences if node not in covered]
+            if len(occurrences) < 2:
+                continue
+            group.occurrences = occurrences
+            selected.append(group)
+            for occurrence in occurrences[1:]:
+                stack = list(occurrence)
+                while stack:
+                    node = stack.pop()
+                    if isinstance(node, Node):
+                        covered.add(node)
+                        stack.extend(node)
+
+        selected.sort(key=lambda group: group.index)
+        for group in selected:
+            name = next(names)
+            for occurrence in group.occurrences:
+                self.names[occurrence] = name
+            self.bindings.setdefault(group.anchor, []).append((name, group.occurrences[0]))
+
+
+# functionDef -> CommonSubexpressions, computed once per function
+_common_subexpressions = weakref.WeakKeyDictionary()
+
+
+def common_subexpressions(function):
+    """ The CommonSubexpressions of a functionDef, the statements and
+        expressions its optimized rendering leaves out not counted
+    """
+    def build(function):
+        return CommonSubexpressions(function, liveness(function), constants(function))
+    return per_function(_common_subexpressions, function, build)
+
+
+def common(node, ctx):
+    """ The variable the optimized rendering writes for a common
+        subexpression, None for the other expressions
+    """
+    if ctx.cse is None:
+        return None
+    return ctx.cse.names.get(node)
+
+
+def bindings_str(statement, ctx):
+    """ The lets of the common subexpressions bound before a statement,
+        and their number. Each let indents what follows, like the
+        other lets.
+    """
+    if ctx.cse is None:
+        return "", 0
+    string = ""
+    bindings = ctx.cse.bindings.get(statement, ())
+    for name, expr in bindings:
+        string += ctx.current_tab_index * "  "
+        string += "let %s = %s in \n" % (name, expr.render(ctx, expand=True))
+        ctx.current_tab_index += 1
+    return string, len(bindings)
+
+
 
 
 # class ArrayDecl(Node):
@@ -3,29 +3,180 @@ from pycparser import (
     c_ast
 )
 
+from array import array
+
 import minic.c_ast_to_minic as ctoc
 import minic.minic_ast as mast
 
 
-class NodeVisitor(mast.NodeVisitor):
+class SymbolTable(object):
+    '''
+    Interns the variables of a function to small integers, in the order they
+    are first seen. Sets of variables are int bitsets of these integers, and
+    list their variables in that order.
+    '''
 
     def __init__(self):
+        self.indexes = {}
+        self.symbols = []
+
+    def intern(self, name):
+        try:
+            return self.indexes[name]
+        except KeyError:
+            index = self.indexes[name] = len(self.symbols)
+            self.symbols.append(name)
+            return index
+
+    def bit(self, name):
+        return 1 << self.intern(name)
+
+    def bitset(self, names):
+        bits = 0
+        for name in names:
+            bits |= 1 << self.intern(name)
+        return bits
+
+    def names(self, bits):
+        '''
+        The variables of a bitset, in the order of the symbols
+        '''
+        names = []
+        while bits:
+            low = bits & -bits
+            names.append(self.symbols[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+
+# kinds of the entries of an OrderTable
+READ = 0
+WRITE = 1
+
+
+class OrderTable(object):
+    '''
+    The order a NodeVisitor sees the variables written and the variables
+    read outside of assignments, as parallel arrays of symbols of a
+    SymbolTable:
+        kinds: READ or WRITE
+        lefthands: the variable written or read
+        offsets: the dependencies of the entry i are the ones between
+            offsets[i] and offsets[i + 1]
+        dependencies: the variables the written ones depend on, in order
+        reads_before: the number of READ entries before each entry
+
+    Iterating gives the entries as [lefthand, dependencies] lists, with
+    'if' as the lefthand of the variables read.
+    '''
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.kinds = array('b')
+        self.lefthands = array('i')
+        self.offsets = array('i', [0])
+        self.dependencies = array('i')
+        self.reads_before = array('i')
+        self.reads = 0
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add_read(self, name):
+        self.kinds.append(READ)
+        self.lefthands.append(self.symbols.intern(name))
+        self.offsets.append(len(self.dependencies))
+        self.reads_before.append(self.reads)
+        self.reads += 1
+
+    def add_write(self, lefthand, dependencies):
+        intern = self.symbols.intern
+        self.kinds.append(WRITE)
+        self.lefthands.append(intern(lefthand))
+        self.dependencies.extend([intern(dependency) for dependency in dependencies])
+        self.offsets.append(len(self.dependencies))
+        self.reads_before.append(self.reads)
+
+    def section(self, start, end):
+        '''
+        A new OrderTable, with the same symbols, of the entries from start
+        to end
+        '''
+        table = OrderTable(self.symbols)
+        first, last = self.offsets[start], self.offsets[end]
+        table.kinds = self.kinds[start:end]
+        table.lefthands = self.lefthands[start:end]
+        table.offsets = array('i', [offset - first for offset in self.offsets[start:end + 1]])
+        table.dependencies = self.dependencies[first:last]
+        reads = self.reads_before[start] if start < len(self.kinds) else self.reads
+        table.reads_before = array('i', [count - reads for count in self.reads_before[start:end]])
+        table.reads = (self.reads_before[end] if end < len(self.kinds) else self.reads) - reads
+        return table
+
+    def bits(self, start, end):
+        '''
+        (variable_bits, written_bits) of the entries from start to end: the
+        bitsets of all their variables, and of the written ones
+        '''
+        variable_bits = written_bits = 0
+        kinds, lefthands, offsets, dependencies = self.kinds, self.lefthands, self.offsets, self.dependencies
+        for index in range(start, end):
+            bit = 1 << lefthands[index]
+            variable_bits |= bit
+            if kinds[index] == WRITE:
+                written_bits |= bit
+                for dependency in dependencies[offsets[index]:offsets[index + 1]]:
+                    variable_bits |= 1 << dependency
+        return variable_bits, written_bits
+
+    def entry_dependencies(self, index):
+        return self.dependencies[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        names = self.symbols.symbols
+        for index in range(len(self.kinds)):
+            lefthand = names[self.lefthands[index]]
+            if self.kinds[index] == READ:
+                yield ['if', lefthand]
+            else:
+                yield [lefthand, [names[symbol] for symbol in self.entry_dependencies(index)]]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class NodeVisitor(mast.NodeVisitor):
+
+    def __init__(self, symbols=None):
         self.assignment = {}
         self.other = []
         self.decl = {}
 
-        # the order that we see items on the left hand side
-        self.order = []
+        # ('assignment' or 'decl', lefthand) in the order they are first written
+        self.written_order = []
 
         self.loop = []
 
+        # the visitors of the blocks of a function share its symbols
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+
+        # the order that we see items on the left hand side
+        self.order = OrderTable(symbols)
+
+        # bitsets of all the variables seen, and of the written ones
+        self.variable_bits = 0
+        self.written_bits = 0
+
     def visit_ID(self, node):
         '''
         For example if statement vars
         '''
-        self.order.append(['if', node.name])
-
-        self.other.append(node.name)
+        self.add_read(node.name)
 
     def visit_For(self, node):
         """
@@ -48,40 +199,207 @@ class NodeVisitor(mast.NodeVisitor):
 
 
         if not isinstance(node.type, mast.FuncDecl):
-            lefthand = node.name
-            righthand = node.init
+            self.add_decl(node.name, assignment_value_helper(node.init))
 
+    def visit_Assignment(self, assignment):
+        self.add_assignment(lvalue_name(assignment.lvalue), assignment_value_helper(assignment.rvalue))
 
-            values = assignment_value_helper(node.init)
+    # The facts are recorded by the methods below, they can also be called
+    # directly by a translation that does not walk a minic tree.
 
-            if not lefthand in self.decl.keys():
-                self.decl[lefthand] = {'Constants': [], 'IDs': [], 'ArrayRef': [], 'count': 0}
+    def add_read(self, name):
+        '''
+        A variable read outside of an assignment
+        '''
+        self.order.add_read(name)
 
-            rh_info = assignment_value_helper(righthand)
+        self.other.append(name)
+        self.variable_bits |= self.symbols.bit(name)
 
-            self.decl[lefthand]['IDs'].append(rh_info['IDs'])
-            self.decl[lefthand]['Constants'].append(rh_info['Constants'])
-            self.decl[lefthand]['ArrayRef'].append(rh_info['ArrayRef'])
-            self.decl[lefthand]['count'] += 1
+    def add_decl(self, lefthand, rh_info):
+        '''
+        int lefthand = ...; rh_info is the assignment_value_helper map of the init
+        '''
+        self.add_written('decl', lefthand, rh_info)
+
+    def add_assignment(self, lefthand, rh_info):
+        '''
+        lefthand = ...; rh_info is the assignment_value_helper map of the rvalue
+        '''
+        self.add_written('assignment', lefthand, rh_info)
 
-            self.order.append([lefthand, rh_info['IDs'] + rh_info['ArrayRef']])
+    def add_written(self, kind, lefthand, rh_info):
+        written = getattr(self, kind)
 
-    def visit_Assignment(self, assignment):
+        if not lefthand in written:
+            written[lefthand] = {'Constants': [], 'IDs': [], 'ArrayRef': [], 'count': 0}
+            self.written_order.append((kind, lefthand))
 
-        lefthand = assignment.lvalue
-        righthand = assignment.rvalue
+        symbols = self.symbols
+        bit = symbols.bit(lefthand)
+        self.written_bits |= bit
+        self.variable_bits |= bit | symbols.bitset(rh_info['IDs']) | symbols.bitset(rh_info['ArrayRef'])
 
-        if not lefthand.name in self.assignment.keys():
-            self.assignment[lefthand.name] = {'Constants': [], 'IDs': [], 'ArrayRef': [], 'count': 0}
+        written[lefthand]['IDs'].append(rh_info['IDs'])
+        written[lefthand]['Constants'].append(rh_info['Constants'])
+        written[lefthand]['ArrayRef'].append(rh_info['ArrayRef'])
+        written[lefthand]['count'] += 1
 
-        rh_info = assignment_value_helper(righthand)
+        self.order.add_write(lefthand, rh_info['IDs'] + rh_info['ArrayRef'])
 
-        self.assignment[lefthand.name]['IDs'].append(rh_info['IDs'])
-        self.assignment[lefthand.name]['Constants'].append(rh_info['Constants'])
-        self.assignment[lefthand.name]['ArrayRef'].append(rh_info['ArrayRef'])
-        self.assignment[lefthand.name]['count'] += 1
+    def bits(self, symbols):
+        '''
+        (variable_bits, written_bits) with the given symbols
+        '''
+        if symbols is self.symbols:
+            return self.variable_bits, self.written_bits
+        return (symbols.bitset(self.symbols.names(self.variable_bits)),
+                symbols.bitset(self.symbols.names(self.written_bits)))
+
+
+def statement_children(node):
+    '''
+    The statements directly inside a compound statement, None for other nodes
+    '''
+    if isinstance(node, mast.Block):
+        return [item for item in node.block_items or [] if item is not None]
+    elif isinstance(node, mast.If):
+        return [block for block in (node.iftrue, node.iffalse) if block is not None]
+    elif isinstance(node, (mast.For, mast.While)):
+        return [node.stmt]
+    return None
+
+
+class StatementFacts(object):
+    '''
+    The facts of a statement inside the block collect_facts walked: its
+    entries are the ones from start to end of the order of the NodeVisitor
+    of the block, with its bitsets. The other facts of a NodeVisitor are
+    computed when they are asked for.
+    '''
+    __slots__ = ('block_nvs', 'node', 'start', 'end', 'variable_bits', 'written_bits', '_visitor')
+
+    def __init__(self, block_nvs, node, start, end, variable_bits, written_bits):
+        self.block_nvs = block_nvs
+        self.node = node
+        self.start = start
+        self.end = end
+        self.variable_bits = variable_bits
+        self.written_bits = written_bits
+        self._visitor = None
+
+    @property
+    def symbols(self):
+        return self.block_nvs.symbols
+
+    @property
+    def order(self):
+        return self.block_nvs.order.section(self.start, self.end)
+
+    def visitor(self):
+        '''
+        A NodeVisitor of the statement alone, with the symbols of the block
+        '''
+        if self._visitor is None:
+            self._visitor = NodeVisitor(self.symbols)
+            self._visitor.visit(self.node)
+        return self._visitor
 
-        self.order.append([lefthand.name, rh_info['IDs'] + rh_info['ArrayRef']])
+    @property
+    def other(self):
+        return self.visitor().other
+
+    @property
+    def assignment(self):
+        return self.visitor().assignment
+
+    @property
+    def decl(self):
+        return self.visitor().decl
+
+    @property
+    def written_order(self):
+        return self.visitor().written_order
+
+    bits = NodeVisitor.__dict__['bits']
+
+
+def collect_facts(root, symbols=None):
+    '''
+    Maps root and every statement below it to its facts: the NodeVisitor
+    of root, and the StatementFacts of the statements below.
+
+    root is walked once, by its NodeVisitor, in the order of a single
+    visit. Every statement keeps the range of its entries in the order of
+    that NodeVisitor; the bitsets of blocks, ifs and loops are merged from
+    the ones of their statements and the entries between them (the
+    condition of an if), so that no entry is looked at twice.
+    '''
+    nvs = NodeVisitor(symbols)
+    order = nvs.order
+
+    facts = {}
+    # node -> the index of its first entry
+    starts = {}
+
+    # a (node,) tuple on the stack is a node whose statements are done
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple):
+            node = node[0]
+            start, end = starts.pop(node), len(order)
+
+            # the bitsets of the statements, and of the entries around them
+            variable_bits = written_bits = 0
+            position = start
+            for child in statement_children(node):
+                child_facts = facts.get(child)
+                if child_facts is None:
+                    continue
+                gap_variables, gap_written = order.bits(position, child_facts.start)
+                variable_bits |= gap_variables | child_facts.variable_bits
+                written_bits |= gap_written | child_facts.written_bits
+                position = child_facts.end
+            gap_variables, gap_written = order.bits(position, end)
+
+            facts[node] = StatementFacts(
+                nvs, node, start, end, variable_bits | gap_variables, written_bits | gap_written)
+            continue
+
+        start = len(order)
+        children = statement_children(node)
+        if children is None:
+            nvs.visit(node)
+            variable_bits, written_bits = order.bits(start, len(order))
+            facts[node] = StatementFacts(nvs, node, start, len(order), variable_bits, written_bits)
+            continue
+
+        if isinstance(node, (mast.For, mast.While)) and not isinstance(node.stmt, mast.Block):
+            # loops only visit the children of their body, the body alone is
+            # visited as a statement of its own
+            NodeVisitor.generic_visit(nvs, node.stmt)
+            variable_bits, written_bits = order.bits(start, len(order))
+            facts[node] = StatementFacts(nvs, node, start, len(order), variable_bits, written_bits)
+            facts[node.stmt] = NodeVisitor(nvs.symbols)
+            facts[node.stmt].visit(node.stmt)
+            continue
+
+        starts[node] = start
+        stack.append((node,))
+        if isinstance(node, mast.If):
+            # the condition is visited before the blocks
+            nvs.visit(node.cond)
+        elif isinstance(node, (mast.For, mast.While)):
+            # the body of a loop starts where the loop does
+            starts[node.stmt] = start
+            stack.append((node.stmt,))
+            children = statement_children(node.stmt)
+        stack.extend(reversed(children))
+
+    # the NodeVisitor walked root
+    facts[root] = nvs
+    return facts
 
 
 class FunctionPrototype:
@@ -111,6 +429,16 @@ class FunctionPrototype:
         return str_out
 
 
+def lvalue_name(lvalue):
+    '''
+    The variable an assignment to lvalue writes: the variable, or the array
+    of array[subscript], by name
+    '''
+    while isinstance(lvalue, mast.ArrayRef):
+        lvalue = lvalue.name
+    return lvalue.name
+
+
 def assignment_value_helper(value, value_map=None):
     '''
     This returns information on right side of assignment
@@ -126,34 +454,38 @@ def assignment_value_helper(value, value_map=None):
             'ArrayRef': [],
         }
 
-    # constant like 10
-    if isinstance(value, mast.Constant):
-        value_map['Constants'].append(value.value)
+    # the expression is walked with an explicit stack, long chains of
+    # binary operators would otherwise hit the recursion limit
+    # a (name,) tuple on the stack is an array whose subscript is done
+    stack = [value]
+    while stack:
+        value = stack.pop()
 
-    # var like a
-    elif isinstance(value, mast.ID):
-        value_map['IDs'].append(value.name)
+        # array name, added after the values of its subscript
+        if isinstance(value, tuple):
+            value_map['ArrayRef'].append(value[0])
 
-    # left op right
-    elif isinstance(value, mast.BinaryOp):
-        left = value.left
-        op = value.op
-        right = value.right
-        #print(left, right)
-        # call recursively on the left and right values of the operater
-        value_map = assignment_value_helper(left, value_map)
-        value_map = assignment_value_helper(right, value_map)
+        # constant like 10
+        elif isinstance(value, mast.Constant):
+            value_map['Constants'].append(value.value)
 
-    elif isinstance(value, mast.ArrayRef):
-        # array[subscript]
-        subscript = value.subscript
-        array = value.name
+        # var like a
+        elif isinstance(value, mast.ID):
+            value_map['IDs'].append(value.name)
 
-        # call recursively on the array subscript
-        value_map = assignment_value_helper(subscript, value_map)
+        # left op right
+        elif isinstance(value, mast.BinaryOp):
+            # visit the left values of the operator before the right ones
+            stack.append(value.right)
+            stack.append(value.left)
 
-        value_map['ArrayRef'].append(array.name)
+        elif isinstance(value, mast.ArrayRef):
+            # array[subscript]
+            subscript = value.subscript
 
+            # the subscript values come before the array
+            stack.append((lvalue_name(value.name),))
+            stack.append(subscript)
 
     return value_map
 
@@ -162,7 +494,14 @@ def get_vars_and_written(vs, remove_dups=True):
     '''
     Print all variables in the input and specify which are
     written variables (on the left hand side)
+
+    Without duplicates, the variables are listed in the order of the
+    symbols of vs.
     '''
+    if remove_dups:
+        symbols = vs.symbols
+        return symbols.names(vs.variable_bits), symbols.names(vs.written_bits)
+
     variables = []
     written_variables = []
 
@@ -200,22 +539,16 @@ def get_vars_and_written(vs, remove_dups=True):
     # add all other variables (ex if statements, while, etc)
     variables += vs.other
 
-
-    if remove_dups:
-        # variables may be called more than once
-        # remove the dups
-        variables = list(set(variables))
-        written_variables = list(set(written_variables))
-
     return variables, written_variables
 
+
 def get_args_and_output(vs):
 
-    variables, written_variables = get_vars_and_written(vs)
-    arguments = [x for x in variables if x not in written_variables]
-    output = written_variables
+    symbols = vs.symbols
+    arguments = symbols.names(vs.variable_bits & ~vs.written_bits)
+    written_variables = symbols.names(vs.written_bits)
 
-    for lefthand in vs.assignment:
+    for lefthand in symbols.names(symbols.bitset(vs.assignment)):
         if lefthand in vs.assignment[lefthand]['IDs'][0]:
             arguments.append(lefthand)
 
@@ -223,133 +556,105 @@ def get_args_and_output(vs):
 
 
 def get_depending_vars(item, vs):
-
-    dependencies = []
-
+    '''
+    The variables the item depends on, in the order of the symbols of vs
+    '''
     if item in vs.decl:
         righthand = vs.decl[item]
     elif item in vs.assignment:
         righthand = vs.assignment[item]
     else:
-        return dependencies
-
-    for expr in righthand['IDs']:
-        for subvar in expr:
-            dependencies.append(subvar)
-    for expr in righthand['ArrayRef']:
-        for sub_array in expr:
-            dependencies.append(sub_array)
+        return []
 
-    return dependencies
+    symbols = vs.symbols
+    bits = 0
+    for expr in righthand['IDs'] + righthand['ArrayRef']:
+        bits |= symbols.bitset(expr)
+    return symbols.names(bits)
 
 
-def get_variable_reductions(vs):
+def def_use_sets(order):
+    '''
+    Def-use facts of the OrderTable of a NodeVisitor, in one backward sweep.
+    Returns two sets of indexes in order:
+        used_later: the variable of the entry is used by a later entry
+        redefined_later: the entry depends on a variable written by a later entry
+    '''
+    used_later = set()
+    redefined_later = set()
 
+    kinds, lefthands, offsets, dependencies = order.kinds, order.lefthands, order.offsets, order.dependencies
 
-    #TODO: var is overwriten before used, remove old definision
+    # bitsets of what the entries after index use and write
+    uses = 0
+    written = 0
 
-    # initially all vars are available to be reduced
-    # this list will contain the index of vars to be pruned
-    not_eligable = []
+    for index in range(len(kinds) - 1, -1, -1):
+        bit = 1 << lefthands[index]
 
-    # 1. To first qualify, a variable must never be used after declared
-        # check subsequent declartions and assignments
-    index = 0
-    for item in vs.order:
-        var = item[0]
-
-        if index == len(vs.order) - 1:
-            # no more following declarations/assignments
-            break
-        elif var == 'if':
-            not_eligable.append(index)
-            index += 1
-            continue # we dont support if reductions yet
+        if kinds[index] == READ:
+            # a variable read in an if
+            uses |= bit
+            continue
 
-        for next_item in vs.order[index+1:]:
-            next_var = next_item[0]
-            next_dependencies = next_item[1]
+        if bit & uses:
+            used_later.add(index)
 
-            if next_dependencies == None:
-                continue
-            elif next_var == 'if':
-                if next_dependencies == var:
-                    not_eligable.append(index)
-            else:
-                for expr in next_dependencies:
-                    for subvar in expr:
-                        if subvar == var:
-                            not_eligable.append(index)
-        index += 1
-
-
-    # 2. check if the variable depends on something that is later reasigned
-    index = 0
-    for item in vs.order:
-        var = item[0]
-        dependencies = item[1]
-
-        if index == len(vs.order) - 1:
-            # no more following declarations/assignments
-            break
-        elif var == 'if':
-            not_eligable.append(index)
-            index += 1
-            continue # we dont support if reductions yet
-
-        for next_item in vs.order[index+1:]:
-            next_var = next_item[0]
-            next_dependencies = next_item[1]
+        for dependency in dependencies[offsets[index]:offsets[index + 1]]:
+            dependency_bit = 1 << dependency
+            if dependency_bit & written:
+                redefined_later.add(index)
+            uses |= dependency_bit
+        written |= bit
 
-            if next_dependencies == None or next_var == 'if':
-                continue # we assume no assignments in a if
-            else:
-                if next_var in dependencies:
-                    not_eligable.append(index)
+    return used_later, redefined_later
 
-        index += 1
 
+def get_variable_reductions(vs):
+    '''
+    The set of the indexes in vs.order of the variables that can be reduced:
+    never used after being written and not depending on a variable that is
+    later reassigned.
+    '''
 
+    #TODO: var is overwriten before used, remove old definision
 
-    eligable = []
-    offset = 0
+    used_later, redefined_later = def_use_sets(vs.order)
 
-    for index in range(len(vs.order)):
-        if index not in not_eligable:
-            eligable.append(index)
+    eligable = set()
+    kinds = vs.order.kinds
+    last = len(kinds) - 1
+    for index, kind in enumerate(kinds):
+        # no more following declarations/assignments after the last one
+        if index == last:
+            eligable.add(index)
+        elif kind == READ:
+            continue # we dont support if reductions yet
+        elif index not in used_later and index not in redefined_later:
+            eligable.add(index)
 
     return eligable
 
 
-
-
-
-
 def get_variable_constants(vs):
+    '''
+    The set of the indexes in vs.order of the variables written with
+    constants only, the last entry excepted.
+    '''
 
     # these vars are defined once as a constant and then used later
     # and never redefined
 
-    eligable = []
+    eligable = set()
+    kinds, offsets = vs.order.kinds, vs.order.offsets
 
     # 1. To first qualify, a variable must never be used after declared
         # check subsequent declartions and assignments
-    index = 0
-    for item in vs.order:
-        var = item[0]
-        dependencies = item[1]
-
-        if index == len(vs.order) - 1:
-            # no more following declarations/assignments
-            break
-        elif var == 'if':
-            index += 1
+    for index in range(len(kinds) - 1):
+        if kinds[index] == READ:
             continue # we dont support if reductions yet
-
-        elif dependencies != None and len(dependencies) == 0:
-            eligable.append(index)
-
-        index += 1
+        elif offsets[index] == offsets[index + 1]:
+            eligable.add(index)
 
     return eligable
 
@@ -358,34 +663,11 @@ def remove_if_statements(var_order, never_used, var_constants):
     """
     removes if statements and updates the indexes
     """
-    offset = 0
-    index = 0
-
-    if_indexes = []
-
-    for item in var_order:
-        var = item[0]
-        dep = item[1]
-
-        if var == 'if':
-            # remove the if
-            if len(never_used) and index in never_used:
-                never_used.remove(index)
-            if len(var_constants) and index in var_constants:
-                var_constants.remove(index)
-
-            if_indexes.append(index)
-        index += 1
-
-    # update indexes
-    for i in range(len(never_used)):
-        index = never_used[i]
-        offset = len([x for x in if_indexes if x < index])
-        never_used[i] -= offset
-    for i in range(len(var_constants)):
-        index = var_constants[i]
-        offset = len([x for x in if_indexes if x < index])
-        var_constants[i] -= offset
+    # once the ifs are removed, an entry moves back by the number of ifs before it
+    kinds, reads_before = var_order.kinds, var_order.reads_before
+
+    never_used = set(index - reads_before[index] for index in never_used if kinds[index] == WRITE)
+    var_constants = set(index - reads_before[index] for index in var_constants if kinds[index] == WRITE)
 
     return never_used, var_constants
 
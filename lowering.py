@@ -0,0 +1,437 @@
+#-----------------------------------------------------------------
+#
+# Fused lowering from PyCparser ASTs to functional ASTs.
+#
+# convertc2f translates a file in three walks that each build or
+# read a whole tree: ctoc.transform converts the PyCparser tree to
+# a minic tree, functions.NodeVisitor gathers the variables read and
+# written by every block, and transform_ctf builds the func_ast
+# nodes. The lowering below does the three in a single walk of the
+# PyCparser tree, without building the minic tree, and renders the
+# same functional code as BlockVisitor.
+#
+# Constructs that the lowering does not know about (return, do
+# while, declarations lists, ...) are rare in our inputs: only their
+# own subtree goes through minic, like in convertc2f.
+#-----------------------------------------------------------------
+
+from pycparser import c_ast
+
+import func_ast as fast
+import minic.c_ast_to_minic as ctoc
+from minic.parse_cache import read_source, shared_parser
+import functions
+from functions import NodeVisitor, get_vars_and_written
+from convertc2f import (
+    FunctionBlock,
+    Nothing,
+    block_context,
+    if_arguments,
+    loop_arguments,
+    tm,
+    transform_ctf,
+)
+
+v = ctoc.v
+
+
+def check_supported(x):
+    """
+    Raises ErrorUnsupportedConstruct where ctoc.transform(x) would, without
+    converting x.
+    """
+    stack = [x]
+    while stack:
+        orig = stack.pop()
+        handler = ctoc.transformers.get(orig.__class__)
+        if handler is None:
+            ctoc.unsupported(orig)
+            continue
+        children = getattr(handler, 'children', None)
+        if children is not None:
+            stack.extend(children(orig))
+
+
+def lvalue_name(lvalue):
+    """
+    The name NodeVisitor records for an assignment to lvalue: the variable,
+    or the array of array[subscript].
+    """
+    while lvalue.__class__ is c_ast.ArrayRef:
+        lvalue = lvalue.name
+    if lvalue.__class__ is c_ast.ID:
+        return lvalue.name
+    return functions.lvalue_name(ctoc.transform(lvalue))
+
+
+def value_info(*values):
+    """
+    functions.assignment_value_helper of the minic conversion of the values,
+    one after the other.
+    """
+    value_map = {
+        'Constants': [],
+        'IDs': [],
+        'ArrayRef': [],
+    }
+
+    stack = list(values)
+    stack.reverse()
+    while stack:
+        value = stack.pop()
+        cls = value.__class__
+
+        # array name, added after the values of its subscript
+        if cls is tuple:
+            value_map['ArrayRef'].append(value[0])
+
+        elif cls is c_ast.Constant:
+            value_map['Constants'].append(value.value)
+
+        elif cls is c_ast.ID:
+            value_map['IDs'].append(value.name)
+
+        elif cls is c_ast.BinaryOp:
+            stack.append(value.right)
+            stack.append(value.left)
+
+        elif cls is c_ast.ArrayRef:
+            stack.append((lvalue_name(value.name),))
+            stack.append(value.subscript)
+
+    return value_map
+
+
+def lowering(children, build):
+    """
+    Handler of a node with children. children(orig, nvss) returns (state,
+    pairs): pairs of a child and the NodeVisitors that see it, and the state
+    that build needs besides the lowered children. build(orig, state,
+    *lowered_children) then makes the functional node.
+
+    nvss are the NodeVisitors that would visit orig in convertc2f, the
+    handlers record the facts of orig on them.
+    """
+    def handler(orig, nvss=()):
+        state, pairs = children(orig, nvss)
+        return build(orig, state, *[lower(child, child_nvss) for child, child_nvss in pairs])
+    handler.children = children
+    handler.build = build
+    return handler
+
+
+def lower_id(orig, nvss):
+    for nvs in nvss:
+        nvs.add_read(orig.name)
+    return fast.ID(v(orig.name))
+
+
+def assignment_children(orig, nvss):
+    if orig.op == '=':
+        rh_info = value_info(orig.rvalue)
+        pairs = ((orig.lvalue, ()), (orig.rvalue, ()))
+    else:
+        # the lvalue is also the left operand of the rvalue
+        rh_info = value_info(orig.lvalue, orig.rvalue)
+        pairs = ((orig.lvalue, ()), (orig.lvalue, ()), (orig.rvalue, ()))
+
+    if nvss:
+        name = lvalue_name(orig.lvalue)
+        for nvs in nvss:
+            nvs.add_assignment(name, rh_info)
+    return None, pairs
+
+
+def build_assignment(orig, state, lvalue, *rest):
+    if orig.op == '=':
+        rvalue, = rest
+    else:
+        left, right = rest
+        rvalue = fast.BinaryOp(ctoc.compound_assignment_ops[orig.op], left, right)
+    return fast.Let(lvalue, rvalue, coord=orig.coord)
+
+
+def unary_children(orig, nvss):
+    if orig.op in ctoc.increment_ops:
+        if nvss:
+            rh_info = value_info(orig.expr)
+            rh_info['Constants'].append('1')
+            name = lvalue_name(orig.expr)
+            for nvs in nvss:
+                nvs.add_assignment(name, rh_info)
+        return None, ((orig.expr, ()), (orig.expr, ()))
+    return None, ((tm(orig.expr), nvss),)
+
+
+def build_unary(orig, state, expr, *rest):
+    # increments become assignments
+    if orig.op in ctoc.increment_ops:
+        left, = rest
+        return fast.Let(expr, fast.BinaryOp(ctoc.increment_ops[orig.op], left, fast.Constant('1')))
+    return fast.UnaryOp(orig.op, expr)
+
+
+def decl_children(orig, nvss):
+    check_supported([orig.funcspec, orig.type])
+    if nvss:
+        rh_info = value_info(orig.init)
+        for nvs in nvss:
+            nvs.add_decl(orig.name, rh_info)
+    return None, ((orig.init, ()),)
+
+
+def lower_decl(orig, nvss=()):
+    # function prototypes are left to minic
+    if isinstance(orig.type, c_ast.FuncDecl):
+        return lower_unsupported(orig, nvss)
+    return lower_variable_decl(orig, nvss)
+
+lower_variable_decl = lowering(
+    decl_children,
+    lambda orig, state, init: fast.Let(orig.name, init, coord=orig.coord))
+
+
+def symbols_of(nvss):
+    """
+    The symbols shared by the NodeVisitors of the function of nvss
+    """
+    if nvss:
+        return nvss[0].symbols
+    return None
+
+
+def if_children(orig, nvss):
+    symbols = symbols_of(nvss)
+    if_nvs = NodeVisitor(symbols)
+    pairs = [(orig.cond, nvss), (orig.iftrue, nvss + (if_nvs,))]
+    else_nvs = None
+    if orig.iffalse:
+        else_nvs = NodeVisitor(if_nvs.symbols)
+        pairs.append((orig.iffalse, nvss + (else_nvs,)))
+    return (if_nvs, else_nvs), pairs
+
+
+def build_if(orig, state, cond, iftrue, iffalse=None):
+    in_args, out_args = if_arguments(*state)
+    return fast.If(cond, iftrue, iffalse, in_args, out_args)
+
+
+def loop_stmt(stmt, nvss, loop_nvs):
+    """
+    The pair of the body of a loop. NodeVisitor visits the children of the
+    body of the loops it walks through, but the loop visits the body itself:
+    both only differ for bodies without braces.
+    """
+    if stmt.__class__ is c_ast.Compound:
+        return (stmt, nvss + (loop_nvs,))
+
+    if nvss:
+        node = ctoc.transform(stmt)
+        for nvs in nvss:
+            NodeVisitor.generic_visit(nvs, node)
+    return (stmt, (loop_nvs,))
+
+
+def loop_counter(init):
+    """
+    The counter initialized by the init of a for loop, or None.
+    """
+    if init.__class__ is c_ast.Assignment:
+        return lvalue_name(init.lvalue)
+    if init.__class__ is c_ast.UnaryOp and init.op in ctoc.increment_ops:
+        return lvalue_name(init.expr)
+    if init.__class__ is c_ast.DeclList:
+        return init.decls[0].name
+    return None
+
+
+def for_children(orig, nvss):
+    loop_nvs = NodeVisitor(symbols_of(nvss))
+    pairs = ((orig.init, ()), (orig.cond, ()), (orig.next, ()), loop_stmt(orig.stmt, nvss, loop_nvs))
+    return loop_nvs, pairs
+
+
+def carried_variables(loop_nvs):
+    """
+    The variables a loop carries, the ones convertc2f finds with a phi at
+    its header: the variables its body writes.
+    """
+    symbols = loop_nvs.symbols
+    return symbols.names(loop_nvs.written_bits)
+
+
+def build_for(orig, loop_nvs, init, cond, next, stmt):
+    args = loop_arguments(loop_counter(orig.init), carried_variables(loop_nvs))
+    return fast.LetRec(init, args, cond, next, stmt, coord=orig.coord)
+
+
+def while_children(orig, nvss):
+    loop_nvs = NodeVisitor(symbols_of(nvss))
+    return loop_nvs, ((orig.cond, ()), loop_stmt(orig.stmt, nvss, loop_nvs))
+
+
+def build_while(orig, loop_nvs, cond, stmt):
+    return fast.LetRec(None, loop_arguments(None, carried_variables(loop_nvs)), cond, None, stmt)
+
+
+def lower_unsupported(orig, nvss=()):
+    """
+    Lowers orig through minic, like convertc2f.
+    """
+    node = ctoc.transform(orig)
+    for nvs in nvss:
+        nvs.visit(node)
+    return transform_ctf(node)
+
+
+def each(orig, nvss):
+    return None, [(item, nvss) for item in orig]
+
+
+# The lowering of each PyCparser node class, with the same conventions as the
+# handlers of ctoc.transformers and convertc2f.ctf_transformers.
+lowerings = {
+    c_ast.Constant: (lambda orig, nvss: fast.Constant(v(orig.value), coord=orig.coord)),
+    c_ast.ID: lower_id,
+    c_ast.BinaryOp: lowering(
+        lambda orig, nvss: (None, ((orig.left, nvss), (orig.right, nvss))),
+        lambda orig, state, left, right: fast.BinaryOp(v(orig.op), left, right, coord=orig.coord)),
+    c_ast.ArrayRef: lowering(
+        lambda orig, nvss: (None, ((orig.name, nvss), (orig.subscript, nvss))),
+        lambda orig, state, name, subscript: fast.ArrayRef(name, subscript)),
+    c_ast.FuncCall: lowering(
+        lambda orig, nvss: (None, ((orig.name, nvss), (tm(orig.args), nvss))),
+        lambda orig, state, name, args: fast.FuncCall(name, args)),
+    c_ast.UnaryOp: lowering(unary_children, build_unary),
+    c_ast.Assignment: lowering(assignment_children, build_assignment),
+    c_ast.TernaryOp: lowering(
+        lambda orig, nvss: (None, ((orig.cond, nvss), (orig.iftrue, nvss), (orig.iffalse, nvss))),
+        lambda orig, state, cond, iftrue, iffalse: fast.If(cond, iftrue, iffalse, None, None, tern=True)),
+    c_ast.If: lowering(if_children, build_if),
+    c_ast.Compound: lowering(
+        lambda orig, nvss: (None, ((tm(orig.block_items), nvss),)),
+        lambda orig, state, block_items: fast.Block(block_items, coord=orig.coord)),
+    c_ast.Decl: lower_decl,
+    c_ast.InitList: lowering(
+        lambda orig, nvss: (None, ((tm(orig.exprs), nvss),)),
+        lambda orig, state, exprs: fast.ExprList(exprs)),
+    c_ast.ExprList: lowering(
+        lambda orig, nvss: (None, ((tm(orig.exprs), nvss),)),
+        lambda orig, state, exprs: fast.ExprList(exprs)),
+    c_ast.For: lowering(for_children, build_for),
+    c_ast.While: lowering(while_children, build_while),
+    Nothing: (lambda orig, nvss: None),
+    str: (lambda orig, nvss: orig),
+    list: lowering(each, lambda orig, state, *items: list(items)),
+}
+
+
+def register(cls, handler):
+    """
+    Registers handler(node, nvss) as the lowering of the PyCparser nodes of
+    class cls. Use lowering for nodes with children.
+    """
+    lowerings[cls] = handler
+
+
+def lower(x, nvss=()):
+    """
+    Lowers a PyCparser node to func_ast, recording its facts on the
+    NodeVisitors nvss.
+
+    Like transform_ctf, the tree is lowered bottom-up with an explicit stack.
+    A (node, NodeVisitors) pair on the stack is a node to lower, and a
+    (node, handler, state, number of children) tuple a node whose children
+    are lowered. Facts are recorded when a node is first popped, in the
+    preorder of NodeVisitor.
+    """
+    results = []
+    stack = [(x, nvss)]
+    while stack:
+        item = stack.pop()
+        if len(item) == 4:
+            orig, handler, state, count = item
+            if count:
+                children = results[-count:]
+                del results[-count:]
+                results.append(handler.build(orig, state, *children))
+            else:
+                results.append(handler.build(orig, state))
+            continue
+
+        orig, nvss = item
+        handler = lowerings.get(orig.__class__)
+        if handler is None:
+            results.append(lower_unsupported(orig, nvss))
+            continue
+        try:
+            children_of = handler.children
+        except AttributeError:
+            results.append(handler(orig, nvss))
+            continue
+
+        state, pairs = children_of(orig, nvss)
+        stack.append((orig, handler, state, len(pairs)))
+        stack.extend(pairs[::-1])
+    return results[0]
+
+
+def lower_block(compound):
+    """
+    Lowers the body of a function, like convert_block does for its minic Block.
+    """
+    nvs = NodeVisitor()
+    nvss = (nvs,)
+    func_block_items = [lower(item, nvss) for item in compound.block_items if item]
+
+    input_args, output_args = get_vars_and_written(nvs)
+    function = fast.functionDef(input_args, output_args, func_block_items)
+    return FunctionBlock(function, block_context(nvs))
+
+
+def lower_file(file_ast):
+    """
+    The FunctionBlocks of the functions of a PyCparser FileAST, in order.
+    Raises ErrorUnsupportedConstruct like ctoc.transform.
+    """
+    blocks = []
+    for ext in file_ast.ext:
+        if isinstance(ext, c_ast.FuncDef):
+            check_supported([ext.decl, ext.param_decls])
+            blocks.append(lower_block(ext.body))
+        else:
+            check_supported(ext)
+    return blocks
+
+
+def fused_functional_code(file_ast):
+    """
+    The (functional_code, opt_functional_code) lists that BlockVisitor makes
+    for ctoc.transform(file_ast).
+
+    Like BlockVisitor, the optimized code is the unoptimized function
+    rendered with the optimizations on.
+    """
+    functional_code = []
+    opt_functional_code = []
+    for block in lower_file(file_ast):
+        functional_code.append(block.render(False))
+        opt_functional_code.append(block.render(True))
+    return functional_code, opt_functional_code
+
+
+def fused_file(filename, use_cpp=False, cpp_path='cpp', cpp_args=''):
+    """
+    Parses a C file with the shared parser and lowers it with
+    fused_functional_code. The parse cache holds minic trees, it is not used.
+    """
+    text = read_source(filename, use_cpp, cpp_path, cpp_args)
+    return fused_functional_code(shared_parser().parse(text, filename))
+
+
+def fused_blocks(filename, use_cpp=False, cpp_path='cpp', cpp_args=''):
+    """
+    Like fused_file, the FunctionBlocks of the file are returned unrendered.
+    """
+    text = read_source(filename, use_cpp, cpp_path, cpp_args)
+    return lower_file(shared_parser().parse(text, filename))
@@ -1,48 +1,57 @@
 from __future__ import print_function
+from operator import attrgetter
 from pycparser import c_ast
 import minic.minic_ast as mc
 from minic.mutils import lmap
 
 
+# Binary operator used on the right hand side for each compound assignment operator.
+compound_assignment_ops = {
+    '+=': '+',
+    '-=': '-',
+    '*=': '*',
+    '/=': '/',
+    '%=': '%',
+    '^=': '^',
+    '|=': '|',
+    '>>=': '>>',
+    '<<=': '<<',
+    '&=': '&',
+}
+
+# Binary operator used for increments and decrements, for assignments and unary operators.
+increment_ops = {
+    '++': '+',
+    '--': '-',
+    'p++': '+',
+    'p--': '-',
+}
+
+
 # Assignments are all converted into assignments using the '=' operator.
 # All assignments using other operators are converted into assignments
 # using the '=' and the expression on the right hand side is a binary
 # expression such that the assignment has the same semantics.
-def of_assignment(orig):
-    lvalue = transform(orig.lvalue)
-    if orig.rvalue is not None:
-        rvalue = transform(orig.rvalue)
+# lvalue and rvalue are the already converted sides of the assignment.
+def of_assignment(orig, lvalue, rvalue):
+    if orig.op == '=':
+        final_rvalue = rvalue
+    elif orig.op in compound_assignment_ops:
+        final_rvalue = mc.BinaryOp(compound_assignment_ops[orig.op], lvalue, rvalue)
+    elif orig.op in increment_ops:
+        final_rvalue = mc.BinaryOp(increment_ops[orig.op], lvalue, mc.Constant('int', '1'))
     else:
-        rvalue = None
-
-    final_rvalue = {
-        '=': rvalue,
-        '+=': mc.BinaryOp('+', lvalue, rvalue),
-        '-=': mc.BinaryOp('-', lvalue, rvalue),
-        '*=': mc.BinaryOp('*', lvalue, rvalue),
-        '/=': mc.BinaryOp('/', lvalue, rvalue),
-        '%=': mc.BinaryOp('%', lvalue, rvalue),
-        '^=': mc.BinaryOp('^', lvalue, rvalue),
-        '|=': mc.BinaryOp('|', lvalue, rvalue),
-        '>>=': mc.BinaryOp('>>', lvalue, rvalue),
-        '<<=': mc.BinaryOp('<<', lvalue, rvalue),
-        '&=': mc.BinaryOp('&', lvalue, rvalue),
-        '++': mc.BinaryOp('+', lvalue, mc.Constant('int', '1')),
-        '--': mc.BinaryOp('-', lvalue, mc.Constant('int', '1')),
-    }.get(orig.op, mc.EmptyStatement())
+        final_rvalue = mc.EmptyStatement()
 
     return mc.Assignment(lvalue, final_rvalue, coord=orig.coord)
 
 
 # PyCParser represents increment and decrement as unary operations, we convert them
 # to assignments. Other unary operators are kept as is.
-def maybe_special_unary(orig):
-    return {
-        'p--': (lambda x: mc.Assignment(x, mc.BinaryOp('-', x, mc.Constant('int', '1')))),
-        'p++': (lambda x: mc.Assignment(x, mc.BinaryOp('+', x, mc.Constant('int', '1')))),
-        '--': (lambda x: mc.Assignment(x, mc.BinaryOp('-', x, mc.Constant('int', '1')))),
-        '++': (lambda x: mc.Assignment(x, mc.BinaryOp('+', x, mc.Constant('int', '1'))))
-    }.get(orig.op, lambda x: mc.UnaryOp(orig.op, x))(transform(orig.expr))
+def maybe_special_unary(orig, expr):
+    if orig.op in increment_ops:
+        return mc.Assignment(expr, mc.BinaryOp(increment_ops[orig.op], expr, mc.Constant('int', '1')))
+    return mc.UnaryOp(orig.op, expr)
 
 
 # Checks that the original construct is a value, a not any another construct. It helps
@@ -77,41 +86,101 @@ def unsupported(y):
         raise ErrorUnsupportedConstruct(y)
 
 
+# A handler for a construct with children: the children returned by children(orig) are converted
+# first, then build(orig, *converted_children) makes the Minic node. transform evaluates these handlers
+# with an explicit stack, so deeply nested inputs do not hit the recursion limit. The handler can still
+# be called directly, it then converts the children recursively.
+def composite(children, build):
+    def handler(orig):
+        return build(orig, *[transform(child) for child in children(orig)])
+    handler.children = children
+    handler.build = build
+    return handler
+
+
+# A composite handler for the children stored in the given attributes of the node.
+def node(fields, build):
+    if len(fields) == 1:
+        field = fields[0]
+        return composite(lambda orig: (getattr(orig, field),), build)
+    return composite(attrgetter(*fields), build)
+
+
+# The dispatch table of the transformer: one handler per PyCparser node class. It is built once
+# when the module is loaded, use register to add or replace the handler of a node class.
+transformers = {
+    c_ast.ArrayDecl: node(('type',), lambda orig, type: mc.ArrayDecl(type, orig.dim, coord=orig.coord)),
+    c_ast.ArrayRef: node(('name', 'subscript'), lambda orig, name, subscript: mc.ArrayRef(name, subscript)),
+    c_ast.Assignment: node(('lvalue', 'rvalue'), of_assignment),
+    c_ast.BinaryOp: node(('left', 'right'), lambda orig, left, right: mc.BinaryOp(v(orig.op), left, right, coord=orig.coord)),
+    c_ast.Compound: node(('block_items',), lambda orig, items: mc.Block(items, coord=orig.coord)),
+    c_ast.Constant: (lambda orig: mc.Constant(v(orig.type), v(orig.value), coord=orig.coord)),
+    c_ast.Decl: node(('name', 'funcspec', 'type', 'init'), lambda orig, name, funcspec, type, init: mc.Decl(name, funcspec, type, init, coord=orig.coord)),
+    c_ast.DeclList: node(('decls',), lambda orig, decls: mc.DeclList(decls, coord=orig.coord)),
+    c_ast.DoWhile: node(('cond', 'stmt'), lambda orig, cond, stmt: mc.DoWhile(cond, stmt, coord=orig.coord)),
+    c_ast.EmptyStatement: (lambda orig: mc.EmptyStatement()),
+    c_ast.ExprList: node(('exprs',), lambda orig, exprs: mc.ExprList(exprs)),
+    c_ast.FileAST: node(('ext',), lambda orig, ext: mc.FileAST(ext)),
+    c_ast.For: node(('init', 'cond', 'next', 'stmt'), lambda orig, init, cond, next, stmt: mc.For(init, cond, next, stmt, coord=orig.coord)),
+    c_ast.FuncCall: node(('name', 'args'), lambda orig, name, args: mc.FuncCall(name, args)),
+    c_ast.FuncDecl: node(('args', 'type'), lambda orig, args, type: mc.FuncDecl(args, type)),
+    c_ast.FuncDef: node(('decl', 'param_decls', 'body'), lambda orig, decl, param_decls, body: mc.FuncDef(decl, param_decls, body)),
+    c_ast.ID: (lambda orig: mc.ID(v(orig.name))),
+    c_ast.IdentifierType: node(('names',), lambda orig, names: mc.IdentifierType(names)),
+    c_ast.If: node(('cond', 'iftrue', 'iffalse'), lambda orig, cond, iftrue, iffalse: mc.If(cond, iftrue, iffalse)),
+    c_ast.InitList: node(('exprs',), lambda orig, exprs: mc.InitList(exprs)),
+    c_ast.NamedInitializer: node(('expr',), lambda orig, expr: mc.NamedInitializer(v(orig.name), expr)),
+    c_ast.ParamList: node(('params',), lambda orig, params: mc.ParamList(params)),
+    c_ast.PtrDecl: node(('type',), lambda orig, type: mc.PtrDecl(type)),
+    c_ast.Return: node(('expr',), lambda orig, expr: mc.Return(expr)),
+    c_ast.TernaryOp: node(('cond', 'iftrue', 'iffalse'), lambda orig, cond, iftrue, iffalse: mc.TernaryOp(cond, iftrue, iffalse)),
+    c_ast.Typename: node(('type',), lambda orig, type: mc.Typename(v(orig.name), type)),
+    c_ast.TypeDecl: node(('type',), lambda orig, type: mc.TypeDecl(v(orig.declname), type)),
+    c_ast.UnaryOp: node(('expr',), maybe_special_unary),
+    c_ast.While: node(('cond', 'stmt'), lambda orig, cond, stmt: mc.While(cond, stmt)),
+    str: (lambda orig: orig),
+    int: (lambda orig: orig),
+    float: (lambda orig: orig),
+    list: composite(lambda orig: orig, lambda orig, *items: list(items)),
+}
+
+
+def register(cls, handler):
+    """
+    Registers handler as the conversion of the nodes of class cls. The handler receives the
+    original node and returns its Minic counterpart, it can call transform on the children.
+    """
+    transformers[cls] = handler
+
+
 # The main transformer function. This is close to a mapping for PyCparser AST nodes to Minic nodes, except
 # that there are less constructs and we have to transform assignments and unary operators.
+# The tree is converted bottom-up with an explicit stack: converted children are pushed on results
+# in order, and a (node, handler, number of children) tuple on the stack marks a node whose children
+# are converted and that can be built. PyCparser trees never contain tuples.
 def transform(x):
-    return {
-        c_ast.ArrayDecl: (lambda orig: mc.ArrayDecl(transform(orig.type), orig.dim, coord=orig.coord)),
-        c_ast.ArrayRef: (lambda orig: mc.ArrayRef(transform(orig.name), transform(orig.subscript))),
-        c_ast.Assignment: (lambda orig: of_assignment(orig)),
-        c_ast.BinaryOp: (lambda orig: mc.BinaryOp(v(orig.op), transform(orig.left), transform(orig.right), coord=orig.coord)),
-        c_ast.Compound: (lambda orig: mc.Block(lmap(transform, orig.block_items), coord=orig.coord)),
-        c_ast.Constant: (lambda orig: mc.Constant(transform(orig.type), v(orig.value), coord=orig.coord)),
-        c_ast.Decl: (lambda orig: mc.Decl(transform(orig.name), transform(orig.funcspec), transform(orig.type), transform(orig.init), coord=orig.coord)),
-        c_ast.DeclList: (lambda orig: mc.DeclList(tmap(orig.decls), coord=orig.coord)),
-        c_ast.DoWhile: (lambda orig: mc.DoWhile(transform(orig.cond), transform(orig.stmt), coord=orig.coord)),
-        c_ast.EmptyStatement: (lambda orig: mc.EmptyStatement()),
-        c_ast.ExprList: (lambda orig: mc.ExprList(tmap(orig.exprs))),
-        c_ast.FileAST: (lambda orig: mc.FileAST(lmap(transform, orig.ext))),
-        c_ast.For: (lambda orig: mc.For(transform(orig.init), transform(orig.cond), transform(orig.next), transform(orig.stmt), coord=orig.coord)),
-        c_ast.FuncCall: (lambda orig: mc.FuncCall(transform(orig.name), tmap(orig.args))),
-        c_ast.FuncDecl: (lambda orig: mc.FuncDecl(tmap(orig.args), transform(orig.type))),
-        c_ast.FuncDef: (lambda orig: mc.FuncDef(transform(orig.decl), tmap(orig.param_decls), transform(orig.body))),
-        c_ast.ID: (lambda orig: mc.ID(v(orig.name))),
-        c_ast.IdentifierType: (lambda orig: mc.IdentifierType(tmap(orig.names))),
-        c_ast.If: (lambda orig: mc.If(transform(orig.cond), transform(orig.iftrue), transform(orig.iffalse))),
-        c_ast.InitList: (lambda orig: mc.InitList(tmap(orig.exprs))),
-        c_ast.NamedInitializer: (lambda orig: mc.NamedInitializer(v(orig.name), transform(orig.expr))),
-        c_ast.ParamList: (lambda orig: mc.ParamList(tmap(orig.params))),
-        c_ast.PtrDecl: (lambda orig: mc.PtrDecl(transform(orig.type))),
-        c_ast.Return: (lambda orig: mc.Return(transform(orig.expr))),
-        c_ast.TernaryOp: (lambda orig: mc.TernaryOp(transform(orig.cond), transform(orig.iftrue), transform(orig.iffalse))),
-        c_ast.Typename: (lambda orig: mc.Typename(v(orig.name), transform(orig.type))),
-        c_ast.TypeDecl: (lambda orig: mc.TypeDecl(v(orig.declname), transform(orig.type))),
-        c_ast.UnaryOp: (lambda orig: maybe_special_unary(orig)),
-        c_ast.While: (lambda orig: mc.While(transform(orig.cond), transform(orig.stmt))),
-        str: (lambda orig: orig),
-        int: (lambda orig: orig),
-        float: (lambda orig: orig),
-        list: (lambda orig: tmap(orig)),
-    }.get(x.__class__, lambda y: unsupported(y))(x)
+    results = []
+    stack = [x]
+    while stack:
+        orig = stack.pop()
+        if orig.__class__ is tuple:
+            orig, handler, count = orig
+            if count:
+                children = results[-count:]
+                del results[-count:]
+                results.append(handler.build(orig, *children))
+            else:
+                results.append(handler.build(orig))
+            continue
+
+        handler = transformers.get(orig.__class__, unsupported)
+        try:
+            children_of = handler.children
+        except AttributeError:
+            results.append(handler(orig))
+            continue
+
+        children = children_of(orig)
+        stack.append((orig, handler, len(children)))
+        stack.extend(children[::-1])
+    return results[0]
@@ -8,6 +8,7 @@
 #-----------------------------------------------------------------
 
 
+import hashlib
 import sys
 
 
@@ -20,6 +21,13 @@ class Node(object):
         """
         pass
 
+    def __iter__(self):
+        """ Iterates over the children that are Nodes, without
+            building the (name, child) pairs of children().
+        """
+        for _, child in self.children() or ():
+            yield child
+
     def show(self, buf=sys.stdout, offset=0, attrnames=False, nodenames=False, showcoord=False, _my_node_name=None):
         """ Pretty print the Node and all its attributes and
             children (recursively) to a buffer.
@@ -71,6 +79,48 @@ class Node(object):
                 _my_node_name=child_name)
 
 
+def _child_list(node):
+    """ The children of a node. Some nodes keep pycparser nodes as
+        children (the dimension of an ArrayDecl), these have no
+        __iter__.
+    """
+    if isinstance(node, Node):
+        return list(node)
+    return [child for _, child in node.children()]
+
+
+# closes the node or list opened before it in structural_hash
+_END = object()
+
+
+def structural_hash(node):
+    """ A digest of the structure of a subtree: the classes of its nodes
+        and their attributes, coordinates left out. Copies of a subtree
+        have the same digest, whatever file and line they come from.
+    """
+    digest = hashlib.sha1()
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if item is _END:
+            token = ")"
+        elif isinstance(item, (list, tuple)):
+            token = "["
+            stack.append(_END)
+            stack.extend(reversed(item))
+        elif hasattr(item, '__slots__') and hasattr(item, 'coord'):
+            # minic nodes, and the pycparser nodes some of them keep
+            token = "(" + item.__class__.__name__
+            stack.append(_END)
+            for name in reversed(item.__slots__):
+                if name not in ('coord', '__weakref__'):
+                    stack.append(getattr(item, name, None))
+        else:
+            token = "%r," % (item,)
+        digest.update(token.encode('utf-8'))
+    return digest.hexdigest()
+
+
 class NodeVisitor(object):
     """ A base NodeVisitor class for visiting c_ast nodes.
         Subclass it and define your own visit_XXX methods, where
@@ -101,22 +151,55 @@ class NodeVisitor(object):
             generic_visit() on the node.
             You can use:
                 NodeVisitor.generic_visit(self, node)
+        *   The visit_XXX method of each node class is looked up
+            once per visitor class and then cached, methods added
+            to an instance or a class after its first visit are
+            not seen.
         *   Modeled after Python's own AST visiting facilities
             (the ast module of Python 3.0)
     """
+    # visitor class -> {node class -> visit function}, filled lazily
+    _dispatch_tables = {}
+
     def visit(self, node):
         """ Visit a node.
         """
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        return self._visitor(node.__class__)(self, node)
+
+    def _visitor(self, node_class):
+        """ The function visiting the nodes of node_class: the
+            visit_XXX method of the visitor class, or generic_visit.
+            Resolved once per pair of classes.
+        """
+        try:
+            table = NodeVisitor._dispatch_tables[self.__class__]
+        except KeyError:
+            table = NodeVisitor._dispatch_tables[self.__class__] = {}
+        try:
+            return table[node_class]
+        except KeyError:
+            method = getattr(self.__class__, 'visit_' + node_class.__name__, self.__class__.generic_visit)
+            visitor = table[node_class] = getattr(method, '__func__', method)
+            return visitor
 
     def generic_visit(self, node):
         """ Called if no explicit visitor function exists for a
             node. Implements preorder visiting of the node.
+            The descendants that are visited generically are walked
+            with an explicit stack instead of recursive calls.
         """
-        for c_name, c in node.children():
-            self.visit(c)
+        generic_visit = NodeVisitor.__dict__['generic_visit']
+        stack = _child_list(node)
+        stack.reverse()
+        while stack:
+            child = stack.pop()
+            visitor = self._visitor(child.__class__)
+            if visitor is generic_visit:
+                children = _child_list(child)
+                children.reverse()
+                stack.extend(children)
+            else:
+                visitor(self, child)
 
 
 class ArrayDecl(Node):
@@ -132,6 +215,12 @@ class ArrayDecl(Node):
         if self.dim is not None: nodelist.append(("dim", self.dim))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.type is not None:
+            yield self.type
+        if self.dim is not None:
+            yield self.dim
+
     attr_names = ('dim_quals', )
 
 
@@ -148,6 +237,12 @@ class ArrayRef(Node):
         if self.subscript is not None: nodelist.append(("subscript", self.subscript))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.name is not None:
+            yield self.name
+        if self.subscript is not None:
+            yield self.subscript
+
     attr_names = ()
 
 
@@ -165,6 +260,12 @@ class Assignment(Node):
         if self.rvalue is not None: nodelist.append(("rvalue", self.rvalue))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.lvalue is not None:
+            yield self.lvalue
+        if self.rvalue is not None:
+            yield self.rvalue
+
 
 class BinaryOp(Node):
     __slots__ = ('op', 'left', 'right', 'coord', '__weakref__')
@@ -181,6 +282,12 @@ class BinaryOp(Node):
         if self.right is not None: nodelist.append(("right", self.right))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.left is not None:
+            yield self.left
+        if self.right is not None:
+            yield self.right
+
     attr_names = ('op', )
 
 
@@ -197,6 +304,10 @@ class Block(Node):
             nodelist.append(("block_items[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.block_items or []):
+            yield child
+
     attr_names = ()
 
 
@@ -212,6 +323,10 @@ class Constant(Node):
         nodelist = []
         return tuple(nodelist)
 
+    def __iter__(self):
+        return
+        yield
+
     attr_names = ('type', 'value', )
 
 
@@ -231,6 +346,12 @@ class Decl(Node):
         if self.init is not None: nodelist.append(("init", self.init))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.type is not None:
+            yield self.type
+        if self.init is not None:
+            yield self.init
+
     attr_names = ('name', 'funcspec', )
 
 
@@ -247,6 +368,10 @@ class DeclList(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.decls or []):
+            yield child
+
     attr_names = ()
 
 
@@ -265,6 +390,12 @@ class DoWhile(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.stmt is not None:
+            yield self.stmt
+
     attr_names = ()
 
 
@@ -276,6 +407,10 @@ class EmptyStatement(Node):
     def children(self):
         return ()
 
+    def __iter__(self):
+        return
+        yield
+
     attr_names = ()
 
 
@@ -292,6 +427,10 @@ class ExprList(Node):
             nodelist.append(("exprs[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.exprs or []):
+            yield child
+
     attr_names = ()
 
 
@@ -308,6 +447,10 @@ class FileAST(Node):
             nodelist.append(("ext[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.ext or []):
+            yield child
+
     attr_names = ()
 
 
@@ -329,6 +472,16 @@ class For(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.init is not None:
+            yield self.init
+        if self.cond is not None:
+            yield self.cond
+        if self.next is not None:
+            yield self.next
+        if self.stmt is not None:
+            yield self.stmt
+
     attr_names = ()
 
 
@@ -346,6 +499,12 @@ class FuncCall(Node):
         if self.args is not None: nodelist.append(("args", self.args))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.name is not None:
+            yield self.name
+        if self.args is not None:
+            yield self.args
+
     attr_names = ()
 
 
@@ -363,6 +522,12 @@ class FuncDecl(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.args is not None:
+            yield self.args
+        if self.type is not None:
+            yield self.type
+
     attr_names = ()
 
 
@@ -383,6 +548,14 @@ class FuncDef(Node):
             nodelist.append(("param_decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.decl is not None:
+            yield self.decl
+        if self.body is not None:
+            yield self.body
+        for child in (self.param_decls or []):
+            yield child
+
     attr_names = ()
 
 
@@ -397,6 +570,10 @@ class ID(Node):
         nodelist = []
         return tuple(nodelist)
 
+    def __iter__(self):
+        return
+        yield
+
     def __str__(self):
         return self.name
 
@@ -413,6 +590,10 @@ class IdentifierType(Node):
         nodelist = []
         return tuple(nodelist)
 
+    def __iter__(self):
+        return
+        yield
+
     attr_names = ('names', )
 
 
@@ -431,6 +612,14 @@ class If(Node):
         if self.iffalse is not None: nodelist.append(("iffalse", self.iffalse))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.iftrue is not None:
+            yield self.iftrue
+        if self.iffalse is not None:
+            yield self.iffalse
+
     attr_names = ()
 
 
@@ -447,6 +636,10 @@ class InitList(Node):
             nodelist.append(("exprs[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.exprs or []):
+            yield child
+
     attr_names = ()
 
 
@@ -463,6 +656,10 @@ class Label(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.stmt is not None:
+            yield self.stmt
+
     attr_names = ('name', )
 
 
@@ -481,6 +678,12 @@ class NamedInitializer(Node):
             nodelist.append(("name[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.expr is not None:
+            yield self.expr
+        for child in (self.name or []):
+            yield child
+
     attr_names = ()
 
 
@@ -497,6 +700,10 @@ class ParamList(Node):
             nodelist.append(("params[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.params or []):
+            yield child
+
     attr_names = ()
 
 
@@ -512,6 +719,10 @@ class PtrDecl(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.type is not None:
+            yield self.type
+
     attr_names = ('quals', )
 
 
@@ -527,6 +738,10 @@ class Return(Node):
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.expr is not None:
+            yield self.expr
+
     attr_names = ()
 
 
@@ -546,6 +761,14 @@ class TernaryOp(Node):
         if self.iffalse is not None: nodelist.append(("iffalse", self.iffalse))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.iftrue is not None:
+            yield self.iftrue
+        if self.iffalse is not None:
+            yield self.iffalse
+
     attr_names = ()
 
 
@@ -562,6 +785,10 @@ class Typename(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.type is not None:
+            yield self.type
+
     attr_names = ('name', )
 
 
@@ -578,6 +805,10 @@ class TypeDecl(Node):
         if self.type is not None: nodelist.append(("type", self.type))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.type is not None:
+            yield self.type
+
     attr_names = ('name', )
 
 
@@ -594,6 +825,10 @@ class UnaryOp(Node):
         if self.expr is not None: nodelist.append(("expr", self.expr))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.expr is not None:
+            yield self.expr
+
     
 
     attr_names = ('op', )
@@ -613,6 +848,10 @@ class Union(Node):
             nodelist.append(("decls[%d]" % i, child))
         return tuple(nodelist)
 
+    def __iter__(self):
+        for child in (self.decls or []):
+            yield child
+
     attr_names = ('name', )
 
 
@@ -630,6 +869,12 @@ class While(Node):
         if self.stmt is not None: nodelist.append(("stmt", self.stmt))
         return tuple(nodelist)
 
+    def __iter__(self):
+        if self.cond is not None:
+            yield self.cond
+        if self.stmt is not None:
+            yield self.stmt
+
     attr_names = ()
 
 
@@ -0,0 +1,284 @@
+#-----------------------------------------------------------------
+#
+# Persistent cache of parsed and converted Minic ASTs.
+#
+# Files are keyed by a hash of the text given to the parser and of
+# the translator version, and the converted minic_ast.FileAST is
+# stored pickled and compressed. The cache directory is bounded in
+# size, the least recently used entries are evicted first.
+#-----------------------------------------------------------------
+
+from __future__ import print_function
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import pycparser
+from pycparser import c_parser
+import minic.c_ast_to_minic as ctoc
+import minic.minic_ast as mast
+from minic.preprocess import preprocess
+
+
+# Bump to invalidate every cached AST when the conversion changes in a
+# way the hash of the translator sources cannot see.
+CACHE_FORMAT = 1
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'MINIC_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'minic'))
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_translator_version = None
+
+
+def translator_version():
+    """
+    Identifies the conversion from C to minic: the cache format, the pycparser
+    version and the sources of the minic conversion.
+    """
+    global _translator_version
+    if _translator_version is None:
+        digest = hashlib.sha1()
+        digest.update(('%d %s' % (CACHE_FORMAT, pycparser.__version__)).encode('utf-8'))
+        for module in (ctoc, mast):
+            source = os.path.splitext(module.__file__)[0] + '.py'
+            with open(source, 'rb') as f:
+                digest.update(f.read())
+        _translator_version = digest.hexdigest()
+    return _translator_version
+
+
+def source_key(text):
+    """
+    The cache key of the text given to the parser.
+    """
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    digest = hashlib.sha1(translator_version().encode('utf-8'))
+    digest.update(text)
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    """
+    A directory of converted ASTs, one file per key, bounded to max_bytes.
+    The modification time of an entry is its last use.
+
+    The size of the directory is listed once, on the first put, and then
+    kept up to date with the entries written: the directory is only listed
+    again to evict, when it is over max_bytes. The entries other processes
+    write in between are counted at that point.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # bytes of the entries, None until the directory is listed
+        self.size = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ast')
+
+    def get(self, key):
+        """
+        The AST stored under key, or None.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            ast = pickle.loads(zlib.decompress(data))
+        except (IOError, OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return ast
+
+    def put(self, key, ast):
+        """
+        Stores the AST under key, then evicts the least recently used
+        entries if the cache is larger than max_bytes.
+        """
+        try:
+            data = zlib.compress(pickle.dumps(ast, pickle.HIGHEST_PROTOCOL))
+        except RuntimeError:
+            # too deep to be pickled, it is parsed again next time
+            return
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+        path = self.path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+
+        # write to a temporary file first, concurrent readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if self.size is None:
+            self.evict()
+        else:
+            self.size += len(data) - replaced
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.ast'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.ast'):
+                os.remove(os.path.join(self.directory, name))
+        self.size = 0
+
+
+def read_source(filename, use_cpp=False, cpp_path='cpp', cpp_args=''):
+    """
+    The text to parse for these arguments of pycparser.parse_file. When use_cpp
+    is set, files without directives are preprocessed without starting cpp.
+    """
+    mode = 'rU' if sys.version_info[0] < 3 else 'r'
+    with open(filename, mode) as f:
+        text = f.read()
+
+    if use_cpp:
+        return preprocess(filename, text, cpp_path, cpp_args)
+    return text
+
+
+_parser = None
+
+
+def table_options():
+    """
+    CParser options loading the lexer and parser tables pregenerated by pycparser.
+    If they are missing, they are generated once into the cache directory
+    instead of being rebuilt by every new process.
+    """
+    try:
+        import pycparser.lextab
+        import pycparser.yacctab
+        return {'lextab': 'pycparser.lextab', 'yacctab': 'pycparser.yacctab'}
+    except ImportError:
+        directory = os.path.join(DEFAULT_CACHE_DIR, 'tables')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if directory not in sys.path:
+            sys.path.append(directory)
+        return {'lextab': 'minic_lextab', 'yacctab': 'minic_yacctab', 'taboutputdir': directory}
+
+
+def shared_parser():
+    """
+    The CParser of the process, created on first use. A parser is not
+    thread safe, threads should create their own.
+    """
+    global _parser
+    if _parser is None:
+        _parser = c_parser.CParser(lex_optimize=True, yacc_optimize=True, **table_options())
+    return _parser
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ParseCache()
+    return _default_cache
+
+
+def parse_minic(filename, use_cpp=False, cpp_path='cpp', cpp_args='', cache=None, parser=None):
+    """
+    Parses a C file and converts it to a minic_ast.FileAST, like
+    ctoc.transform(parse_file(filename, ...)), but only parses and converts
+    sources that are not already in the cache.
+
+    cache:
+        The ParseCache to use, by default the one in DEFAULT_CACHE_DIR.
+        False disables caching.
+
+    parser:
+        The CParser to use, by default the shared_parser of the process.
+    """
+    if cache is None:
+        cache = default_cache()
+
+    text = read_source(filename, use_cpp, cpp_path, cpp_args)
+
+    if cache:
+        key = source_key(text)
+        ast = cache.get(key)
+        if ast is not None:
+            return ast
+
+    if parser is None:
+        parser = shared_parser()
+    ast = ctoc.transform(parser.parse(text, filename))
+
+    if cache:
+        cache.put(key, ast)
+    return ast
+
+
+def parse_minic_batch(filenames, use_cpp=False, cpp_path='cpp', cpp_args='', cache=None):
+    """
+    parse_minic for many files, with the shared parser. Returns the minic
+    FileASTs in the order of filenames.
+    """
+    return [parse_minic(filename, use_cpp, cpp_path, cpp_args, cache) for filename in filenames]
@@ -0,0 +1,85 @@
+#-----------------------------------------------------------------
+#
+# A minimal C preprocessor for the inputs of the translator.
+#
+# Our kernels use no preprocessor directives, the preprocessor
+# only has to remove comments and join continued lines. Doing this
+# in process avoids starting one cpp process per input file, cpp
+# is only used for the files that contain directives.
+#-----------------------------------------------------------------
+
+from pycparser import preprocess_file
+
+
+def needs_cpp(text):
+    """
+    True if the text contains a preprocessor directive, that the minimal
+    preprocessor does not handle.
+    """
+    for line in text.splitlines():
+        if line.lstrip().startswith('#'):
+            return True
+    return False
+
+
+def minimal_preprocess(text):
+    """
+    Removes the comments and joins the lines ending with a backslash, like cpp
+    does for a file without directives. Line numbers are preserved: the
+    newlines of comments and continued lines are kept after the line.
+    """
+    out = []
+    pending_newlines = 0
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+
+        # string and character literals are copied as is
+        if c == '"' or c == "'":
+            j = i + 1
+            while j < n and text[j] != c and text[j] != '\n':
+                if text[j] == '\\':
+                    j += 1
+                j += 1
+            out.append(text[i:j + 1])
+            i = j + 1
+
+        elif c == '/' and text.startswith('//', i):
+            j = text.find('\n', i)
+            if j == -1:
+                j = n
+            i = j
+
+        elif c == '/' and text.startswith('/*', i):
+            j = text.find('*/', i + 2)
+            if j == -1:
+                j = n
+            pending_newlines += text.count('\n', i, j)
+            out.append(' ')
+            i = j + 2
+
+        elif c == '\\' and text.startswith('\\\n', i):
+            pending_newlines += 1
+            i += 2
+
+        elif c == '\n':
+            out.append('\n' * (pending_newlines + 1))
+            pending_newlines = 0
+            i += 1
+
+        else:
+            out.append(c)
+            i += 1
+
+    out.append('\n' * pending_newlines)
+    return ''.join(out)
+
+
+def preprocess(filename, text, cpp_path='cpp', cpp_args=''):
+    """
+    The preprocessed text of a file, using cpp only if it has directives.
+    """
+    if needs_cpp(text):
+        return preprocess_file(filename, cpp_path, cpp_args)
+    return minimal_preprocess(text)
@@ -0,0 +1,393 @@
+#-----------------------------------------------------------------
+#
+# Python backend: compiles the functionDef of a block to a Python
+# function, to run the translated code.
+#
+# The functionDef becomes a Python ast.Module defining the function
+# block_function. A Let is an assignment to a local variable, or to
+# an element of an array, an If is an if statement and a LetRec a
+# while loop: the recursive function of the functional code only
+# calls itself last, the variables it passes from one call to the
+# next are the locals the loop updates. The parameters are the
+# input_args, then the variables read that no statement writes, and
+# the function returns the tuple of the output_args.
+#
+# The arithmetic is the one of C on Python numbers: the integer
+# division and remainder truncate towards zero, the comparisons and
+# the logical operators give bools, 0 and 1, the integers do not
+# overflow. func_ast does not keep the types of the declarations:
+# a value is not converted to the type of its variable, int x =
+# 7.0 / 2 gives x the float 3.5, and unsigned values do not wrap.
+# The functions called are looked up in the namespace of the
+# function: the builtins, max and min included, and the ones given
+# to python_function.
+#
+# The code objects are cached by the structural hash of the
+# functions: the copies of a function are compiled once. The cache
+# is bounded to MAX_CODE_OBJECTS, the least recently used are
+# dropped first.
+#-----------------------------------------------------------------
+
+from collections import OrderedDict
+import ast
+import keyword
+import math
+import types
+import weakref
+
+import func_ast as fast
+from minic.minic_ast import structural_hash
+
+
+FUNCTION_NAME = 'block_function'
+
+_operators = {
+    '+': ast.Add,
+    '-': ast.Sub,
+    '*': ast.Mult,
+    '<<': ast.LShift,
+    '>>': ast.RShift,
+    '&': ast.BitAnd,
+    '|': ast.BitOr,
+    '^': ast.BitXor,
+}
+
+_comparisons = {
+    '<': ast.Lt,
+    '>': ast.Gt,
+    '<=': ast.LtE,
+    '>=': ast.GtE,
+    '==': ast.Eq,
+    '!=': ast.NotEq,
+}
+
+_unary_operators = {
+    '-': ast.USub,
+    '+': ast.UAdd,
+    '~': ast.Invert,
+    '!': ast.Not,
+}
+
+# operator -> the function of the namespace computing it
+_helpers = {
+    '/': '_c_divide',
+    '%': '_c_remainder',
+}
+
+
+def c_divide(left, right):
+    """ left / right, the integer division truncating towards zero
+    """
+    if isinstance(left, float) or isinstance(right, float):
+        return float(left) / right
+    return fast.c_division(left, right)
+
+
+def c_remainder(left, right):
+    """ left % right, with the sign of left
+    """
+    if isinstance(left, float) or isinstance(right, float):
+        return math.fmod(left, right)
+    return left - fast.c_division(left, right) * right
+
+
+def local_name(name):
+    """ The Python name of a variable, the keywords get a trailing _
+    """
+    if keyword.iskeyword(name) or name in ('None', 'True', 'False'):
+        return name + '_'
+    return name
+
+
+def constant(value):
+    """ The Python value of the literal of a Constant
+    """
+    number = fast.constant_value(value)
+    if number is not None:
+        return number
+    text = str(value)
+    if text[-1:] in 'fF' and not text.lower().startswith('0x'):
+        try:
+            return float(text[:-1])
+        except ValueError:
+            pass
+    if text.startswith("'"):
+        return ord(ast.literal_eval(text))
+    if text.startswith('"'):
+        return ast.literal_eval(text)
+    raise TypeError("cannot compile the constant %r" % (value,))
+
+
+def arguments(call):
+    """ The expressions passed to a FuncCall
+    """
+    if call.args is None:
+        return []
+    if isinstance(call.args, fast.ExprList):
+        return list(call.args.exprs)
+    return [call.args]
+
+
+class Compiler(object):
+    """ Builds the Python ast.Module of a functionDef.
+
+    loaded:
+        The names of the variables read, in the order they are met
+    stored:
+        The names of the variables written
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.loaded = []
+        self.stored = set()
+
+    def module(self):
+        function = self.function
+        body = self.items(function.block_items)
+        outputs = [self.load(fast.symbol_name(arg)) for arg in function.output_args]
+        body.append(ast.Return(ast.Tuple(outputs, ast.Load())))
+
+        args = [ast.Name(local_name(name), ast.Param()) for name in self.parameters()]
+        definition = ast.FunctionDef(FUNCTION_NAME, ast.arguments(args, None, None, []), body, [])
+        return ast.fix_missing_locations(ast.Module([definition]))
+
+    def parameters(self):
+        """ The input_args, then the variables read and never written
+        """
+        names = []
+        for arg in self.function.input_args:
+            name = fast.symbol_name(arg)
+            if name not in names:
+                names.append(name)
+        for name in self.loaded:
+            if name not in names and name not in self.stored:
+                names.append(name)
+        return names
+
+    def load(self, name):
+        if name not in self.loaded:
+            self.loaded.append(name)
+        return ast.Name(local_name(name), ast.Load())
+
+    # statements
+
+    def items(self, items):
+        """ The Python statements of a list of statements, pass for none
+        """
+        body = []
+        for item in items or []:
+            if item is not None:
+                body.extend(self.statement(item))
+        return body or [ast.Pass()]
+
+    def branch(self, node):
+        """ items for the branch of an If or the body of a LetRec: a
+            Block, a single statement or None
+        """
+        if isinstance(node, fast.Block):
+            return self.items(node.block_items)
+        return self.items([node])
+
+    def statement(self, node):
+        """ The list of Python statements of a statement node
+        """
+        if isinstance(node, fast.Let):
+            body = []
+            # the declarations without an initializer have no rvalue
+            if node.rvalue is not None:
+                body.append(ast.Assign([self.target(node.lvalue)], self.expression(node.rvalue)))
+            if node.in_statement is not None:
+                body.extend(self.statement(node.in_statement))
+            return body
+
+        if isinstance(node, fast.If) and not node.tern:
+            orelse = [] if node.iffalse is None else self.branch(node.iffalse)
+            return [ast.If(self.expression(node.cond), self.branch(node.iftrue), orelse)]
+
+        if isinstance(node, fast.LetRec):
+            body = [] if node.init is None else self.statement(node.init)
+            test = ast.Name('True', ast.Load()) if node.cond is None else self.expression(node.cond)
+            loop = self.branch(node.stmt)
+            if node.next is not None:
+                loop.extend(self.statement(node.next))
+            body.append(ast.While(test, loop, []))
+            return body
+
+        if isinstance(node, fast.Decl):
+            if node.init is None:
+                return []
+            return [ast.Assign([self.target(node.name)], self.expression(node.init))]
+
+        if isinstance(node, fast.DeclList):
+            return [statement for decl in node.decls for statement in self.statement(decl)]
+
+        if isinstance(node, fast.EmptyStatement):
+            return []
+
+        return [ast.Expr(self.expression(node))]
+
+    def target(self, lvalue):
+        """ The Python target a Let writes: a variable or an element
+            of an array
+        """
+        if isinstance(lvalue, fast.ArrayRef):
+            subscript = ast.Index(self.expression(lvalue.subscript))
+            return ast.Subscript(self.expression(lvalue.name), subscript, ast.Store())
+        if isinstance(lvalue, (fast.ID, str)):
+            name = fast.symbol_name(lvalue)
+            self.stored.add(name)
+            return ast.Name(local_name(name), ast.Store())
+        raise TypeError("cannot compile the assignment to %r" % (lvalue,))
+
+    # expressions
+
+    def expression(self, expr):
+        """ The Python expression of an expression node. The nodes are
+            walked with an explicit stack, the Python nodes of the
+            operands are built first.
+        """
+        built = {}
+        # (node, whether its operands are built)
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                stack.append((node, True))
+                if isinstance(node, fast.FuncCall):
+                    children = arguments(node)
+                elif isinstance(node, fast.Node):
+                    children = list(node)
+                else:
+                    children = []
+                for child in reversed(children):
+                    stack.append((child, False))
+                continue
+            built[node] = self.operation(node, built)
+        return built[expr]
+
+    def operation(self, node, built):
+        """ The Python expression of node, from the ones of its operands
+        """
+        if isinstance(node, fast.ID):
+            return self.load(node.name)
+
+        if isinstance(node, fast.Constant):
+            value = constant(node.value)
+            if isinstance(value, str):
+                return ast.Str(value)
+            return ast.Num(value)
+
+        if isinstance(node, fast.BinaryOp):
+            left, right = built[node.left], built[node.right]
+            if node.op in _operators:
+                return ast.BinOp(left, _operators[node.op](), right)
+            if node.op in _comparisons:
+                return ast.Compare(left, [_comparisons[node.op]()], [right])
+            if node.op in ('&&', '||'):
+                # C gives 0 or 1, not the value of an operand
+                values = [ast.Compare(value, [ast.NotEq()], [ast.Num(0)]) for value in (left, right)]
+                return ast.BoolOp(ast.And() if node.op == '&&' else ast.Or(), values)
+            if node.op in _helpers:
+                return ast.Call(ast.Name(_helpers[node.op], ast.Load()), [left, right], [], None, None)
+
+        elif isinstance(node, fast.UnaryOp):
+            if node.op in _unary_operators:
+                return ast.UnaryOp(_unary_operators[node.op](), built[node.expr])
+
+        elif isinstance(node, fast.ArrayRef):
+            return ast.Subscript(built[node.name], ast.Index(built[node.subscript]), ast.Load())
+
+        elif isinstance(node, fast.If) and node.tern:
+            return ast.IfExp(built[node.cond], built[node.iftrue], built[node.iffalse])
+
+        elif isinstance(node, fast.FuncCall):
+            args = [built[arg] for arg in arguments(node)]
+            name = ast.Name(fast.symbol_name(node.name), ast.Load())
+            return ast.Call(name, args, [], None, None)
+
+        elif isinstance(node, fast.ExprList):
+            # the comma operator, the value of the last expression
+            exprs = [built[expr] for expr in node.exprs]
+            if len(exprs) == 1:
+                return exprs[0]
+            return ast.Subscript(ast.Tuple(exprs, ast.Load()), ast.Index(ast.Num(-1)), ast.Load())
+
+        raise TypeError("cannot compile %r" % (node,))
+
+
+def python_module(function):
+    """ The Python ast.Module defining the function of a functionDef
+    """
+    return Compiler(function).module()
+
+
+def parameters(function):
+    """ The names of the parameters of the Python function of a
+        functionDef, before the keywords are renamed
+    """
+    compiler = Compiler(function)
+    compiler.module()
+    return compiler.parameters()
+
+
+MAX_CODE_OBJECTS = 1024
+
+# structural hash -> code object of block_function, the most recently
+# used last
+_code_objects = OrderedDict()
+
+
+def code_object(function):
+    """ The code object of the Python function of a functionDef,
+        compiled once per structure
+    """
+    key = structural_hash(function)
+    try:
+        code = _code_objects.pop(key)
+    except KeyError:
+        module = compile(python_module(function), '<%s %s>' % (FUNCTION_NAME, key[:12]), 'exec')
+        code = [
+            const for const in module.co_consts
+            if hasattr(const, 'co_name') and const.co_name == FUNCTION_NAME
+        ][0]
+
+    _code_objects[key] = code
+    if len(_code_objects) > MAX_CODE_OBJECTS:
+        _code_objects.popitem(last=False)
+    return code
+
+
+def namespace(functions=None):
+    """ The globals the Python functions run with: the builtins, the
+        helpers of the C arithmetic and the functions given, a dict
+        name -> callable
+    """
+    names = {
+        '__builtins__': __builtins__,
+        _helpers['/']: c_divide,
+        _helpers['%']: c_remainder,
+    }
+    if functions:
+        names.update(functions)
+    return names
+
+
+# functionDef -> its Python function, with the default namespace
+_python_functions = weakref.WeakKeyDictionary()
+
+
+def python_function(function, functions=None):
+    """ The Python function of a functionDef. Its parameters are the
+        ones of parameters(function), it returns the tuple of the
+        output_args.
+    """
+    if functions is None:
+        return fast.per_function(_python_functions, function, python_function_of)
+    return python_function_of(function, functions)
+
+
+def python_function_of(function, functions=None):
+    """ A new Python function of a functionDef, see python_function
+    """
+    return types.FunctionType(code_object(function), namespace(functions), FUNCTION_NAME)
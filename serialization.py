@@ -0,0 +1,293 @@
+#-----------------------------------------------------------------
+#
+# Binary encoding of func_ast trees.
+#
+# The nodes are written in post order, children first, as flat
+# arrays: the kind of every node, and the operands of every node,
+# one after the other, with the index of the first operand of each
+# node. An operand is a 32 bits word whose low 2 bits tell what it
+# is: None, a node (an earlier one), a string of the shared string
+# table or an immediate (False, True). Lists, like block_items or
+# in_args, are nodes of their own kind. Nodes reached twice are
+# written once, a loaded tree shares them the same way. A variable
+# named by a minic ID, in the arguments of a function, is written
+# as its name.
+#
+# Little endian, the u32 arrays first, aligned on 4 bytes:
+#
+#   header          magic, version, and the counts below
+#   string_offsets  u32[strings + 1], into the string data
+#   operand_starts  u32[nodes + 1], into operands
+#   operands        u32[operands]
+#   roots           u32[roots], the trees of the file
+#   kinds           u8[nodes]
+#   string data     utf-8
+#
+# A Reader reads the arrays in place from any buffer, an mmap
+# included. Coordinates are not kept.
+#-----------------------------------------------------------------
+
+import array
+import mmap
+import struct
+import sys
+
+import func_ast as fast
+import minic.minic_ast as mast
+
+
+MAGIC = b'FAST'
+
+# Bump when the layout or KINDS change
+VERSION = 1
+
+# the class of each kind of node, None for lists. The fields of a node
+# are its __slots__, in the order of its constructor.
+KINDS = (
+    None,
+    fast.Let,
+    fast.Constant,
+    fast.LetRec,
+    fast.BinaryOp,
+    fast.functionDef,
+    fast.Decl,
+    fast.DeclList,
+    fast.EmptyStatement,
+    fast.ArrayRef,
+    fast.ExprList,
+    fast.FileAST,
+    fast.FuncCall,
+    fast.FuncDecl,
+    fast.ID,
+    fast.IdentifierType,
+    fast.If,
+    fast.Block,
+    fast.UnaryOp,
+)
+
+LIST = 0
+
+_kind_of = dict((cls, kind) for kind, cls in enumerate(KINDS) if cls is not None)
+
+_fields = [None] + [
+    tuple(name for name in cls.__slots__ if name not in ('coord', '__weakref__'))
+    for cls in KINDS[1:]
+]
+
+# operand tags
+NONE, NODE, STRING, IMMEDIATE = range(4)
+
+_immediates = (False, True)
+
+HEADER = struct.Struct('<4sHHIIII')
+
+PY2 = sys.version_info[0] < 3
+
+
+def _words(values):
+    """ The bytes of a list of u32, little endian
+    """
+    words = array.array('I', values)
+    assert words.itemsize == 4
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tostring() if PY2 else words.tobytes()
+
+
+def dumps(roots):
+    """ The binary encoding of a list of func_ast trees, usually the
+        functionDefs of a file
+    """
+    strings = []
+    string_index = {}
+    kinds = []
+    starts = []
+    operands = []
+    # id of a node or list -> its index, the objects are kept alive in seen
+    index = {}
+    seen = []
+
+    def operand(value):
+        if value is None:
+            return NONE
+        if isinstance(value, (fast.Node, list)):
+            return index[id(value)] << 2 | NODE
+        if isinstance(value, bool):
+            return _immediates.index(value) << 2 | IMMEDIATE
+        if isinstance(value, mast.ID):
+            value = value.name
+        if isinstance(value, str) or (PY2 and isinstance(value, unicode)):
+            try:
+                return string_index[value] << 2 | STRING
+            except KeyError:
+                string_index[value] = len(strings)
+                strings.append(value)
+                return (len(strings) - 1) << 2 | STRING
+        raise TypeError("cannot encode %r" % (value,))
+
+    # post order: an item is written once all the nodes it refers to are.
+    # An item is pushed with None, then again with its kind and values
+    # once its children are pushed above it.
+    stack = [(root, None) for root in reversed(roots)]
+    while stack:
+        item, fields = stack.pop()
+        key = id(item)
+        if key in index:
+            continue
+
+        if fields is None:
+            if isinstance(item, list):
+                fields = LIST, item
+            else:
+                try:
+                    kind = _kind_of[type(item)]
+                except KeyError:
+                    raise TypeError("cannot encode %r" % (item,))
+                fields = kind, [getattr(item, name) for name in _fields[kind]]
+            stack.append((item, fields))
+            for value in reversed(fields[1]):
+                if isinstance(value, (fast.Node, list)) and id(value) not in index:
+                    stack.append((value, None))
+            continue
+
+        kind, values = fields
+        index[key] = len(kinds)
+        seen.append(item)
+        kinds.append(kind)
+        starts.append(len(operands))
+        for value in values:
+            operands.append(operand(value))
+    starts.append(len(operands))
+
+    encoded = [s.encode('utf-8') if not (PY2 and isinstance(s, str)) else s for s in strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    return b''.join([
+        HEADER.pack(MAGIC, VERSION, 0, len(strings), len(kinds), len(operands), len(roots)),
+        _words(offsets),
+        _words(starts),
+        _words(operands),
+        _words([index[id(root)] for root in roots]),
+        array.array('B', kinds).tostring() if PY2 else bytes(kinds),
+        b''.join(encoded),
+    ])
+
+
+def dump(roots, f):
+    f.write(dumps(roots))
+
+
+class Reader(object):
+    """ The flat arrays of an encoding, read in place from buffer: bytes,
+        or an mmap. kind and operands look at a node without building it,
+        roots builds the trees.
+    """
+
+    def __init__(self, buffer):
+        if len(buffer) < HEADER.size:
+            raise ValueError("not a func_ast encoding")
+        magic, version, _, strings, nodes, operands, roots = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("not a func_ast encoding")
+        if version != VERSION:
+            raise ValueError("func_ast encoding version %d, expected %d" % (version, VERSION))
+
+        self.buffer = buffer
+        self.string_count = strings
+        self.node_count = nodes
+
+        offset = HEADER.size
+        self.string_offsets = offset
+        offset += 4 * (strings + 1)
+        self.operand_starts = offset
+        offset += 4 * (nodes + 1)
+        self.operands_offset = offset
+        offset += 4 * operands
+        self.roots_offset = offset
+        self.root_count = roots
+        offset += 4 * roots
+        self.kinds_offset = offset
+        offset += nodes
+        self.strings_offset = offset
+
+        if len(buffer) < offset or len(buffer) < offset + self._u32(self.string_offsets + 4 * strings)[0]:
+            raise ValueError("truncated func_ast encoding")
+        self._strings = {}
+
+    def _u32(self, offset, count=1):
+        return struct.unpack_from('<%dI' % count, self.buffer, offset)
+
+    def kind(self, node):
+        """ The kind of a node, its class is KINDS[kind]
+        """
+        return struct.unpack_from('<B', self.buffer, self.kinds_offset + node)[0]
+
+    def operands(self, node):
+        """ The operand words of a node: the tag in the low 2 bits
+            (NONE, NODE, STRING, IMMEDIATE), the index above
+        """
+        start, end = self._u32(self.operand_starts + 4 * node, 2)
+        return self._u32(self.operands_offset + 4 * start, end - start)
+
+    def string(self, index):
+        try:
+            return self._strings[index]
+        except KeyError:
+            start, end = self._u32(self.string_offsets + 4 * index, 2)
+            data = self.buffer[self.strings_offset + start:self.strings_offset + end]
+            value = self._strings[index] = data if PY2 else data.decode('utf-8')
+            return value
+
+    def roots(self):
+        """ The trees of the encoding, built node by node in the order they
+            are written: the nodes a node refers to are always built before.
+        """
+        nodes = self.node_count
+        kinds = struct.unpack_from('<%dB' % nodes, self.buffer, self.kinds_offset)
+        starts = self._u32(self.operand_starts, nodes + 1)
+        operands = self._u32(self.operands_offset, starts[-1])
+
+        built = []
+        for node in range(nodes):
+            values = []
+            for word in operands[starts[node]:starts[node + 1]]:
+                tag = word & 3
+                if tag == NONE:
+                    values.append(None)
+                elif tag == NODE:
+                    if word >> 2 >= node:
+                        raise ValueError("func_ast encoding refers to node %d before it" % (word >> 2))
+                    values.append(built[word >> 2])
+                elif tag == STRING:
+                    values.append(self.string(word >> 2))
+                else:
+                    values.append(_immediates[word >> 2])
+
+            kind = kinds[node]
+            if kind >= len(KINDS):
+                raise ValueError("unknown kind %d in func_ast encoding" % kind)
+            if kind == LIST:
+                built.append(values)
+            else:
+                built.append(KINDS[kind](*values))
+
+        return [built[root] for root in self._u32(self.roots_offset, self.root_count)]
+
+
+def loads(data):
+    """ The trees of an encoding, from dumps
+    """
+    return Reader(data).roots()
+
+
+def load_file(filename):
+    """ The trees of an encoded file, read through an mmap
+    """
+    with open(filename, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return Reader(mapped).roots()
+        finally:
+            mapped.close()
@@ -0,0 +1,358 @@
+#-----------------------------------------------------------------
+#
+# Static single assignment form of minic function bodies.
+#
+# The body is cut into basic blocks, the dominator tree and the
+# dominance frontiers of the blocks are computed, phis are placed on
+# the iterated dominance frontiers of the definitions of every
+# variable, and the definitions and uses are then numbered by a walk
+# of the dominator tree.
+#
+# A phi at the join of an if is a variable the if returns, a phi at
+# the header of a loop is a variable the loop carries from one
+# iteration to the next: the translation to func_ast reads its if and
+# loop tuples from there.
+#
+# The variables are the ones functions.NodeVisitor records: names,
+# the arrays written through a subscript included. Like NodeVisitor,
+# the init and next of a for loop only read: the counter they write
+# is passed by the loop itself, it is not one of the variables the
+# loop carries.
+#-----------------------------------------------------------------
+
+import minic.minic_ast as mast
+from functions import SymbolTable, lvalue_name
+
+
+class Instruction(object):
+    """
+    A statement of a basic block, with the variables it defines and uses.
+    Once the names are numbered, def_versions and use_versions map them to
+    their SSA versions.
+    """
+    __slots__ = ('node', 'defs', 'uses', 'def_versions', 'use_versions')
+
+    def __init__(self, node, defs, uses):
+        self.node = node
+        self.defs = defs
+        self.uses = uses
+        self.def_versions = {}
+        self.use_versions = {}
+
+
+class Phi(object):
+    """
+    var = phi(operands): operands has the version of var coming from each
+    predecessor of the block, in order.
+    """
+    __slots__ = ('var', 'version', 'operands')
+
+    def __init__(self, var, count):
+        self.var = var
+        self.version = None
+        self.operands = [None] * count
+
+
+class BasicBlock(object):
+    __slots__ = ('index', 'instructions', 'successors', 'predecessors', 'phis', 'idom', 'frontier')
+
+    def __init__(self, index):
+        self.index = index
+        self.instructions = []
+        self.successors = []
+        self.predecessors = []
+        # var -> Phi
+        self.phis = {}
+        self.idom = None
+        self.frontier = set()
+
+
+class SSAFunction(object):
+    """
+    The SSA form of a minic statement, usually the Block of a function.
+
+    joins:
+        If -> the block its branches join in
+    headers:
+        For, While or DoWhile -> the block testing its condition
+
+    symbols:
+        The SymbolTable ordering the variables, the one of the NodeVisitors
+        of the function to list them in the same order.
+    """
+
+    def __init__(self, body, symbols=None):
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+
+        self.blocks = []
+        self.joins = {}
+        self.headers = {}
+
+        self.entry = self.new_block()
+        self.exit = self.statement(body, self.entry)
+
+        self.order = self.reverse_postorder()
+        self.dominators()
+        self.frontiers()
+        self.place_phis()
+        self.rename()
+
+    # control flow graph
+
+    def new_block(self):
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def edge(self, source, target):
+        source.successors.append(target)
+        target.predecessors.append(source)
+
+    def instruction(self, block, node, defines=True):
+        """
+        Adds a simple statement, or a condition, at the end of block.
+        Like NodeVisitor, the assignments and declarations found anywhere
+        in it are definitions, unless defines is False.
+        """
+        defs = []
+        uses = []
+        stack = [node]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, mast.ID):
+                uses.append(item.name)
+            elif isinstance(item, mast.Assignment):
+                lvalue = item.lvalue
+                defs.append(lvalue_name(lvalue))
+                # an array is updated, its other elements are kept
+                if not isinstance(lvalue, mast.ID):
+                    stack.append(lvalue)
+                stack.append(item.rvalue)
+            elif isinstance(item, mast.Decl):
+                if not isinstance(item.type, mast.FuncDecl):
+                    defs.append(item.name)
+                stack.append(item.init)
+            elif isinstance(item, mast.Node):
+                stack.extend(item)
+
+        if not defines:
+            defs = []
+
+        # a new table lists the variables in the order of the statements
+        for var in defs + uses:
+            self.symbols.intern(var)
+        block.instructions.append(Instruction(node, defs, uses))
+
+    def statement(self, node, block):
+        """
+        Adds the statement node from the end of block, returns the block
+        the statements following it start in.
+        """
+        if node is None:
+            return block
+
+        if isinstance(node, mast.Block):
+            for item in node.block_items or []:
+                block = self.statement(item, block)
+            return block
+
+        if isinstance(node, mast.If):
+            self.instruction(block, node.cond)
+            join = self.joins[node] = self.new_block()
+            for branch in (node.iftrue, node.iffalse):
+                start = self.new_block()
+                self.edge(block, start)
+                self.edge(self.statement(branch, start), join)
+            return join
+
+        if isinstance(node, (mast.For, mast.While)):
+            if isinstance(node, mast.For) and node.init is not None:
+                self.instruction(block, node.init, False)
+            header = self.headers[node] = self.new_block()
+            self.edge(block, header)
+            if node.cond is not None:
+                self.instruction(header, node.cond)
+
+            body = self.new_block()
+            self.edge(header, body)
+            end = self.statement(node.stmt, body)
+            if isinstance(node, mast.For) and node.next is not None:
+                self.instruction(end, node.next, False)
+            self.edge(end, header)
+
+            after = self.new_block()
+            self.edge(header, after)
+            return after
+
+        if isinstance(node, mast.DoWhile):
+            header = self.headers[node] = self.new_block()
+            self.edge(block, header)
+            end = self.statement(node.stmt, header)
+            self.instruction(end, node.cond)
+            self.edge(end, header)
+
+            after = self.new_block()
+            self.edge(end, after)
+            return after
+
+        self.instruction(block, node)
+        return block
+
+    # dominators
+
+    def reverse_postorder(self):
+        order = []
+        visited = set([self.entry.index])
+        # (block, index of the next successor to visit)
+        stack = [(self.entry, 0)]
+        while stack:
+            block, index = stack.pop()
+            if index < len(block.successors):
+                stack.append((block, index + 1))
+                successor = block.successors[index]
+                if successor.index not in visited:
+                    visited.add(successor.index)
+                    stack.append((successor, 0))
+            else:
+                order.append(block)
+        order.reverse()
+        return order
+
+    def dominators(self):
+        """
+        The immediate dominator of every reachable block, with the iterative
+        algorithm of Cooper, Harvey and Kennedy.
+        """
+        position = dict((block.index, i) for i, block in enumerate(self.order))
+
+        def intersect(first, second):
+            while first is not second:
+                while position[first.index] > position[second.index]:
+                    first = first.idom
+                while position[second.index] > position[first.index]:
+                    second = second.idom
+            return first
+
+        entry = self.entry
+        entry.idom = entry
+        changed = True
+        while changed:
+            changed = False
+            for block in self.order[1:]:
+                idom = None
+                for predecessor in block.predecessors:
+                    if predecessor.idom is None:
+                        continue
+                    idom = predecessor if idom is None else intersect(predecessor, idom)
+                if idom is not block.idom:
+                    block.idom = idom
+                    changed = True
+
+    def frontiers(self):
+        for block in self.order:
+            if len(block.predecessors) < 2:
+                continue
+            for predecessor in block.predecessors:
+                runner = predecessor
+                while runner is not None and runner is not block.idom:
+                    runner.frontier.add(block)
+                    runner = runner.idom
+
+    def place_phis(self):
+        """
+        Places the phis of every variable on the iterated dominance frontier
+        of the blocks defining it.
+        """
+        definitions = {}
+        for block in self.order:
+            for instruction in block.instructions:
+                for var in instruction.defs:
+                    definitions.setdefault(var, []).append(block)
+
+        for var, blocks in definitions.items():
+            placed = set(block.index for block in blocks)
+            worklist = list(blocks)
+            while worklist:
+                block = worklist.pop()
+                for target in block.frontier:
+                    if var in target.phis:
+                        continue
+                    target.phis[var] = Phi(var, len(target.predecessors))
+                    if target.index not in placed:
+                        placed.add(target.index)
+                        worklist.append(target)
+
+    def rename(self):
+        """
+        Numbers the definitions of every variable along the dominator tree.
+        Version 0 is the value of a variable on entry of the function.
+        """
+        children = dict((block.index, []) for block in self.order)
+        for block in self.order[1:]:
+            children[block.idom.index].append(block)
+
+        counters = {}
+        current = {}
+
+        def define(var):
+            version = counters[var] = counters.get(var, 0) + 1
+            current.setdefault(var, []).append(version)
+            return version
+
+        def version_of(var):
+            versions = current.get(var)
+            return versions[-1] if versions else 0
+
+        # a list on the stack holds the variables to restore once the
+        # blocks dominated by the block that defined them are done
+        stack = [self.entry]
+        while stack:
+            block = stack.pop()
+            if isinstance(block, list):
+                for var in block:
+                    current[var].pop()
+                continue
+
+            defined = []
+            for phi in block.phis.values():
+                phi.version = define(phi.var)
+                defined.append(phi.var)
+
+            for instruction in block.instructions:
+                for var in instruction.uses:
+                    instruction.use_versions[var] = version_of(var)
+                for var in instruction.defs:
+                    instruction.def_versions[var] = define(var)
+                    defined.append(var)
+
+            for successor in block.successors:
+                index = successor.predecessors.index(block)
+                for phi in successor.phis.values():
+                    phi.operands[index] = version_of(phi.var)
+
+            stack.append(defined)
+            stack.extend(reversed(children[block.index]))
+
+    # results
+
+    def phi_variables(self, block):
+        """
+        The variables with a phi in block, in the order of the symbols
+        """
+        symbols = self.symbols
+        return symbols.names(symbols.bitset(block.phis))
+
+    def join_variables(self, node):
+        """
+        The variables an If returns: the ones with a phi where its branches join
+        """
+        return self.phi_variables(self.joins[node])
+
+    def loop_variables(self, node):
+        """
+        The variables a loop carries from one iteration to the next: the ones
+        with a phi at its header
+        """
+        return self.phi_variables(self.headers[node])
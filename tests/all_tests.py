@@ -7,7 +7,19 @@ import sys
 suite = unittest.TestLoader().loadTestsFromNames(
     [
         'test_c_ast_to_minic',
-        'test_nodevisitors'
+        'test_nodevisitors',
+        'test_parse_cache',
+        'test_preprocess',
+        'test_convertc2f',
+        'test_batch',
+        'test_lowering',
+        'test_liveness',
+        'test_constants',
+        'test_cse',
+        'test_ssa',
+        'test_serialization',
+        'test_python_backend',
+        'test_evaluator'
     ]
 )
 
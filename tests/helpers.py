@@ -0,0 +1,16 @@
+from pycparser import c_parser
+import minic.c_ast_to_minic as ctoc
+import convertc2f
+
+
+def block_of(source):
+    """ The FunctionBlock of the body of the first function of a C source
+    """
+    block = ctoc.transform(c_parser.CParser().parse(source)).ext[0].body
+    return convertc2f.convert_block(block)
+
+
+def function_of(source):
+    """ The functionDef of the body of the first function of a C source
+    """
+    return block_of(source).function
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+import batch
+
+
+class TestBatch(unittest.TestCase):
+    def test_collect_files(self):
+        fd, manifest = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write("# kernels\n./c_files/minic.c\n\n")
+        try:
+            files = batch.collect_files(['./reduction_tests/test*'], manifest)
+        finally:
+            os.remove(manifest)
+        self.assertEqual(files, [
+            './reduction_tests/test1',
+            './reduction_tests/test2',
+            './reduction_tests/test3',
+            './reduction_tests/test4',
+            './c_files/minic.c',
+        ])
+
+    def test_parallel_order(self):
+        files = batch.collect_files(['./reduction_tests/test*', './missing'])
+        serial = list(batch.translate_files(files, 'both', workers=1))
+        parallel = list(batch.translate_files(files, 'both', workers=2))
+        self.assertEqual([r[0] for r in parallel], files)
+        self.assertEqual(parallel[:-1], serial[:-1])
+        self.assertEqual(parallel[-1][1], None)
+        self.assertTrue('IOError' in parallel[-1][2] or 'FileNotFoundError' in parallel[-1][2])
+
+    def test_translate_file(self):
+        for filename in ['./reduction_tests/test1', './c_files/minic.c']:
+            for fused in (False, True):
+                expected = [filename]
+                for block in batch.file_blocks(filename, fused):
+                    expected += ["unoptimized function: ", block.render(False),
+                                 "optimized function: ", block.render(True), "\n"]
+                expected = "\n".join(expected + ["\n"])
+                self.assertEqual(batch.translate_file((filename, 'both', fused, False)), (filename, expected, None))
+
+                # written straight to a file
+                with tempfile.TemporaryFile('w+') as out:
+                    self.assertEqual(batch.translate_file((filename, 'both', fused, False), out), (filename, None, None))
+                    out.seek(0)
+                    self.assertEqual(out.read(), expected)
+
+    def test_headers(self):
+        fd, output = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            files = ['./reduction_tests/test1', './reduction_tests/test2']
+            status = batch.main(['-j', '1', '-o', output], files, {files[1]: "Second Test"})
+            with open(output) as f:
+                text = f.read()
+        finally:
+            os.remove(output)
+        self.assertEqual(status, 0)
+        self.assertTrue(text.startswith(files[0]))
+        self.assertIn("\nSecond Test\n" + files[1] + "\n", text)
@@ -1,6 +1,6 @@
 from __future__ import print_function
 import unittest
-from pycparser import parse_file
+from pycparser import parse_file, c_ast, c_parser
 import minic.c_ast_to_minic as ctoc
 import minic.minic_ast as mast
 
@@ -35,3 +35,27 @@ class TestConversion1(unittest.TestCase):
         self.failUnless(isinstance(main_body.block_items[1], mast.Decl))
         self.failUnless(isinstance(main_body.block_items[2], mast.Assignment))
         self.failUnless(isinstance(main_body.block_items[3], mast.Return))
+
+    def test_register_handler(self):
+        fullc_ast = parse_file('./c_files/minic.c')
+        original = ctoc.transformers[c_ast.Return]
+        ctoc.register(c_ast.Return, lambda orig: mast.EmptyStatement())
+        try:
+            converted = ctoc.transform(fullc_ast)
+        finally:
+            ctoc.register(c_ast.Return, original)
+        mss_body = converted.ext[0].body
+        self.failUnless(isinstance(mss_body.block_items[4], mast.EmptyStatement))
+
+    def test_long_expression(self):
+        terms = " + ".join("a%d" % i for i in range(5000))
+        fullc_ast = c_parser.CParser().parse("int f(){ s = %s; }" % terms)
+        converted = ctoc.transform(fullc_ast)
+        expr = converted.ext[0].body.block_items[0].rvalue
+        depth = 0
+        while isinstance(expr, mast.BinaryOp):
+            self.assertEqual(expr.right.name, "a%d" % (4999 - depth))
+            expr = expr.left
+            depth += 1
+        self.assertEqual(depth, 4999)
+        self.assertEqual(expr.name, "a0")
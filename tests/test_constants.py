@@ -0,0 +1,81 @@
+import unittest
+import func_ast as fast
+from helpers import block_of
+
+
+class TestConstants(unittest.TestCase):
+    def test_fold(self):
+        self.assertEqual(fast.fold_binary('/', -7, 2), -3)
+        self.assertEqual(fast.fold_binary('%', -7, 2), -1)
+        self.assertEqual(fast.fold_binary('/', 7, 0), None)
+        self.assertEqual(fast.fold_binary('*', 2 ** 30, 4), None)
+        self.assertEqual(fast.fold_binary('&&', 0, None), 0)
+        self.assertEqual(fast.fold_binary('<', 1.5, 2), 1)
+        self.assertEqual(fast.fold_unary('!', 3), 0)
+        self.assertEqual(fast.constant_value('0x10'), 16)
+        self.assertEqual(fast.constant_value('010'), 8)
+        self.assertEqual(fast.constant_value("'a'"), None)
+
+    def test_expressions_are_folded(self):
+        block = block_of("int f() { c = 7; d = c * 2 + 1; x = d + y; }")
+        _, d, x = block.function.block_items
+        constants = fast.constants(block.function)
+        self.assertIs(fast.constants(block.function), constants)
+        self.assertEqual(constants.values[d.rvalue], 15)
+        self.assertNotIn(x.rvalue, constants.values)
+
+        code = block.render(True)
+        self.assertIn("let d = 15 in", code)
+        self.assertIn("15 + y", code)
+
+    def test_branches_and_loops(self):
+        block = block_of("""
+        int f() {
+            c = 2;
+            if (c == 1) { x = 2; } else { x = 5; }
+            for (i = 0; i < c - 2; i++) { s = s + i; }
+            t = 0;
+            for (j = 0; j < 4; j++) { t = t + c; }
+            u = t + x + q;
+        }
+        """)
+        _, branch, never, _, loop, _ = block.function.block_items
+        conditions = fast.constants(block.function).conditions
+        self.assertIs(conditions[branch], False)
+        self.assertIs(conditions[never], False)
+        self.assertNotIn(loop, conditions)
+
+        code = block.render(True)
+        self.assertNotIn("if c == 1", code)
+        self.assertNotIn("i < c - 2", code)
+        self.assertIn("let i = 0", code)
+        # t is 8 after the loop, x is 5
+        self.assertIn("13 + q", code)
+
+    def test_unoptimized_code_is_not_folded(self):
+        block = block_of("int f() { c = 7; d = c * 2 + 1; }")
+        self.assertIn("let d = c * 2 + 1 in", block.render(False))
+
+    def test_declared_types_are_not_folded(self):
+        # gcc: x is 3, y 6, u 4294967295 and z 1
+        block = block_of("int f() { int x = 7.0 / 2; y = x * 2; unsigned u = 0u - 1; z = u > 5; q = 7.0 / 2; w = q; }")
+        _, y, u, z, _, w = block.function.block_items
+        values = fast.constants(block.function).values
+        self.assertNotIn(y.rvalue, values)
+        self.assertNotIn(u.rvalue, values)
+        self.assertNotIn(z.rvalue, values)
+        # the floats are folded where they are computed, not into variables
+        self.assertNotIn(w.rvalue, values)
+        self.assertTrue(fast.unsigned_literal('0u') and fast.unsigned_literal('0xFFUL'))
+        self.assertFalse(fast.unsigned_literal('10l'))
+
+        code = block.render(True)
+        self.assertIn("x * 2", code)
+        self.assertIn("u > 5", code)
+
+    def test_loop_variables_are_not_inlined(self):
+        block = block_of("int f() { i = 0; s = 0; while (i < 10) { s = s + i; i = i + 1; } }")
+        code = block.render(True)
+        self.assertIn("let s = s + i in", code)
+        self.assertIn("if i < 10", code)
+        self.assertIn("(i, s)", code.splitlines()[-1])
@@ -0,0 +1,120 @@
+import shutil
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+from pycparser import c_parser, parse_file
+import minic.minic_ast as mast
+import minic.c_ast_to_minic as ctoc
+import convertc2f
+
+
+class TestStreaming(unittest.TestCase):
+    def test_stream_matches_block_visitor(self):
+        vs = convertc2f.BlockVisitor()
+        vs.visit(ctoc.transform(parse_file('./reduction_tests/test2')))
+        expected = list(zip(vs.functional_code, vs.opt_functional_code))
+
+        ast = parse_file('./reduction_tests/test2')
+        streamed = convertc2f.stream_functional_code(ast)
+        first = next(streamed)
+        self.assertEqual(ast.ext[0], None)
+        self.assertEqual([first] + list(streamed), expected)
+        self.assertEqual(ast.ext, [])
+
+    def test_stream_file(self):
+        streamed = list(convertc2f.stream_file('./c_files/minic.c'))
+        self.assertEqual(len(streamed), 2)
+        self.assertTrue(streamed[0][0].startswith("fun block_function("))
+
+        # one rendering only
+        optimized = list(convertc2f.stream_file('./c_files/minic.c', opt_on=True))
+        self.assertEqual(optimized, [opt for _, opt in streamed])
+
+
+class TestRendering(unittest.TestCase):
+    def test_lazy_renderings(self):
+        vs = convertc2f.BlockVisitor(cache=False)
+        vs.visit(ctoc.transform(parse_file('./c_files/minic.c')))
+        self.assertEqual([block.renderings for block in vs.blocks], [{}, {}])
+
+        opt_functional_code = vs.opt_functional_code
+        self.assertEqual([list(block.renderings) for block in vs.blocks], [[True], [True]])
+        self.assertEqual(opt_functional_code, [block.render(True) for block in vs.blocks])
+        self.assertIs(vs.opt_functional_code[0], opt_functional_code[0])
+
+    def test_threads(self):
+        vs = convertc2f.BlockVisitor()
+        for filename in ['./c_files/minic.c'] + ['./reduction_tests/test%d' % i for i in range(1, 5)]:
+            vs.visit(ctoc.transform(parse_file(filename)))
+        jobs = [(block, opt_on) for block in vs.blocks for opt_on in (False, True)] * 8
+
+        expected = [block.render(opt_on) for block, opt_on in jobs]
+        pool = ThreadPool(8)
+        try:
+            rendered = pool.map(lambda job: job[0].render(job[1]), jobs)
+        finally:
+            pool.close()
+        self.assertEqual(rendered, expected)
+
+
+KERNEL = "int dummy() { s = 0; for (i = 0; i < n; i++) { s = s + a[i]; } }"
+
+
+def minic_of(source):
+    return ctoc.transform(c_parser.CParser().parse(source))
+
+
+class TestRenderCache(unittest.TestCase):
+    def test_structural_hash(self):
+        first = minic_of(KERNEL)
+        moved = minic_of("\n\n  " + KERNEL)
+        other = minic_of(KERNEL.replace("s + a[i]", "s + a[i + 1]"))
+        self.assertNotEqual(first.ext[0].body.coord, moved.ext[0].body.coord)
+        self.assertEqual(mast.structural_hash(first), mast.structural_hash(moved))
+        self.assertNotEqual(mast.structural_hash(first), mast.structural_hash(other))
+
+    def test_copies_are_translated_once(self):
+        cache = convertc2f.RenderCache(max_blocks=2)
+        vs = convertc2f.BlockVisitor(cache)
+        vs.visit(minic_of(KERNEL + KERNEL))
+        self.assertIs(vs.blocks[0], vs.blocks[1])
+        expected = convertc2f.convert_block(minic_of(KERNEL).ext[0].body).render(True)
+        self.assertEqual(vs.opt_functional_code, [expected, expected])
+
+        # the least recently used block is dropped
+        vs.visit(ctoc.transform(parse_file('./reduction_tests/test1')))
+        vs.visit(ctoc.transform(parse_file('./reduction_tests/test2')))
+        self.assertEqual(len(cache.blocks), 2)
+        vs.visit(minic_of(KERNEL))
+        self.assertIsNot(vs.blocks[-1], vs.blocks[0])
+
+    def test_shared_cache_is_opt_in(self):
+        ast = minic_of(KERNEL)
+        first, second = convertc2f.BlockVisitor(), convertc2f.BlockVisitor()
+        first.visit(ast)
+        second.visit(ast)
+        self.assertIsNot(first.blocks[0], second.blocks[0])
+
+        first = convertc2f.BlockVisitor(convertc2f.default_render_cache())
+        second = convertc2f.BlockVisitor(convertc2f.default_render_cache())
+        first.visit(ast)
+        second.visit(ast)
+        self.assertIs(first.blocks[0], second.blocks[0])
+
+    def test_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            ast = minic_of(KERNEL)
+            vs = convertc2f.BlockVisitor(convertc2f.RenderCache(store=convertc2f.render_store(directory)))
+            vs.visit(ast)
+            expected = convertc2f.convert_block(ast.ext[0].body)
+            self.assertEqual(vs.opt_functional_code, [expected.render(True)])
+
+            # another process finds the rendering on disk, and converts nothing
+            vs = convertc2f.BlockVisitor(convertc2f.RenderCache(store=convertc2f.render_store(directory)))
+            vs.visit(ast)
+            self.assertEqual(vs.opt_functional_code, [expected.render(True)])
+            self.assertEqual(vs.blocks[0].converted, None)
+            self.assertEqual(vs.functional_code, [expected.render(False)])
+        finally:
+            shutil.rmtree(directory)
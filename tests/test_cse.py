@@ -0,0 +1,61 @@
+import unittest
+import func_ast as fast
+from helpers import block_of
+
+
+# final_inputs/p3_input4
+SOURCE = """
+int dummy() {
+    sum = sum + a[i];
+    if (mps < sum) { mps = sum; }
+    if (mts < mts + a[i]) { mts += a[i]; }
+    mss = max(mss, mts);
+}
+"""
+
+
+class TestCommonSubexpressions(unittest.TestCase):
+    def test_repeated_expressions_are_bound_once(self):
+        block = block_of(SOURCE)
+        first, _, second, _ = block.function.block_items
+        cse = fast.common_subexpressions(block.function)
+        self.assertIs(fast.common_subexpressions(block.function), cse)
+        self.assertEqual([name for name, _ in cse.bindings[first]], ['cse0'])
+        self.assertEqual([name for name, _ in cse.bindings[second]], ['cse1'])
+
+        code = block.render(True)
+        self.assertIn("let cse0 = a.(i) in", code)
+        self.assertIn("let cse1 = mts + cse0 in", code)
+        self.assertIn("if mts < cse1", code)
+        self.assertEqual(code.count("a.(i)"), 1)
+
+    def test_writes_and_scopes(self):
+        block = block_of("""
+        int f() {
+            x = a[i] * b;
+            i = i + 1;
+            y = a[i] * b;
+            if (c) { u = p * q; v = p * q; } else { u = r; v = r; }
+            w = p * q + u + v;
+            for (j = 0; j < n; j++) { s = s + b * 2 + d[j] * d[j]; t = b * 2; }
+            z = x + y + w + s + t;
+        }
+        """)
+        code = block.render(True)
+        # i is written between the two a[i] * b
+        self.assertEqual(code.count("a.(i) * b"), 2)
+        # p * q is bound in the branch, not after the if
+        self.assertIn("p * q + u", code)
+        # repeated in the body of the loop, bound in it
+        self.assertIn("let cse1 = b * 2 in", code)
+        self.assertIn("let cse2 = d.(j) in", code)
+        self.assertIn("cse2 * cse2", code)
+
+    def test_guarded_expressions_are_not_bound(self):
+        # a[i] is only read when i < n, it is not bound before
+        block = block_of("int f() { x = i < n && a[i] > 0; y = a[i]; }")
+        self.assertNotIn("cse", block.render(True))
+
+    def test_unoptimized_code_is_unchanged(self):
+        block = block_of(SOURCE)
+        self.assertNotIn("cse", block.render(False))
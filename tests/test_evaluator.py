@@ -0,0 +1,81 @@
+import copy
+import random
+import unittest
+import func_ast as fast
+import evaluator
+import python_backend
+from helpers import function_of
+
+
+def array_depths(function):
+    """ name -> number of subscripts, for the arrays of a function
+    """
+    depths = {}
+    stack = [function]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, fast.ArrayRef):
+            depth = 1
+            while isinstance(node.name, fast.ArrayRef):
+                node = node.name
+                depth += 1
+            depths[fast.symbol_name(node.name)] = depth
+        if isinstance(node, fast.Node):
+            stack.extend(node)
+        elif isinstance(node, list):
+            stack.extend(node)
+    return depths
+
+
+def outcome(kernel, args):
+    try:
+        return kernel(*args)
+    except ArithmeticError as error:
+        return type(error)
+
+
+class TestEvaluator(unittest.TestCase):
+    def test_corpus(self):
+        # the evaluator agrees with the Python backend
+        generator = random.Random(25)
+
+        def value(depth):
+            if depth == 0:
+                return generator.randint(0, 4)
+            return [value(depth - 1) if depth > 1 else generator.randint(-3, 3) for _ in range(8)]
+
+        for index in range(1, 10):
+            function = function_of(open('../final_inputs/p3_input%d' % index).read())
+            run = evaluator.evaluator(function)
+            self.assertEqual(run.parameters, python_backend.parameters(function))
+            compiled = python_backend.python_function(function)
+            depths = array_depths(function)
+
+            for _ in range(50):
+                args = [value(depths.get(name, 0)) for name in run.parameters]
+                copies = copy.deepcopy(args)
+                self.assertEqual(outcome(run, args), outcome(compiled, copies), index)
+                self.assertEqual(args, copies, index)
+
+    def test_reductions(self):
+        function = function_of(open('../final_inputs/p3_input4').read())
+        run = evaluator.evaluator(function)
+        self.assertIs(evaluator.evaluator(function), run)
+
+        a = [3, -5, 4, -1, 2]
+        state = (0, 0, 0, 0)
+        for i in range(len(a)):
+            total, mps, mts, mss = state
+            state = run(total, i, a, mps, mts, mss)
+        self.assertEqual(state, (3, 3, 9, 9))
+
+    def test_slots(self):
+        function = function_of("int f() { t = x * 2; if (t > y) { y = t; } }")
+        run = evaluator.Evaluator(function)
+        self.assertEqual(run.symbols.symbols[:len(run.parameters)], run.parameters)
+        self.assertEqual(run(0, 4, 5), (8, 8))
+        self.assertRaises(TypeError, run, 1, 2)
+
+        doubled = evaluator.evaluator(function_of("int f() { x = twice(y); }"), {'twice': lambda v: 2 * v})
+        self.assertEqual(doubled(0, 4), (8,))
+        self.assertRaises(TypeError, evaluator.Evaluator, function_of("int f() { x = unknown(y); }"))
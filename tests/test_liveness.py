@@ -0,0 +1,57 @@
+import unittest
+import func_ast as fast
+from helpers import block_of
+
+
+SOURCE = """
+int f() {
+    if (c < 1) { t = a; t = b; u = t + 1; }
+    for (i = 0; i < n; i++) { w = a[i]; s = s + w; }
+    if (q < 1) { z = 1; }
+    z = 3;
+}
+"""
+
+
+class TestLiveness(unittest.TestCase):
+    def test_live_variables(self):
+        block = block_of(SOURCE)
+        first_if, loop, last_if, last_let = block.function.block_items
+        liveness = fast.liveness(block.function)
+        self.assertIs(fast.liveness(block.function), liveness)
+
+        # t = a is overwritten before being read
+        dead, overwrite, read = first_if.iftrue.block_items
+        self.assertTrue(liveness.dead(dead))
+        self.assertFalse(liveness.dead(overwrite))
+        self.assertFalse(liveness.dead(read))
+
+        # the if returns only what it writes, a and c are only read
+        self.assertEqual(liveness.live_args(first_if, first_if.in_args), ['t', 'u'])
+
+        # z is written again after the last if
+        self.assertTrue(liveness.dead(last_if))
+        self.assertFalse(liveness.dead(last_let))
+
+        # the loop passes its counter and what is live after it
+        self.assertEqual(liveness.loop_args(loop, loop.in_args), ['i', 'w', 's'])
+
+    def test_dead_bindings_are_not_rendered(self):
+        block = block_of(SOURCE)
+        code = block.render(True)
+        self.assertNotIn("let t = a in", code)
+        self.assertNotIn("if q < 1", code)
+        self.assertIn("let (t, u) =", code)
+
+        code = block.render(False)
+        self.assertIn("let t = a in", code)
+        self.assertIn("if q < 1", code)
+
+    def test_read_bindings_are_rendered(self):
+        # final_inputs/p3_input5: sum is read by the loop and returned
+        block = block_of("int f() { sum = 0; for (i = 0; i < n; i++) { sum = sum + a[i]; } }")
+        code = block.render(True)
+        self.assertIn("let sum = 0 in", code)
+        self.assertIn("let sum = sum + a.(i) in", code)
+        self.assertIn("loop0 i sum\n", code)
+        self.assertEqual(code.splitlines()[-1].strip(), "(sum)")
@@ -0,0 +1,47 @@
+import unittest
+from pycparser import c_parser, parse_file
+import minic.c_ast_to_minic as ctoc
+import convertc2f
+import lowering
+
+
+SOURCE = """
+int f(int n, int a[10]) {
+    int s = 0;
+    int t;
+    s += a[0];
+    t = s - 1;
+    n++;
+    --t;
+    x = (t > 1) ? t : 1;
+    for (i = 0; i < n; i++) { s = s + a[i]; if (s > 3) { t = 1; } else { t = 2; q = t * s; } }
+    while (t) { t--; r = t + s; }
+    foo(s, n);
+    return s;
+}
+"""
+
+
+def block_visitor_code(ast):
+    vs = convertc2f.BlockVisitor()
+    vs.visit(ctoc.transform(ast))
+    return vs.functional_code, vs.opt_functional_code
+
+
+def fused_code(ast):
+    return lowering.fused_functional_code(ast)
+
+
+class TestLowering(unittest.TestCase):
+    def test_same_code_as_block_visitor(self):
+        for filename in ['./c_files/minic.c'] + ['./reduction_tests/test%d' % i for i in range(1, 5)]:
+            ast = parse_file(filename)
+            self.assertEqual(fused_code(ast), block_visitor_code(ast), filename)
+
+    def test_statements(self):
+        ast = c_parser.CParser().parse(SOURCE)
+        self.assertEqual(fused_code(ast), block_visitor_code(ast))
+
+    def test_unsupported(self):
+        ast = c_parser.CParser().parse("int f(){ a = (int) b; }")
+        self.assertRaises(ctoc.ErrorUnsupportedConstruct, lowering.fused_functional_code, ast)
@@ -1,7 +1,8 @@
 import unittest
-from pycparser import parse_file
+from pycparser import parse_file, c_parser
 import minic.c_ast_to_minic as ctoc
 import minic.minic_ast as mast
+import functions
 
 
 class TestVisitor(mast.NodeVisitor):
@@ -18,6 +19,15 @@ class TestVisitor(mast.NodeVisitor):
         self.generic_visit(forl)
 
 
+class IDVisitor(mast.NodeVisitor):
+
+    def __init__(self):
+        self.names = []
+
+    def visit_ID(self, node):
+        self.names.append(node.name)
+
+
 class TestNodeVisit(unittest.TestCase):
     def test_visit(self):
         ast = ctoc.transform(parse_file('./c_files/minic.c'))
@@ -25,3 +35,86 @@ class TestNodeVisit(unittest.TestCase):
         vs.visit(ast)
         self.assertEqual(vs.assignment_counter, 5)
         self.assertEqual(vs.forl_counter, 1)
+
+    def test_visit_long_expression(self):
+        terms = " + ".join("a%d" % i for i in range(5000))
+        ast = ctoc.transform(c_parser.CParser().parse("int f(){ s = %s; }" % terms))
+        vs = IDVisitor()
+        vs.visit(ast)
+        self.assertEqual(vs.names, ["s"] + ["a%d" % i for i in range(5000)])
+
+    def test_visit_array_parameter(self):
+        # the dimension of an ArrayDecl is a pycparser node
+        ast = ctoc.transform(c_parser.CParser().parse("int f(int a[10]){ b = a[1]; }"))
+        vs = IDVisitor()
+        vs.visit(ast)
+        self.assertEqual(vs.names, ["b", "a"])
+
+    def test_collect_facts(self):
+        ast = ctoc.transform(c_parser.CParser().parse("""
+            int f(){ int s = 0; if (s < n) { s = s + a[0]; if (t) { u = s; } else { v = u * 2; } }
+                     for (i = 0; i < n; i++) { s += i; while (s) { s = s - 1; } } w = s; }"""))
+        block = ast.ext[0].body
+        facts = functions.collect_facts(block)
+
+        def same_facts(nvs, node):
+            expected = functions.NodeVisitor()
+            expected.visit(node)
+            self.assertEqual(nvs.order, expected.order)
+            self.assertEqual(nvs.other, expected.other)
+            self.assertEqual(nvs.assignment, expected.assignment)
+            self.assertEqual(nvs.decl, expected.decl)
+            self.assertEqual(list(nvs.assignment), list(expected.assignment))
+            self.assertEqual(nvs.bits(expected.symbols), expected.bits(expected.symbols))
+
+        same_facts(facts[block], block)
+        if_stmt, loop = block.block_items[1], block.block_items[2]
+        same_facts(facts[if_stmt.iftrue], if_stmt.iftrue)
+        same_facts(facts[if_stmt.iftrue.block_items[1].iffalse], if_stmt.iftrue.block_items[1].iffalse)
+        same_facts(facts[loop], loop)
+        same_facts(facts[loop.stmt], loop.stmt)
+        # the statements share the order of the block
+        self.assertIs(facts[loop.stmt].block_nvs, facts[block])
+        self.assertEqual((facts[loop].start, facts[loop].end), (facts[loop.stmt].start, facts[loop.stmt].end))
+
+    def test_variable_reductions(self):
+        vs = functions.NodeVisitor()
+        for lefthand, dependencies in [('a', []), ('b', ['a']), ('if', 'b'), ('c', ['d']), ('d', []), ('e', ['c'])]:
+            if lefthand == 'if':
+                vs.order.add_read(dependencies)
+            else:
+                vs.order.add_write(lefthand, dependencies)
+        self.assertEqual(list(vs.order), [['a', []], ['b', ['a']], ['if', 'b'], ['c', ['d']], ['d', []], ['e', ['c']]])
+        never_used = functions.get_variable_reductions(vs)
+        var_constants = functions.get_variable_constants(vs)
+        self.assertEqual(never_used, set([4, 5]))
+        self.assertEqual(var_constants, set([0, 4]))
+        self.assertEqual(functions.remove_if_statements(vs.order, never_used, var_constants),
+                         (set([3, 4]), set([0, 3])))
+
+        # the dependencies are matched by name: sum is used by the later entries
+        vs = functions.NodeVisitor()
+        for lefthand, dependencies in [('sum', []), ('sum', ['sum', 'a']), ('msq', ['sum', 'msq'])]:
+            vs.order.add_write(lefthand, dependencies)
+        self.assertEqual(functions.get_variable_reductions(vs), set([2]))
+        self.assertEqual(functions.def_use_sets(vs.order), (set([0, 1]), set()))
+
+    def test_vars_and_written_order(self):
+        ast = ctoc.transform(c_parser.CParser().parse(
+            "int f(){ s = b + a; if (t) { u = s; } c[i] = c[j] + s; }"))
+        vs = functions.NodeVisitor()
+        vs.visit(ast.ext[0].body)
+        variables, written = functions.get_vars_and_written(vs)
+        # arrays are interned by name, written or read
+        self.assertEqual(variables, ["s", "b", "a", "t", "u", "c", "j"])
+        self.assertEqual(written, ["s", "u", "c"])
+
+        ast = ctoc.transform(c_parser.CParser().parse("int f(){ c[i] = 0; c[j][k] = d[i][j]; }"))
+        vs = functions.NodeVisitor()
+        vs.visit(ast.ext[0].body)
+        self.assertEqual(list(vs.assignment), ["c"])
+        self.assertEqual(vs.assignment["c"]["ArrayRef"], [[], ["d"]])
+
+        symbols = functions.SymbolTable()
+        bits = symbols.bitset(["x", "y", "x"]) | symbols.bit("z")
+        self.assertEqual(symbols.names(bits & ~symbols.bit("y")), ["x", "z"])
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+import minic.minic_ast as mast
+from minic import parse_cache
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = parse_cache.ParseCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_then_hit(self):
+        converted = parse_cache.parse_minic('./c_files/minic.c', cache=self.cache)
+        self.assertTrue(isinstance(converted, mast.FileAST))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        key = parse_cache.source_key(parse_cache.read_source('./c_files/minic.c'))
+        cached = self.cache.get(key)
+        self.assertTrue(isinstance(cached, mast.FileAST))
+        self.assertEqual(cached.ext[0].decl.name, 'mss')
+
+        again = parse_cache.parse_minic('./c_files/minic.c', cache=self.cache)
+        self.assertEqual(len(again.ext[0].body.block_items), 5)
+
+    def test_evicts_least_recently_used(self):
+        ast = parse_cache.parse_minic('./c_files/minic.c', cache=False)
+        self.cache.put('old', ast)
+        size = os.path.getsize(self.cache.path('old'))
+        os.utime(self.cache.path('old'), (0, 0))
+
+        self.cache.max_bytes = size + size // 2
+        self.cache.put('new', ast)
+        self.assertEqual(self.cache.get('old'), None)
+        self.assertNotEqual(self.cache.get('new'), None)
+
+    def test_batch(self):
+        files = ['./c_files/minic.c', './reduction_tests/test1', './c_files/minic.c']
+        converted = parse_cache.parse_minic_batch(files, use_cpp=True, cache=self.cache)
+        self.assertEqual(len(converted), 3)
+        self.assertEqual(converted[0].ext[0].decl.name, 'mss')
+        self.assertEqual(converted[2].ext[1].decl.name, 'main')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_size_is_kept_between_puts(self):
+        ast = parse_cache.parse_minic('./c_files/minic.c', cache=False)
+        listed = []
+        listdir = os.listdir
+        parse_cache.os.listdir = lambda path: listed.append(path) or listdir(path)
+        try:
+            for i in range(10):
+                self.cache.put('entry%d' % i, ast)
+        finally:
+            parse_cache.os.listdir = listdir
+        # once on the first put, never again while under max_bytes
+        self.assertEqual(len(listed), 1)
+        self.assertEqual(self.cache.size, sum(
+            os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)))
+
+    def test_failed_write_is_removed(self):
+        ast = parse_cache.parse_minic('./c_files/minic.c', cache=False)
+        # an entry cannot replace a directory
+        os.mkdir(self.cache.path('key'))
+        self.assertRaises(OSError, self.cache.put, 'key', ast)
+        self.assertEqual(os.listdir(self.directory), ['key.ast'])
@@ -0,0 +1,22 @@
+import unittest
+from pycparser import c_parser
+from minic.preprocess import needs_cpp, minimal_preprocess
+
+
+class TestMinimalPreprocess(unittest.TestCase):
+    def test_comments_and_lines(self):
+        text = "int f(){\n/* a\n comment */ a = 1; // end\nb = '/';\nc = \"//\" \\\n;\n}\n"
+        processed = minimal_preprocess(text)
+        self.assertEqual(processed.count('\n'), text.count('\n'))
+        self.assertFalse('comment' in processed)
+        self.assertFalse('end' in processed)
+        self.assertTrue('"//"' in processed)
+
+        ast = c_parser.CParser().parse(processed)
+        items = ast.ext[0].body.block_items
+        self.assertEqual(len(items), 3)
+        self.assertEqual(items[1].coord.line, 4)
+
+    def test_needs_cpp(self):
+        self.assertFalse(needs_cpp("int f(){ a = b; }"))
+        self.assertTrue(needs_cpp("  #define N 10\nint f(){ a = N; }"))
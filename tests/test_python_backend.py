@@ -0,0 +1,93 @@
+import random
+import unittest
+import python_backend
+from helpers import function_of
+
+
+class TestPythonBackend(unittest.TestCase):
+    def test_reductions(self):
+        function = function_of(open('../final_inputs/p3_input4').read())
+        self.assertEqual(python_backend.parameters(function), ['sum', 'i', 'a', 'mps', 'mts', 'mss'])
+        kernel = python_backend.python_function(function)
+
+        generator = random.Random(4)
+        for _ in range(20):
+            a = [generator.randint(-10, 10) for _ in range(12)]
+            state = expected = (0, 0, 0, 0)
+            for i in range(len(a)):
+                total, mps, mts, mss = state
+                state = kernel(total, i, a, mps, mts, mss)
+
+                total, mps, mts, mss = expected
+                total += a[i]
+                mps = max(mps, total)
+                mts = max(mts, mts + a[i])
+                expected = (total, mps, mts, max(mss, mts))
+            self.assertEqual(state, expected)
+
+    def test_loops_and_arrays(self):
+        function = function_of("""
+        int f() {
+            s = 0;
+            for (i = 0; i < n; i++) { s = s + a[i]; b[i] = s; }
+            while (k < 3) k = k + 1;
+            x = c ? 1 : -2;
+        }
+        """)
+        parameters = python_backend.parameters(function)
+        # n and c are read and never written
+        self.assertEqual(parameters[-2:], ['n', 'c'])
+
+        values = dict(s=0, i=0, a=[1, 2, 3], b=[0, 0, 0], k=0, x=0, n=3, c=0)
+        result = python_backend.python_function(function)(*[values[name] for name in parameters])
+        self.assertEqual(result, (6, [1, 3, 6], -2))
+        self.assertEqual(values['b'], [1, 3, 6])
+
+    def test_c_arithmetic(self):
+        function = function_of("""
+        int f() { x = -7 / 2; y = -7 % 2; z = 2 && 3; w = !z; q = 7.0 / 2; c = 'a'; }
+        """)
+        parameters = python_backend.parameters(function)
+        result = python_backend.python_function(function)(*[0] * len(parameters))
+        self.assertEqual(result, (-3, -1, 1, 0, 3.5, 97))
+
+    def test_code_cache(self):
+        source = "int f() { if (m < s) { m = s; } t = m + 1; }"
+        first, second = function_of(source), function_of(source)
+        self.assertIs(python_backend.code_object(first), python_backend.code_object(second))
+        self.assertIs(python_backend.python_function(first), python_backend.python_function(first))
+
+        doubled = python_backend.python_function(function_of("int f() { x = twice(y); }"), {'twice': lambda v: 2 * v})
+        self.assertEqual(doubled(0, 4), (8,))
+
+    def test_code_cache_is_bounded(self):
+        saved = python_backend.MAX_CODE_OBJECTS
+        python_backend.MAX_CODE_OBJECTS = 2
+        try:
+            functions = [function_of("int f() { x = y + %d; }" % n) for n in range(3)]
+            first = python_backend.code_object(functions[0])
+            python_backend.code_object(functions[1])
+            # the first one is the most recently used
+            self.assertIs(python_backend.code_object(functions[0]), first)
+            python_backend.code_object(functions[2])
+            self.assertTrue(len(python_backend._code_objects) <= 2)
+            self.assertIs(python_backend.code_object(functions[0]), first)
+        finally:
+            python_backend.MAX_CODE_OBJECTS = saved
+
+    def test_unsupported(self):
+        function = function_of("int f() { x = sizeof(int); }")
+        self.assertRaises(TypeError, python_backend.python_module, function)
+
+    def test_corpus(self):
+        # the comma operator in a subscript
+        function = function_of(open('../final_inputs/p3_input6').read())
+        kernel = python_backend.python_function(function)
+        self.assertEqual(python_backend.parameters(function)[-1], 'n')
+        # b[i - p, j - p] reads b[j - p]
+        result = kernel([[0, 1], [1, 1]], 0, 0, [0, 0], 0, [1, 0], 0, 2)
+        self.assertEqual(result, ([0, 1], 0, 1))
+
+        # a declaration without an initializer
+        function = function_of("int f() { int t; t = q + 1; }")
+        self.assertEqual(python_backend.python_function(function)(0, 4), (5,))
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from pycparser import parse_file
+import minic.c_ast_to_minic as ctoc
+import minic.minic_ast as mast
+import func_ast as fast
+import convertc2f
+import serialization
+
+
+def blocks_of(filename):
+    vs = convertc2f.BlockVisitor(cache=False)
+    vs.visit(ctoc.transform(parse_file(filename)))
+    return vs.blocks
+
+
+class TestSerialization(unittest.TestCase):
+    def test_round_trip(self):
+        filenames = ['./c_files/minic.c', '../final_inputs/p3_input6']
+        for filename in filenames + ['./reduction_tests/test%d' % i for i in range(1, 5)]:
+            blocks = blocks_of(filename)
+            loaded = serialization.loads(serialization.dumps([block.function for block in blocks]))
+            self.assertEqual(len(loaded), len(blocks))
+            for block, function in zip(blocks, loaded):
+                self.assertTrue(isinstance(function, fast.functionDef))
+                copy = convertc2f.FunctionBlock(function, block.ctx)
+                for opt_on in (False, True):
+                    self.assertEqual(copy.render(opt_on), block.render(opt_on), filename)
+
+    def test_array_write(self):
+        # arrays written through a subscript are arguments, even when they
+        # are named by their minic ID
+        function, = [block.function for block in blocks_of('../final_inputs/p3_input6')]
+        self.assertTrue('c' in function.output_args)
+        function.output_args = [mast.ID('c')] + function.output_args[1:]
+        loaded, = serialization.loads(serialization.dumps([function]))
+        self.assertEqual(str(loaded), str(function))
+        self.assertEqual(loaded.output_args[0], 'c')
+
+    def test_mmap(self):
+        functions = [block.function for block in blocks_of('./c_files/minic.c')]
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                serialization.dump(functions, f)
+            loaded = serialization.load_file(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual([str(function) for function in loaded], [str(function) for function in functions])
+
+    def test_flat_arrays(self):
+        i = fast.ID('i')
+        let = fast.Let(i, fast.BinaryOp('+', i, fast.Constant('1')))
+        reader = serialization.Reader(serialization.dumps([let]))
+        # i, 1, i + 1, the let; i is written once
+        self.assertEqual(reader.node_count, 4)
+        self.assertEqual([serialization.KINDS[reader.kind(n)] for n in range(4)],
+                         [fast.ID, fast.Constant, fast.BinaryOp, fast.Let])
+        self.assertEqual(reader.operands(0), (0 << 2 | serialization.STRING,))
+
+        copy, = reader.roots()
+        self.assertIs(copy.lvalue, copy.rvalue.left)
+        self.assertEqual(str(copy), "let i = i + 1")
+
+    def test_errors(self):
+        data = serialization.dumps([fast.ID('x')])
+        self.assertRaises(ValueError, serialization.loads, b'XXXX' + data[4:])
+        self.assertRaises(ValueError, serialization.loads, data[:4] + b'\x63\x00' + data[6:])
+        self.assertRaises(ValueError, serialization.loads, data[:-1])
+        self.assertRaises(TypeError, serialization.dumps, [fast.Constant(1.5)])
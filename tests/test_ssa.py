@@ -0,0 +1,41 @@
+import unittest
+from pycparser import c_parser
+import minic.c_ast_to_minic as ctoc
+from ssa import SSAFunction
+
+
+def body_of(source):
+    return ctoc.transform(c_parser.CParser().parse(source)).ext[0].body
+
+
+class TestSSA(unittest.TestCase):
+    def test_if_join(self):
+        body = body_of("int f() { x = 1; if (c) { x = 2; } else { z = x; } y = x; }")
+        first, branch, last = body.block_items
+        ssa = SSAFunction(body)
+        self.assertEqual(ssa.join_variables(branch), ['x', 'z'])
+
+        join = ssa.joins[branch]
+        phi = join.phis['x']
+        # x is 2 from the then branch, 1 from the else branch
+        self.assertEqual(sorted(phi.operands), [1, 2])
+        self.assertEqual(join.instructions[0].use_versions['x'], phi.version)
+        # z is not defined before the if
+        self.assertEqual(sorted(join.phis['z'].operands), [0, 1])
+
+    def test_loop_header(self):
+        body = body_of("""int f() {
+            for (i = 0; i < n; i++) { int t = a[i]; s = s + t; }
+            while (k) { for (j = 0; j < k; j++) { k = k - j; } }
+        }""")
+        loop, outer = body.block_items
+        inner = outer.stmt.block_items[0]
+        ssa = SSAFunction(body)
+        # the counters are passed by the loops themselves
+        self.assertEqual(ssa.loop_variables(loop), ['t', 's'])
+        self.assertEqual(ssa.loop_variables(outer), ['k'])
+        self.assertEqual(ssa.loop_variables(inner), ['k'])
+
+        header = ssa.headers[loop]
+        self.assertIs(header.idom, ssa.entry)
+        self.assertIn(header, header.frontier)